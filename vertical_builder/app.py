@@ -1,12 +1,9 @@
 from __future__ import annotations
 
-import base64
 import json
 import logging
 import sys
-from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any
 
 from flask import Flask, Response, request
 
@@ -14,8 +11,14 @@ from flask import Flask, Response, request
 if __package__ is None or __package__ == "":
     sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-from vertical_builder.builder_service import handle_build_job
-from vertical_builder.config import REQUIRED_PAYLOAD_FIELDS, load_runtime_config
+from vertical_builder.builder_service import handle_build_job, handle_superseded_job
+from vertical_builder.client_service import start_client_warmup
+from vertical_builder.config import load_runtime_config
+from vertical_builder.message_service import decode_pubsub_envelope, validate_payload
+from vertical_builder.metrics_service import render_prometheus
+from vertical_builder.pipeline_service import phase_stats
+from vertical_builder.scheduler_service import BuildScheduler
+from vertical_builder.workspace_service import start_workspace_sweeper
 
 
 logging.basicConfig(level=logging.INFO)
@@ -23,43 +26,20 @@ LOGGER = logging.getLogger("vertical_builder")
 
 app = Flask(__name__)
 RUNTIME = load_runtime_config()
-EXECUTOR = ThreadPoolExecutor(max_workers=1)
-
-
-def _decode_pubsub_envelope(envelope: dict[str, Any]) -> dict[str, Any]:
-    if "message" not in envelope or "data" not in envelope["message"]:
-        raise ValueError("Missing Pub/Sub message.data")
-    encoded_data = envelope["message"]["data"]
-    decoded = base64.b64decode(encoded_data).decode("utf-8")
-    payload = json.loads(decoded)
-    if not isinstance(payload, dict):
-        raise ValueError("Payload must decode to an object")
-    return payload
-
-
-def _validate_payload(payload: dict[str, Any]) -> None:
-    missing = [field for field in REQUIRED_PAYLOAD_FIELDS if field not in payload]
-    if missing:
-        raise ValueError(f"Missing required fields: {', '.join(missing)}")
-    build_target = payload.get("buildTarget")
-    if not isinstance(build_target, dict):
-        raise ValueError("buildTarget must be an object")
-    hosting_project = build_target.get("hostingProject")
-    site = build_target.get("site")
-    allow_env_override = bool(build_target.get("allowEnvOverride", False))
-    if payload["env"] != RUNTIME.env and not (site == "local" and allow_env_override):
-        raise ValueError(
-            f"Environment mismatch: payload env={payload['env']} runtime env={RUNTIME.env}"
-        )
-    if not hosting_project:
-        raise ValueError("buildTarget must include hostingProject")
-    if not site:
-        raise ValueError("buildTarget must include site")
-    if site != "local" and hosting_project != RUNTIME.firebase_project:
-        raise ValueError(
-            "buildTarget.hostingProject must match runtime FIREBASE_PROJECT "
-            "for non-local deploys"
-        )
+SCHEDULER = BuildScheduler(
+    max_workers=RUNTIME.max_concurrent_builds,
+    on_superseded=handle_superseded_job,
+)
+start_workspace_sweeper()
+
+
+@app.before_request
+def warm_up_clients() -> None:
+    # Started by the first request of the serving process rather than at
+    # import, so the Google libraries never load during cold start. The
+    # clients load off the request path; the first push is still accepted
+    # immediately and its build waits for the import to finish.
+    start_client_warmup()
 
 
 @app.post("/modules/vertical-builder")
@@ -70,17 +50,39 @@ def vertical_builder_handler() -> tuple[Response, int]:
         envelope = request.get_json(force=True, silent=False)
         if not isinstance(envelope, dict):
             raise ValueError("Request body must be a JSON object")
-        payload = _decode_pubsub_envelope(envelope)
-        _validate_payload(payload)
+        payload = decode_pubsub_envelope(envelope)
+        validate_payload(payload, RUNTIME)
     except Exception as exc:  # pylint: disable=broad-except
         LOGGER.error("Invalid Pub/Sub request: %s", exc)
         response = {"status": "invalid", "error": str(exc)}
         return Response(json.dumps(response), mimetype="application/json"), 400
 
-    EXECUTOR.submit(handle_build_job, payload, RUNTIME)
+    SCHEDULER.submit(payload, handle_build_job, RUNTIME)
+    LOGGER.info(
+        "Accepted jobId=%s queueDepth=%d activeBuilds=%d",
+        payload["jobId"],
+        SCHEDULER.queue_depth(),
+        len(SCHEDULER.active_builds()),
+    )
     response = {"status": "accepted", "jobId": payload["jobId"]}
     return Response(json.dumps(response), mimetype="application/json"), 200
 
 
+@app.get("/metrics")
+def metrics_handler() -> tuple[Response, int]:
+    stats = SCHEDULER.stats()
+    gauges = {
+        "vertical_builder_queue_depth": stats["queueDepth"],
+        "vertical_builder_builds_in_flight": len(stats["activeBuilds"]),
+        "vertical_builder_max_concurrent_builds": stats["maxWorkers"],
+    }
+    for phase, slots in phase_stats().items():
+        gauges[f"vertical_builder_{phase}_slots"] = slots["slots"]
+        gauges[f"vertical_builder_{phase}_busy"] = slots["busy"]
+        gauges[f"vertical_builder_{phase}_waiting"] = slots["waiting"]
+    body = render_prometheus(gauges)
+    return Response(body, mimetype="text/plain; version=0.0.4"), 200
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8081)
@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tarfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from google.cloud import storage
+
+
+LOGGER = logging.getLogger("vertical_builder")
+ARTIFACT_STORE = os.environ.get("VERTICAL_ARTIFACT_STORE", "off")
+ARTIFACT_ROOT = Path(
+    os.environ.get(
+        "VERTICAL_ARTIFACT_ROOT",
+        str(Path(__file__).resolve().parent / "artifacts"),
+    )
+)
+ARTIFACT_COMPRESS_LEVEL = int(os.environ.get("VERTICAL_ARTIFACT_COMPRESS_LEVEL", "6"))
+# Stored renderings kept per vertical; 0 keeps all of them.
+ARTIFACT_KEEP = int(os.environ.get("VERTICAL_ARTIFACT_KEEP", "10"))
+ARTIFACT_STORES = ("bucket", "local", "off")
+COPY_CHUNK_BYTES = 1024 * 1024
+
+_THEME_LOCK = threading.Lock()
+_THEME_VERSIONS: dict[tuple[Path, str, Path], str] = {}
+
+
+def artifacts_enabled() -> bool:
+    if ARTIFACT_STORE not in ARTIFACT_STORES:
+        raise RuntimeError(
+            f"VERTICAL_ARTIFACT_STORE must be one of {', '.join(ARTIFACT_STORES)}"
+        )
+    return ARTIFACT_STORE != "off"
+
+
+def theme_version(themes_root: Path, template_key: str, base_config_path: Path) -> str:
+    # The theme and base config ship with the image, so they are hashed once
+    # per process.
+    key = (themes_root, template_key, base_config_path)
+    with _THEME_LOCK:
+        cached = _THEME_VERSIONS.get(key)
+    if cached is not None:
+        return cached
+    digest = hashlib.sha256()
+    theme_root = themes_root / template_key
+    for path in sorted(p for p in theme_root.rglob("*") if p.is_file()):
+        digest.update(path.relative_to(theme_root).as_posix().encode("utf-8") + b"\0")
+        digest.update(path.read_bytes())
+    digest.update(b"\0config.yaml\0")
+    digest.update(base_config_path.read_bytes())
+    version = digest.hexdigest()[:16]
+    with _THEME_LOCK:
+        _THEME_VERSIONS[key] = version
+    return version
+
+
+def _artifact_prefix(payload: dict[str, Any]) -> str:
+    return f"orgs/{payload['orgId']}/verticals/{payload['verticalKey']}/artifacts"
+
+
+def _archive_name(payload: dict[str, Any], tree_hash: str) -> str:
+    # Content-addressed: exports that render to the same public/ share one archive.
+    return f"{_artifact_prefix(payload)}/public/{tree_hash}.tar.gz"
+
+
+def _pointer_prefix(payload: dict[str, Any], export_id: str) -> str:
+    return f"{_artifact_prefix(payload)}/exports/{export_id}/"
+
+
+def _artifact_uri(bucket_name: str, name: str) -> str:
+    if ARTIFACT_STORE == "local":
+        return str(ARTIFACT_ROOT / name)
+    return f"gs://{bucket_name}/{name}"
+
+
+def _exists(storage_client: storage.Client, bucket_name: str, name: str) -> bool:
+    if ARTIFACT_STORE == "local":
+        return (ARTIFACT_ROOT / name).exists()
+    return storage_client.bucket(bucket_name).get_blob(name) is not None
+
+
+def _write_local(name: str, source: Path | None = None, data: bytes | None = None) -> None:
+    target = ARTIFACT_ROOT / name
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = target.with_name(f".{target.name}.{uuid.uuid4().hex}")
+    if source is not None:
+        shutil.copyfile(source, staging)
+    else:
+        staging.write_bytes(data or b"")
+    staging.replace(target)
+
+
+def _upload_file(
+    storage_client: storage.Client, bucket_name: str, name: str, source: Path
+) -> None:
+    if ARTIFACT_STORE == "local":
+        _write_local(name, source=source)
+        return
+    storage_client.bucket(bucket_name).blob(name).upload_from_filename(
+        str(source), content_type="application/gzip"
+    )
+
+
+def _upload_json(
+    storage_client: storage.Client, bucket_name: str, name: str, data: dict[str, Any]
+) -> None:
+    raw = json.dumps(data, sort_keys=True).encode("utf-8")
+    if ARTIFACT_STORE == "local":
+        _write_local(name, data=raw)
+        return
+    storage_client.bucket(bucket_name).blob(name).upload_from_string(
+        raw, content_type="application/json"
+    )
+
+
+def _download_json(
+    storage_client: storage.Client, bucket_name: str, name: str
+) -> dict[str, Any] | None:
+    if ARTIFACT_STORE == "local":
+        try:
+            raw = (ARTIFACT_ROOT / name).read_bytes()
+        except OSError:
+            return None
+    else:
+        blob = storage_client.bucket(bucket_name).get_blob(name)
+        if blob is None:
+            return None
+        raw = blob.download_as_bytes()
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _list_names(storage_client: storage.Client, bucket_name: str, prefix: str) -> list[str]:
+    if ARTIFACT_STORE == "local":
+        root = ARTIFACT_ROOT / prefix
+        if not root.is_dir():
+            return []
+        return [
+            f"{prefix}{path.relative_to(root).as_posix()}"
+            for path in root.rglob("*")
+            if path.is_file() and not path.name.startswith(".")
+        ]
+    return [
+        blob.name
+        for blob in storage_client.list_blobs(
+            storage_client.bucket(bucket_name), prefix=prefix
+        )
+    ]
+
+
+def _delete(storage_client: storage.Client, bucket_name: str, name: str) -> None:
+    if ARTIFACT_STORE == "local":
+        target = ARTIFACT_ROOT / name
+        target.unlink(missing_ok=True)
+        try:
+            target.parent.rmdir()
+        except OSError:
+            pass
+        return
+    storage_client.bucket(bucket_name).blob(name).delete()
+
+
+def _pack_public(public_root: Path, archive_path: Path) -> None:
+    with tarfile.open(
+        archive_path, "w:gz", compresslevel=ARTIFACT_COMPRESS_LEVEL
+    ) as archive:
+        for path in sorted(public_root.rglob("*")):
+            if path.is_file():
+                archive.add(
+                    path,
+                    arcname=path.relative_to(public_root).as_posix(),
+                    recursive=False,
+                )
+
+
+def store_public_artifact(
+    storage_client: storage.Client,
+    bucket_name: str,
+    payload: dict[str, Any],
+    public_root: Path,
+    tree_hash: str,
+    file_count: int,
+    theme: str,
+    scratch_dir: Path,
+) -> dict[str, Any]:
+    started = time.monotonic()
+    name = _archive_name(payload, tree_hash)
+    size = 0
+    uploaded = False
+    if not _exists(storage_client, bucket_name, name):
+        archive_path = scratch_dir / f"public-{uuid.uuid4().hex}.tar.gz"
+        try:
+            _pack_public(public_root, archive_path)
+            size = archive_path.stat().st_size
+            _upload_file(storage_client, bucket_name, name, archive_path)
+        finally:
+            archive_path.unlink(missing_ok=True)
+        uploaded = True
+    pointer = {
+        "exportId": payload["exportId"],
+        "themeVersion": theme,
+        "treeHash": tree_hash,
+        "archive": name,
+        "fileCount": file_count,
+        "jobId": payload["jobId"],
+        "storedAt": datetime.now(timezone.utc).isoformat(),
+    }
+    _upload_json(
+        storage_client,
+        bucket_name,
+        f"{_pointer_prefix(payload, payload['exportId'])}{theme}.json",
+        pointer,
+    )
+    pruned = prune_public_artifacts(storage_client, bucket_name, payload)
+    LOGGER.info(
+        "Artifact stored exportId=%s treeHash=%s uploaded=%s bytes=%d pruned=%d seconds=%.2f",
+        payload["exportId"],
+        tree_hash,
+        uploaded,
+        size,
+        pruned,
+        time.monotonic() - started,
+    )
+    return {
+        "treeHash": tree_hash,
+        "themeVersion": theme,
+        "uri": _artifact_uri(bucket_name, name),
+        "uploaded": uploaded,
+        "bytes": size,
+        "pruned": pruned,
+    }
+
+
+def prune_public_artifacts(
+    storage_client: storage.Client, bucket_name: str, payload: dict[str, Any]
+) -> int:
+    # Keeps the ARTIFACT_KEEP newest pointers of the vertical and the archives
+    # they name. Builds of one vertical hold its lock, so nothing stores or
+    # fetches these archives meanwhile.
+    if ARTIFACT_KEEP <= 0:
+        return 0
+    prefix = _artifact_prefix(payload)
+    pointers = []
+    for name in _list_names(storage_client, bucket_name, f"{prefix}/exports/"):
+        if name.endswith(".json"):
+            pointer = _download_json(storage_client, bucket_name, name) or {}
+            pointers.append((str(pointer.get("storedAt", "")), name, pointer.get("archive")))
+    if len(pointers) <= ARTIFACT_KEEP:
+        return 0
+    pointers.sort(reverse=True)
+    kept = {archive for _stored_at, _name, archive in pointers[:ARTIFACT_KEEP]}
+    stale = [name for _stored_at, name, _archive in pointers[ARTIFACT_KEEP:]]
+    stale.extend(
+        name
+        for name in _list_names(storage_client, bucket_name, f"{prefix}/public/")
+        if name not in kept
+    )
+    for name in stale:
+        _delete(storage_client, bucket_name, name)
+    return len(stale)
+
+
+def find_public_artifact(
+    storage_client: storage.Client,
+    bucket_name: str,
+    payload: dict[str, Any],
+    theme: str,
+) -> dict[str, Any] | None:
+    # The export as rendered with the current theme, else the newest stored
+    # rendering of it: a rollback restores what was live, old theme included.
+    prefix = _pointer_prefix(payload, payload["exportId"])
+    pointer = _download_json(storage_client, bucket_name, f"{prefix}{theme}.json")
+    if pointer is not None:
+        return pointer
+    candidates = []
+    for name in _list_names(storage_client, bucket_name, prefix):
+        if name.endswith(".json"):
+            candidate = _download_json(storage_client, bucket_name, name)
+            if candidate is not None and candidate.get("archive"):
+                candidates.append(candidate)
+    if not candidates:
+        return None
+    return max(candidates, key=lambda candidate: str(candidate.get("storedAt", "")))
+
+
+def _member_target(destination: Path, member: tarfile.TarInfo) -> Path:
+    if not member.isfile():
+        raise RuntimeError(f"Artifact member type not allowed: {member.name}")
+    rel = Path(member.name)
+    target = (destination / rel).resolve()
+    if rel.is_absolute() or ".." in rel.parts or not target.is_relative_to(destination):
+        raise RuntimeError(f"Artifact member escapes public/: {member.name}")
+    return target
+
+
+def fetch_public_artifact(
+    storage_client: storage.Client,
+    bucket_name: str,
+    pointer: dict[str, Any],
+    public_root: Path,
+) -> dict[str, Any]:
+    started = time.monotonic()
+    name = pointer["archive"]
+    if ARTIFACT_STORE == "local":
+        raw = (ARTIFACT_ROOT / name).open("rb")
+    else:
+        blob = storage_client.bucket(bucket_name).get_blob(name)
+        if blob is None:
+            raise RuntimeError(f"Artifact archive missing: {_artifact_uri(bucket_name, name)}")
+        raw = blob.open("rb")
+    public_root.mkdir(parents=True, exist_ok=True)
+    destination = public_root.resolve()
+    files = 0
+    total_bytes = 0
+    with raw, tarfile.open(fileobj=raw, mode="r|gz") as archive:
+        for member in archive:
+            target = _member_target(destination, member)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with target.open("wb") as handle:
+                shutil.copyfileobj(archive.extractfile(member), handle, COPY_CHUNK_BYTES)
+            files += 1
+            total_bytes += member.size
+    LOGGER.info(
+        "Artifact restored treeHash=%s files=%d bytes=%d seconds=%.2f",
+        pointer.get("treeHash"),
+        files,
+        total_bytes,
+        time.monotonic() - started,
+    )
+    return {"files": files, "bytes": total_bytes}
@@ -0,0 +1,362 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import importlib.util
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+
+LOGGER = logging.getLogger("vertical_builder")
+ASSET_OPTIMIZE_ENABLED = os.environ.get("VERTICAL_ASSET_OPTIMIZE", "1") == "1"
+ASSET_CACHE_ROOT = Path(
+    os.environ.get(
+        "VERTICAL_ASSET_CACHE_ROOT",
+        str(Path(__file__).resolve().parent / "asset_cache"),
+    )
+)
+ASSET_CACHE_MAX_BYTES = int(
+    os.environ.get("VERTICAL_ASSET_CACHE_MAX_BYTES", str(2 * 1024**3))
+)
+ASSET_WORKERS = int(os.environ.get("VERTICAL_ASSET_WORKERS", str(os.cpu_count() or 1)))
+IMAGE_MAX_WIDTH = int(os.environ.get("VERTICAL_IMAGE_MAX_WIDTH", "1600"))
+IMAGE_QUALITY = int(os.environ.get("VERTICAL_IMAGE_QUALITY", "82"))
+ASSET_PRECOMPRESS = os.environ.get("VERTICAL_ASSET_PRECOMPRESS", "")
+PRECOMPRESS_MIN_BYTES = int(os.environ.get("VERTICAL_PRECOMPRESS_MIN_BYTES", "1024"))
+PRECOMPRESS_ENCODINGS = {"gzip": ".gz", "br": ".br"}
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+TEXT_SUFFIXES = (".css", ".js", ".svg", ".json", ".txt", ".xml", ".html")
+HASH_CHUNK_BYTES = 1024 * 1024
+# Bumped whenever the encoders change, so old cache entries stop matching.
+_ENCODER_VERSION = "2"
+_KEEP_MARKER = ".keep"
+
+_POOL_LOCK = threading.Lock()
+_POOL: ProcessPoolExecutor | None = None
+_DIGEST_LOCK = threading.Lock()
+# (device, inode, size, mtime_ns) -> sha256 of theme files, which ship with the
+# image; workspaces link them, so the inode is shared across builds.
+_THEME_DIGESTS: dict[tuple[int, int, int, int], str] = {}
+
+
+def _precompress_encodings() -> tuple[str, ...]:
+    encodings = tuple(name.strip() for name in ASSET_PRECOMPRESS.split(",") if name.strip())
+    for name in encodings:
+        if name not in PRECOMPRESS_ENCODINGS:
+            raise RuntimeError(
+                "VERTICAL_ASSET_PRECOMPRESS entries must be one of "
+                f"{', '.join(PRECOMPRESS_ENCODINGS)}"
+            )
+    if "br" in encodings and importlib.util.find_spec("brotli") is None:
+        raise RuntimeError("VERTICAL_ASSET_PRECOMPRESS=br needs the optional brotli package")
+    return encodings
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _POOL  # pylint: disable=global-statement
+    with _POOL_LOCK:
+        if _POOL is None:
+            # spawn, not fork: the parent runs request and scheduler threads.
+            _POOL = ProcessPoolExecutor(
+                max_workers=ASSET_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _POOL
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _theme_digest(path: Path) -> str:
+    stat = path.stat()
+    key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _DIGEST_LOCK:
+        cached = _THEME_DIGESTS.get(key)
+    if cached is None:
+        cached = _file_digest(path)
+        with _DIGEST_LOCK:
+            _THEME_DIGESTS[key] = cached
+    return cached
+
+
+def _cache_key(digest: str, settings: str, suffix: str) -> str:
+    # The suffix is part of the key: the same bytes under another extension
+    # are a different asset for Hugo and the browser.
+    return hashlib.sha256(f"{digest}\0{settings}\0{suffix}".encode("utf-8")).hexdigest()
+
+
+def _cache_path(key: str, suffix: str) -> Path:
+    return ASSET_CACHE_ROOT / key[:2] / f"{key}{suffix}"
+
+
+def _write_cache(key: str, suffix: str, data: bytes) -> None:
+    target = _cache_path(key, suffix)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    staging = target.with_name(f".{target.name}.{uuid.uuid4().hex}")
+    staging.write_bytes(data)
+    staging.replace(target)
+
+
+def _to_rgb(image, icc_profile: bytes | None):
+    # A CMYK image goes through its own profile into sRGB; without a usable
+    # profile (or littleCMS) Pillow's plain conversion is the fallback.
+    if image.mode == "CMYK" and icc_profile:
+        from io import BytesIO
+
+        try:
+            from PIL import ImageCms
+
+            return ImageCms.profileToProfile(
+                image,
+                ImageCms.ImageCmsProfile(BytesIO(icc_profile)),
+                ImageCms.createProfile("sRGB"),
+                outputMode="RGB",
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            LOGGER.warning("CMYK profile not applied, converting plainly: %s", exc)
+    return image.convert("RGB")
+
+
+def _encode_image(source: Path, max_width: int, quality: int) -> bytes | None:
+    from io import BytesIO
+
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as opened:
+        image_format = opened.format
+        if image_format not in ("JPEG", "PNG") or getattr(opened, "is_animated", False):
+            return None
+        icc_profile = opened.info.get("icc_profile")
+        # EXIF is not carried over, so its orientation is applied to the pixels.
+        image = ImageOps.exif_transpose(opened)
+        if image.width > max_width:
+            image.thumbnail((max_width, image.height), Image.Resampling.LANCZOS)
+        output = BytesIO()
+        if image_format == "JPEG":
+            if image.mode not in ("RGB", "L"):
+                image = _to_rgb(image, icc_profile)
+                # The source profile describes the old mode; untagged
+                # output is read as sRGB.
+                icc_profile = None
+            image.save(
+                output,
+                "JPEG",
+                quality=quality,
+                optimize=True,
+                progressive=True,
+                icc_profile=icc_profile,
+            )
+        else:
+            image.save(output, "PNG", optimize=True, icc_profile=icc_profile)
+    return output.getvalue()
+
+
+def _process_asset(
+    source: str,
+    key: str,
+    kind: str,
+    encodings: tuple[str, ...],
+    max_width: int,
+    quality: int,
+) -> None:
+    # Runs in a pool worker; results only travel through the cache directory.
+    path = Path(source)
+    if kind == "image":
+        try:
+            encoded = _encode_image(path, max_width, quality)
+        except Exception as exc:  # pylint: disable=broad-except
+            # Pillow raises more than OSError/ValueError for hostile or broken
+            # files (DecompressionBombError, SyntaxError, ...); the original
+            # is served as uploaded.
+            LOGGER.warning(
+                "Image not optimized path=%s error=%s: %s", source, type(exc).__name__, exc
+            )
+            encoded = None
+        if encoded is None or len(encoded) >= path.stat().st_size:
+            _write_cache(key, _KEEP_MARKER, b"")
+        else:
+            _write_cache(key, path.suffix.lower(), encoded)
+        return
+    data = path.read_bytes()
+    for name in encodings:
+        if name == "gzip":
+            # mtime=0 keeps the output byte-identical, so public/ hashes are stable.
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        else:
+            import brotli
+
+            compressed = brotli.compress(data, quality=11)
+        _write_cache(key, PRECOMPRESS_ENCODINGS[name], compressed)
+
+
+def _cached_outputs(
+    key: str, kind: str, suffix: str, encodings: tuple[str, ...]
+) -> list[Path] | None:
+    if kind == "image":
+        for candidate in (_cache_path(key, suffix), _cache_path(key, _KEEP_MARKER)):
+            if candidate.exists():
+                return [candidate]
+        return None
+    outputs = [_cache_path(key, PRECOMPRESS_ENCODINGS[name]) for name in encodings]
+    return outputs if all(output.exists() for output in outputs) else None
+
+
+def _place(cached: Path, target: Path) -> None:
+    # Workspace files may be links into the snapshot cache or the theme.
+    target.unlink(missing_ok=True)
+    try:
+        os.link(cached, target)
+    except OSError:
+        shutil.copyfile(cached, target)
+
+
+def _asset_kind(path: Path, encodings: tuple[str, ...], pillow: bool) -> str | None:
+    suffix = path.suffix.lower()
+    if suffix in IMAGE_SUFFIXES:
+        return "image" if pillow else "skipped"
+    if (
+        suffix in TEXT_SUFFIXES
+        and encodings
+        and path.stat().st_size >= PRECOMPRESS_MIN_BYTES
+    ):
+        return "text"
+    return None
+
+
+def _static_files(workspace: Path) -> list[tuple[Path, str | None]]:
+    # (path, rel) pairs; rel is the snapshot inventory key for export files and
+    # None for theme files.
+    files: list[tuple[Path, str | None]] = []
+    roots = [(workspace / "static", True)] + [
+        (theme_static, False)
+        for theme_static in sorted((workspace / "themes").glob("*/static"))
+    ]
+    for root, from_snapshot in roots:
+        for path in sorted(root.rglob("*")):
+            if path.is_file() and not path.name.startswith("."):
+                rel = f"static/{path.relative_to(root).as_posix()}" if from_snapshot else None
+                files.append((path, rel))
+    return files
+
+
+def optimize_assets(
+    workspace: Path,
+    inventory: dict[str, dict[str, Any]],
+) -> dict[str, int] | None:
+    # Runs between assembly and Hugo: images in static/ are resized and
+    # re-encoded in place, text assets get .gz/.br siblings when
+    # VERTICAL_ASSET_PRECOMPRESS asks for them. Every result is cached under
+    # the source's sha256, so an image is encoded once per host, whichever org
+    # uploaded it.
+    if not ASSET_OPTIMIZE_ENABLED:
+        return None
+    started = time.monotonic()
+    encodings = _precompress_encodings()
+    pillow = importlib.util.find_spec("PIL") is not None
+    image_settings = f"v{_ENCODER_VERSION} w{IMAGE_MAX_WIDTH} q{IMAGE_QUALITY}"
+    text_settings = f"v{_ENCODER_VERSION} {','.join(encodings)}"
+    stats = {
+        "files": 0,
+        "cached": 0,
+        "processed": 0,
+        "imagesOptimized": 0,
+        "imagesSkipped": 0,
+        "precompressed": 0,
+        "bytesSaved": 0,
+    }
+    jobs: list[tuple[Path, str, str]] = []
+    for path, rel in _static_files(workspace):
+        kind = _asset_kind(path, encodings, pillow)
+        if kind == "skipped":
+            stats["imagesSkipped"] += 1
+        if kind not in ("image", "text"):
+            continue
+        entry = inventory.get(rel) if rel else None
+        digest = entry["sha256"] if entry else _theme_digest(path)
+        settings = image_settings if kind == "image" else text_settings
+        jobs.append((path, _cache_key(digest, settings, path.suffix.lower()), kind))
+    stats["files"] = len(jobs)
+
+    misses = [
+        (path, key, kind)
+        for path, key, kind in jobs
+        if _cached_outputs(key, kind, path.suffix.lower(), encodings) is None
+    ]
+    stats["cached"] = len(jobs) - len(misses)
+    stats["processed"] = len(misses)
+    arguments = [
+        (str(path), key, kind, encodings, IMAGE_MAX_WIDTH, IMAGE_QUALITY)
+        for path, key, kind in misses
+    ]
+    if len(misses) > 1 and ASSET_WORKERS > 1:
+        for _ in _get_pool().map(_process_asset, *zip(*arguments)):
+            pass
+    else:
+        for args in arguments:
+            _process_asset(*args)
+
+    for path, key, kind in jobs:
+        outputs = _cached_outputs(key, kind, path.suffix.lower(), encodings)
+        if outputs is None:
+            raise RuntimeError(f"Asset cache entry missing after processing: {path.name}")
+        for output in outputs:
+            # Touched on every use; eviction removes the least recently used.
+            os.utime(output)
+        if kind == "image":
+            if outputs[0].suffix == _KEEP_MARKER:
+                continue
+            stats["bytesSaved"] += path.stat().st_size - outputs[0].stat().st_size
+            _place(outputs[0], path)
+            stats["imagesOptimized"] += 1
+        else:
+            for output in outputs:
+                _place(output, path.with_name(path.name + output.suffix))
+            stats["precompressed"] += 1
+    if stats["processed"]:
+        evict_asset_cache()
+    LOGGER.info(
+        "Assets optimized files=%d cached=%d processed=%d imagesOptimized=%d "
+        "imagesSkipped=%d precompressed=%d bytesSaved=%d seconds=%.2f",
+        stats["files"],
+        stats["cached"],
+        stats["processed"],
+        stats["imagesOptimized"],
+        stats["imagesSkipped"],
+        stats["precompressed"],
+        stats["bytesSaved"],
+        time.monotonic() - started,
+    )
+    return stats
+
+
+def evict_asset_cache(max_bytes: int | None = None) -> None:
+    budget = ASSET_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not ASSET_CACHE_ROOT.exists():
+        return
+    entries = [
+        path
+        for path in ASSET_CACHE_ROOT.glob("*/*")
+        if path.is_file() and not path.name.startswith(".")
+    ]
+    sizes = {entry: entry.stat().st_size for entry in entries}
+    total = sum(sizes.values())
+    for entry in sorted(entries, key=lambda path: path.stat().st_mtime):
+        if total <= budget:
+            break
+        # Workspaces hold their own links, so removing an entry never breaks a build.
+        entry.unlink(missing_ok=True)
+        total -= sizes[entry]
+        LOGGER.info("Asset cache evicted entry=%s bytes=%d", entry.name, sizes[entry])
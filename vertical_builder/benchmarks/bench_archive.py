@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+# Allow direct script execution: `python vertical_builder/benchmarks/bench_archive.py`.
+if __package__ is None or __package__ == "":
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from vertical_builder.benchmarks.bench_assembly import _same_tree
+from vertical_builder.benchmarks.fakes import FakeStorageClient
+from vertical_builder.benchmarks.synthetic import export_files, publish_export
+from vertical_builder.bucket_service import download_snapshot, download_snapshot_archive
+
+
+BUCKET = "buzzpoint-sites-bench"
+
+
+def _payload(export_id: str) -> dict[str, Any]:
+    return {
+        "orgId": "bench-org",
+        "verticalKey": "gymnastics",
+        "templateKey": "gymnastics",
+        "env": "bench",
+        "exportId": export_id,
+    }
+
+
+def _snapshot_uri(payload: dict[str, Any]) -> str:
+    return (
+        f"gs://{BUCKET}/orgs/{payload['orgId']}/verticals/{payload['verticalKey']}/"
+        f"exports/{payload['exportId']}"
+    )
+
+
+def run_case(files_count: int, latency: float, workers: int) -> dict[str, Any]:
+    # Roughly the export mix seen in production: mostly markdown and score JSON.
+    gymnasts = files_count // 2
+    score_files = files_count // 4
+    images = max(1, files_count - gymnasts - 2 * score_files)
+    files = export_files(
+        "bench-org", gymnasts=gymnasts, score_files=score_files, images=images,
+        image_bytes=16 * 1024,
+    )
+    client = FakeStorageClient(latency=latency, list_latency=latency)
+    per_blob_payload = _payload("per-blob")
+    archive_payload = _payload("archive")
+    publish_export(client, BUCKET, per_blob_payload, files)
+    publish_export(client, BUCKET, archive_payload, files, archive=True, per_blob=False)
+
+    with tempfile.TemporaryDirectory(prefix="vb-bench-archive-") as tmp:
+        per_blob_root = Path(tmp) / "per-blob"
+        archive_root = Path(tmp) / "archive"
+        started = time.perf_counter()
+        download_snapshot(
+            client, _snapshot_uri(per_blob_payload), per_blob_root, max_workers=workers
+        )
+        per_blob_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        stats = download_snapshot_archive(client, _snapshot_uri(archive_payload), archive_root)
+        archive_seconds = time.perf_counter() - started
+        (per_blob_root / "manifest.json").unlink()
+        (archive_root / "manifest.json").unlink(missing_ok=True)
+        identical = _same_tree(per_blob_root, archive_root)
+
+    return {
+        "files": len(files),
+        "perBlobSeconds": round(per_blob_seconds, 3),
+        "archiveSeconds": round(archive_seconds, 3),
+        "archiveFiles": stats["files"] if stats else 0,
+        "speedup": round(per_blob_seconds / archive_seconds, 2) if archive_seconds else 0,
+        "identicalOutput": identical,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare per-blob and archive snapshots.")
+    parser.add_argument("--files", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--gcs-latency", type=float, default=0.02)
+    parser.add_argument("--download-workers", type=int, default=16)
+    args = parser.parse_args()
+    report = [
+        run_case(count, args.gcs_latency, args.download_workers) for count in args.files
+    ]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import argparse
+import filecmp
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+# Allow direct script execution: `python vertical_builder/benchmarks/bench_assembly.py`.
+if __package__ is None or __package__ == "":
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from vertical_builder import bucket_service
+
+
+MODULE_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _write_snapshot(root: Path, files: int, file_bytes: int) -> None:
+    body = b"x" * file_bytes
+    for index in range(files):
+        top = ("content", "data", "static")[index % 3]
+        target = root / top / f"bucket{index % 50}" / f"file{index}.bin"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(body)
+
+
+def _copy_assemble(snapshot_root: Path, workspace: Path, themes_root: Path) -> int:
+    written = 0
+    for top in ("content", "data", "static"):
+        shutil.copytree(snapshot_root / top, workspace / top, dirs_exist_ok=True)
+    shutil.copytree(
+        themes_root / "gymnastics", workspace / "themes" / "gymnastics", dirs_exist_ok=True
+    )
+    for path in workspace.rglob("*"):
+        if path.is_file():
+            written += path.stat().st_size
+    return written
+
+
+def _same_tree(left: Path, right: Path) -> bool:
+    compare = filecmp.dircmp(left, right)
+    if compare.left_only or compare.right_only or compare.funny_files:
+        return False
+    _match, mismatch, errors = filecmp.cmpfiles(
+        left, right, compare.common_files, shallow=False
+    )
+    if mismatch or errors:
+        return False
+    return all(_same_tree(left / name, right / name) for name in compare.common_dirs)
+
+
+def run(files: int, file_bytes: int, strategy: str) -> dict[str, Any]:
+    themes_root = MODULE_ROOT / "themes"
+    base_config = MODULE_ROOT / "config" / "base-config.yaml"
+    with tempfile.TemporaryDirectory(prefix="vb-bench-") as tmp:
+        tmp_root = Path(tmp)
+        snapshot_root = tmp_root / "snapshot"
+        _write_snapshot(snapshot_root, files, file_bytes)
+
+        copy_workspace = tmp_root / "copy"
+        started = time.perf_counter()
+        copy_bytes = _copy_assemble(snapshot_root, copy_workspace, themes_root)
+        copy_seconds = time.perf_counter() - started
+
+        link_workspace = tmp_root / "link"
+        started = time.perf_counter()
+        stats = _assemble_with(
+            strategy, snapshot_root, link_workspace, themes_root, base_config
+        )
+        link_seconds = time.perf_counter() - started
+        shutil.copy2(base_config, copy_workspace / "config.yaml")
+
+        return {
+            "files": files,
+            "fileBytes": file_bytes,
+            "copy": {"seconds": round(copy_seconds, 4), "bytesWritten": copy_bytes},
+            "linked": {
+                "seconds": round(link_seconds, 4),
+                "bytesWritten": stats["bytesCopied"],
+                "strategies": {
+                    name: stats[name] for name in ("reflink", "hardlink", "copy")
+                },
+            },
+            "identicalOutput": _same_tree(copy_workspace, link_workspace),
+        }
+
+
+def _assemble_with(
+    strategy: str,
+    snapshot_root: Path,
+    workspace: Path,
+    themes_root: Path,
+    base_config: Path,
+) -> dict[str, int]:
+    previous = bucket_service.ASSEMBLY_STRATEGY
+    bucket_service.ASSEMBLY_STRATEGY = strategy
+    try:
+        return bucket_service.assemble_workspace(
+            payload={"templateKey": "gymnastics"},
+            snapshot_root=snapshot_root,
+            workspace=workspace,
+            themes_root=themes_root,
+            base_config_path=base_config,
+        )
+    finally:
+        bucket_service.ASSEMBLY_STRATEGY = previous
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare workspace assembly paths.")
+    parser.add_argument("--files", type=int, default=3000)
+    parser.add_argument("--file-bytes", type=int, default=4096)
+    parser.add_argument(
+        "--strategy", default="auto", choices=("auto", "reflink", "hardlink", "copy")
+    )
+    args = parser.parse_args()
+    print(json.dumps(run(args.files, args.file_bytes, args.strategy), indent=2))
+
+
+if __name__ == "__main__":
+    main()
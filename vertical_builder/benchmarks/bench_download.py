@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+# Allow direct script execution: `python vertical_builder/benchmarks/bench_download.py`.
+if __package__ is None or __package__ == "":
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from vertical_builder import bucket_service
+from vertical_builder.benchmarks.bench_assembly import _same_tree
+from vertical_builder.benchmarks.fakes import FakeStorageClient
+from vertical_builder.benchmarks.synthetic import export_files, publish_export
+
+
+BUCKET = "buzzpoint-sites-bench"
+PAYLOAD = {
+    "orgId": "bench-org",
+    "verticalKey": "gymnastics",
+    "templateKey": "gymnastics",
+    "env": "bench",
+    "exportId": "download",
+}
+SNAPSHOT_URI = (
+    f"gs://{BUCKET}/orgs/{PAYLOAD['orgId']}/verticals/{PAYLOAD['verticalKey']}/"
+    f"exports/{PAYLOAD['exportId']}"
+)
+
+
+def _download(
+    client: FakeStorageClient, root: Path, workers: int, retry_base: float
+) -> dict[str, Any]:
+    previous = bucket_service.DOWNLOAD_RETRY_BASE_SECONDS
+    bucket_service.DOWNLOAD_RETRY_BASE_SECONDS = retry_base
+    stats: dict[str, Any] = {}
+    started = time.perf_counter()
+    try:
+        bucket_service.download_snapshot(
+            client, SNAPSHOT_URI, root, max_workers=workers, stats=stats
+        )
+    finally:
+        bucket_service.DOWNLOAD_RETRY_BASE_SECONDS = previous
+    return {
+        "seconds": round(time.perf_counter() - started, 3),
+        "files": stats["files"],
+        "attempts": sum(client.download_attempts.values()),
+    }
+
+
+def run_case(files_count: int, args: argparse.Namespace) -> dict[str, Any]:
+    # Small blobs only: markdown pages and score JSON, as in a large export.
+    files = export_files(
+        "bench-org",
+        gymnasts=files_count // 2,
+        score_files=files_count - files_count // 2,
+        images=0,
+    )
+    clients = {
+        "serial": FakeStorageClient(latency=args.gcs_latency),
+        "parallel": FakeStorageClient(latency=args.gcs_latency),
+        "retry": FakeStorageClient(latency=args.gcs_latency, failures=args.failures),
+    }
+    workers = {"serial": 1, "parallel": args.download_workers, "retry": args.download_workers}
+    report: dict[str, Any] = {"files": len(files)}
+    with tempfile.TemporaryDirectory(prefix="vb-bench-download-") as tmp:
+        roots = {}
+        for variant, client in clients.items():
+            publish_export(client, BUCKET, PAYLOAD, files)
+            roots[variant] = Path(tmp) / variant
+            report[variant] = {
+                "workers": workers[variant],
+                **_download(client, roots[variant], workers[variant], args.retry_base_seconds),
+            }
+        # Each publish stamps its own generatedAt into the manifest.
+        for root in roots.values():
+            (root / "manifest.json").unlink()
+        report["speedup"] = round(
+            report["serial"]["seconds"] / max(report["parallel"]["seconds"], 1e-6), 2
+        )
+        report["identicalOutput"] = _same_tree(roots["serial"], roots["parallel"]) and _same_tree(
+            roots["serial"], roots["retry"]
+        )
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Serial vs parallel snapshot downloads, with and without transient failures."
+    )
+    parser.add_argument("--files", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--gcs-latency", type=float, default=0.005)
+    parser.add_argument("--download-workers", type=int, default=16)
+    parser.add_argument(
+        "--failures",
+        type=int,
+        default=1,
+        help="Failed downloads of each blob before it succeeds in the retry run.",
+    )
+    parser.add_argument("--retry-base-seconds", type=float, default=0.01)
+    args = parser.parse_args()
+    if args.failures >= bucket_service.DOWNLOAD_MAX_ATTEMPTS:
+        parser.error(
+            f"--failures must be below VERTICAL_DOWNLOAD_MAX_ATTEMPTS "
+            f"({bucket_service.DOWNLOAD_MAX_ATTEMPTS})"
+        )
+    # One retry warning per blob would drown the report.
+    logging.getLogger("vertical_builder").setLevel(logging.ERROR)
+    print(json.dumps([run_case(count, args) for count in args.files], indent=2))
+
+
+if __name__ == "__main__":
+    main()
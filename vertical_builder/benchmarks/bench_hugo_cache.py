@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+# Allow direct script execution: `python vertical_builder/benchmarks/bench_hugo_cache.py`.
+if __package__ is None or __package__ == "":
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from vertical_builder import hugo_cache_service
+from vertical_builder.benchmarks.synthetic import export_files
+from vertical_builder.bucket_service import assemble_workspace
+from vertical_builder.deploy_service import run_hugo_minify
+
+
+MODULE_ROOT = Path(__file__).resolve().parents[1]
+PAYLOAD = {
+    "orgId": "bench-org",
+    "verticalKey": "gymnastics",
+    "templateKey": "gymnastics",
+}
+# The footer stamps the build minute, which may differ between runs.
+_BUILD_STAMP = re.compile(rb"Last updated: [^<]*")
+# cold: no --cacheDir and no resources/_gen, as without the cache.
+# cacheDir: a warm --cacheDir slot only.
+# cacheDir+resources: a warm slot plus the vertical's saved resources/_gen,
+# the path every build takes.
+VARIANTS = {
+    "cold": (False, False),
+    "cacheDir": (True, False),
+    "cacheDir+resources": (True, True),
+}
+
+
+def _write_snapshot(root: Path, files: dict[str, bytes]) -> None:
+    for name, data in files.items():
+        target = root / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+
+
+def _public_digest(public_root: Path) -> str:
+    digest = hashlib.sha256()
+    for path in sorted(public_root.rglob("*")):
+        if path.is_file():
+            digest.update(path.relative_to(public_root).as_posix().encode("utf-8") + b"\0")
+            digest.update(_BUILD_STAMP.sub(b"", path.read_bytes()))
+    return digest.hexdigest()
+
+
+def _tree(root: Path) -> dict[str, int]:
+    files = [path for path in root.rglob("*") if path.is_file()] if root.exists() else []
+    return {"files": len(files), "bytes": sum(path.stat().st_size for path in files)}
+
+
+def _build(
+    snapshot_root: Path, workspace: Path, themes_root: Path, cache_dir: bool, resources: bool
+) -> dict[str, float]:
+    # A fresh workspace per build, as in the builder; assembly is not timed.
+    shutil.rmtree(workspace, ignore_errors=True)
+    assemble_workspace(
+        payload=PAYLOAD,
+        snapshot_root=snapshot_root,
+        workspace=workspace,
+        themes_root=themes_root,
+        base_config_path=MODULE_ROOT / "config" / "base-config.yaml",
+    )
+    started = time.perf_counter()
+    if resources:
+        hugo_cache_service.restore_hugo_resources(PAYLOAD, workspace)
+    restored = time.perf_counter()
+    if cache_dir:
+        with hugo_cache_service.hugo_cache_dir(PAYLOAD) as slot:
+            run_hugo_minify(workspace, slot)
+    else:
+        run_hugo_minify(workspace)
+    rendered = time.perf_counter()
+    if resources:
+        hugo_cache_service.save_hugo_resources(PAYLOAD, workspace)
+    return {
+        "hugo": rendered - restored,
+        "total": time.perf_counter() - started,
+    }
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    previous_root = hugo_cache_service.HUGO_CACHE_ROOT
+    report: dict[str, Any] = {
+        "gymnasts": args.gymnasts,
+        "scoreFiles": args.score_files,
+        "images": args.images,
+        "repeat": args.repeat,
+    }
+    digests = {}
+    with tempfile.TemporaryDirectory(prefix="vb-bench-hugo-cache-") as tmp:
+        scratch = Path(tmp)
+        snapshot_root = scratch / "snapshot"
+        _write_snapshot(
+            snapshot_root,
+            export_files(
+                PAYLOAD["orgId"],
+                gymnasts=args.gymnasts,
+                score_files=args.score_files,
+                images=args.images,
+            ),
+        )
+        try:
+            for variant, (cache_dir, resources) in VARIANTS.items():
+                cache_root = scratch / f"{variant}-cache"
+                hugo_cache_service.HUGO_CACHE_ROOT = cache_root
+                workspace = scratch / variant
+                if cache_dir:
+                    # Primes the cache, as the previous build of the site would.
+                    _build(snapshot_root, workspace, args.themes, cache_dir, resources)
+                timings = [
+                    _build(snapshot_root, workspace, args.themes, cache_dir, resources)
+                    for _ in range(args.repeat)
+                ]
+                report[variant] = {
+                    "hugoSeconds": round(statistics.median(t["hugo"] for t in timings), 3),
+                    "totalSeconds": round(statistics.median(t["total"] for t in timings), 3),
+                    "cacheDir": _tree(cache_root / "cache"),
+                    "resourcesGen": _tree(workspace / "resources" / "_gen"),
+                }
+                digests[variant] = _public_digest(workspace / "public")
+        finally:
+            hugo_cache_service.HUGO_CACHE_ROOT = previous_root
+    cold = report["cold"]["totalSeconds"]
+    for variant in VARIANTS:
+        if variant != "cold":
+            report[variant]["speedup"] = round(
+                cold / max(report[variant]["totalSeconds"], 1e-6), 2
+            )
+    report["identicalOutput"] = len(set(digests.values())) == 1
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Hugo build time cold vs with a warm --cacheDir and resources/_gen."
+    )
+    parser.add_argument("--gymnasts", type=int, default=1000)
+    parser.add_argument("--score-files", type=int, default=200)
+    parser.add_argument("--images", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--themes",
+        type=Path,
+        default=MODULE_ROOT / "themes",
+        help="Themes root to render with (default: the theme in the image).",
+    )
+    parser.add_argument("--hugo", default="hugo", help="Hugo executable to run.")
+    parser.add_argument("--output", type=Path, help="Also write the report to this file.")
+    args = parser.parse_args()
+    hugo = shutil.which(args.hugo)
+    if hugo is None:
+        parser.error(f"Hugo executable not found: {args.hugo}")
+    # run_hugo_minify runs `hugo` from PATH, as in the builder.
+    os.environ["PATH"] = f"{Path(hugo).parent}{os.pathsep}{os.environ.get('PATH', '')}"
+    logging.getLogger("vertical_builder").setLevel(logging.WARNING)
+
+    text = json.dumps(run(args), indent=2)
+    print(text)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+# Imports the entry point in a fresh interpreter and answers one request, the
+# way a Cloud Run instance does after scaling from zero.
+_COLD_START = """
+import json, sys, time
+started = time.perf_counter()
+import {module} as entry
+imported = time.perf_counter()
+if hasattr(entry, "app"):
+    entry.app.test_client().get("/metrics")
+responded = time.perf_counter()
+print(json.dumps({{
+    "importSeconds": imported - started,
+    "firstResponseSeconds": responded - started,
+    "googleLoaded": sorted(
+        name for name in sys.modules
+        if name in ("google.cloud.firestore", "google.cloud.storage", "google.cloud.pubsub_v1")
+    ),
+}}))
+"""
+
+
+def _environment() -> dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("ENV", "bench")
+    env.setdefault("FIREBASE_PROJECT", "bench-project")
+    # Background threads would skew the measurement.
+    env["VERTICAL_WARMUP"] = "0"
+    env["VERTICAL_WORKSPACE_SWEEP_SECONDS"] = "0"
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [str(REPO_ROOT), env.get("PYTHONPATH", "")])
+    )
+    return env
+
+
+def _parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line.removeprefix("import time:").split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue
+        rows.append((parts[2].strip(), self_us, cumulative_us))
+    return rows
+
+
+def profile_module(module: str, repeat: int, top: int) -> dict[str, Any]:
+    runs = []
+    rows: list[tuple[str, int, int]] = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _COLD_START.format(module=module)],
+            capture_output=True,
+            text=True,
+            env=_environment(),
+            check=True,
+        )
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+        rows = _parse_importtime(completed.stderr)
+    heaviest = sorted(rows, key=lambda row: row[2], reverse=True)
+    return {
+        "module": module,
+        "importSeconds": round(statistics.median(run["importSeconds"] for run in runs), 4),
+        "firstResponseSeconds": round(
+            statistics.median(run["firstResponseSeconds"] for run in runs), 4
+        ),
+        "googleLoaded": runs[-1]["googleLoaded"],
+        "modulesImported": len(rows),
+        "heaviest": [
+            {"module": name, "cumulativeMs": round(cumulative / 1000, 1)}
+            for name, _self, cumulative in heaviest[:top]
+        ],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cold-start import profile of the entry points.")
+    parser.add_argument(
+        "--modules",
+        nargs="+",
+        default=["vertical_builder.app", "vertical_builder.builder_service"],
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--max-import-ms",
+        type=float,
+        help="Exit non-zero when any module's median import time exceeds this.",
+    )
+    parser.add_argument("--output", type=Path, help="Also write the report to this file.")
+    args = parser.parse_args()
+
+    report = [profile_module(module, args.repeat, args.top) for module in args.modules]
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    if args.max_import_ms is not None:
+        slow = [
+            entry["module"]
+            for entry in report
+            if entry["importSeconds"] * 1000 > args.max_import_ms
+        ]
+        if slow:
+            print(f"Import time budget exceeded: {', '.join(slow)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import json
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+# Allow direct script execution: `python vertical_builder/benchmarks/bench_pipeline.py`.
+if __package__ is None or __package__ == "":
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from vertical_builder.benchmarks.fakes import (
+    FakeFirestoreClient,
+    FakeStorageClient,
+    FakeSubscriberClient,
+    install_stub_executables,
+)
+from vertical_builder.benchmarks.synthetic import export_files, publish_export
+
+
+MODULE_ROOT = Path(__file__).resolve().parents[1]
+BUCKET = "buzzpoint-sites-bench"
+PROJECT = "bench-project"
+
+# Module-level settings in the builder read these at import time, so they are
+# pointed at the scratch directory before vertical_builder modules load.
+_STATE_DIRS = {
+    "VERTICAL_WORKSPACE_ROOT": "workspaces",
+    "VERTICAL_LOCAL_OUTPUT_ROOT": "local_output",
+    "VERTICAL_SNAPSHOT_CACHE_ROOT": "snapshot_cache",
+    "VERTICAL_SNAPSHOT_BASELINE_ROOT": "snapshot_baselines",
+    "VERTICAL_DEPLOY_INDEX_ROOT": "deploy_index",
+    "VERTICAL_HUGO_CACHE_ROOT": "hugo_cache",
+    "VERTICAL_HOSTING_SITE_ROOT": "hosting_sites",
+    "VERTICAL_ARTIFACT_ROOT": "artifacts",
+    "VERTICAL_ASSET_CACHE_ROOT": "asset_cache",
+    "VERTICAL_REBUILD_ROOT": "rebuilds",
+}
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _summary(values: list[float]) -> dict[str, float]:
+    return {
+        "p50": round(_percentile(values, 0.50), 3),
+        "p99": round(_percentile(values, 0.99), 3),
+        "mean": round(statistics.fmean(values), 3) if values else 0.0,
+    }
+
+
+def _dir_bytes(root: Path) -> int:
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                continue
+    return total
+
+
+class _DiskSampler(threading.Thread):
+    def __init__(self, root: Path, interval: float = 0.2) -> None:
+        super().__init__(daemon=True)
+        self.root = root
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, _dir_bytes(self.root))
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, _dir_bytes(self.root))
+
+
+def _prepare_environment(scratch: Path, args: argparse.Namespace) -> None:
+    for name, subdir in _STATE_DIRS.items():
+        os.environ[name] = str(scratch / subdir)
+    bin_dir = scratch / "bin"
+    install_stub_executables(bin_dir)
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+    os.environ["FAKE_HUGO_SECONDS"] = str(args.hugo_seconds)
+    os.environ["FAKE_FIREBASE_SECONDS"] = str(args.firebase_seconds)
+    os.environ["FAKE_FIREBASE_LOG"] = str(scratch / "firebase.log")
+    os.environ["VERTICAL_DOWNLOAD_WORKERS"] = str(args.download_workers)
+    os.environ["FAKE_HUGO_CPU"] = "1" if args.hugo_cpu else "0"
+    if args.redeploy:
+        # Artifacts are opt-in; the redeploys need them stored.
+        os.environ["VERTICAL_ARTIFACT_STORE"] = "bucket"
+    for name, slots in (
+        ("VERTICAL_FETCH_SLOTS", args.fetch_slots),
+        ("VERTICAL_RENDER_SLOTS", args.render_slots),
+        ("VERTICAL_DEPLOY_SLOTS", args.deploy_slots),
+    ):
+        if slots is not None:
+            os.environ[name] = str(slots)
+
+
+def _payload(org_id: str, export_id: str) -> dict[str, Any]:
+    return {
+        "jobId": f"vb_{uuid.uuid4().hex[:12]}",
+        "env": "bench",
+        "orgId": org_id,
+        "verticalKey": "gymnastics",
+        "templateKey": "gymnastics",
+        "exportId": export_id,
+        "buildTarget": {"hostingProject": PROJECT, "site": f"{org_id}-site"},
+    }
+
+
+def run(args: argparse.Namespace) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="vb-bench-pipeline-") as tmp:
+        scratch = Path(tmp)
+        _prepare_environment(scratch, args)
+
+        from google.cloud import firestore, storage
+
+        from vertical_builder import builder_service, client_service, pull_worker
+        from vertical_builder.config import RuntimeConfig
+        from vertical_builder.pipeline_service import phase_stats, pipeline_capacity
+        from vertical_builder.scheduler_service import BuildScheduler
+
+        if args.workers is None:
+            args.workers = pipeline_capacity()
+
+        runtime = RuntimeConfig(
+            env="bench",
+            firebase_project=PROJECT,
+            export_bucket=BUCKET,
+            themes_root=MODULE_ROOT / "themes",
+            base_config_path=MODULE_ROOT / "config" / "base-config.yaml",
+            lock_ttl_seconds=900,
+            max_concurrent_builds=args.workers,
+        )
+        storage_client = FakeStorageClient(
+            latency=args.gcs_latency, list_latency=args.gcs_latency
+        )
+        db = FakeFirestoreClient(latency=args.firestore_latency)
+
+        payloads = []
+        for org_index in range(args.orgs):
+            org_id = f"bench-org-{org_index:03d}"
+            files = export_files(
+                org_id,
+                gymnasts=args.gymnasts,
+                score_files=args.score_files,
+                images=args.images,
+                image_bytes=args.image_bytes,
+            )
+            for build_index in range(args.builds_per_org):
+                payload = _payload(org_id, f"export-{org_index:03d}-{build_index:03d}")
+                publish_export(storage_client, BUCKET, payload, files)
+                payloads.append(payload)
+
+        submitted_at: dict[str, float] = {}
+        latencies: list[float] = []
+        build_seconds: list[float] = []
+        record_lock = threading.Lock()
+        handle_build_job = builder_service.handle_build_job
+
+        def _timed_build(payload: dict[str, Any], runtime_config: RuntimeConfig) -> None:
+            started = time.perf_counter()
+            handle_build_job(payload, runtime_config)
+            finished = time.perf_counter()
+            with record_lock:
+                latencies.append(finished - submitted_at[payload["jobId"]])
+                build_seconds.append(finished - started)
+
+        clients_created = {"count": 0}
+
+        def _client_factory(client: Any):
+            # Stands in for credential lookup plus channel/session setup.
+            def _create() -> Any:
+                time.sleep(args.client_setup_seconds)
+                with record_lock:
+                    clients_created["count"] += 1
+                return client
+
+            return _create
+
+        sampler = _DiskSampler(scratch)
+        subscriber = FakeSubscriberClient()
+        client_service.reset_clients()
+        with ExitStack() as stack:
+            stack.enter_context(
+                mock.patch.object(
+                    storage, "Client", side_effect=_client_factory(storage_client)
+                )
+            )
+            stack.enter_context(
+                mock.patch.object(firestore, "Client", side_effect=_client_factory(db))
+            )
+            if args.per_job_clients:
+                stack.enter_context(
+                    mock.patch.object(
+                        builder_service,
+                        "get_storage_client",
+                        lambda: storage.Client(),
+                    )
+                )
+                stack.enter_context(
+                    mock.patch.object(
+                        builder_service,
+                        "get_firestore_client",
+                        lambda: firestore.Client(),
+                    )
+                )
+            sampler.start()
+            started = time.perf_counter()
+            if args.mode == "pull":
+                stack.enter_context(
+                    mock.patch.object(pull_worker, "handle_build_job", _timed_build)
+                )
+                worker = pull_worker.PullWorker(
+                    runtime, "projects/bench/subscriptions/builds", subscriber=subscriber
+                )
+                worker.start()
+                for payload in payloads:
+                    submitted_at[payload["jobId"]] = time.perf_counter()
+                    subscriber.publish(json.dumps(payload).encode("utf-8"))
+                subscriber.wait_for_acks(len(payloads))
+                worker.stop()
+            else:
+                scheduler = BuildScheduler(max_workers=args.workers)
+                for payload in payloads:
+                    submitted_at[payload["jobId"]] = time.perf_counter()
+                    scheduler.submit(payload, _timed_build, runtime)
+                scheduler.shutdown(wait=True)
+            wall = time.perf_counter() - started
+            sampler.stop()
+
+            redeploys = []
+            redeploy_seconds: list[float] = []
+            if args.redeploy:
+                # Every org's first export again, from its stored artifact:
+                # the path a rollback takes.
+                for payload in payloads[:: args.builds_per_org]:
+                    redeploy = {
+                        **payload,
+                        "jobId": f"{payload['jobId']}-redeploy",
+                        "deployArtifact": True,
+                    }
+                    redeploy_started = time.perf_counter()
+                    handle_build_job(redeploy, runtime)
+                    redeploy_seconds.append(time.perf_counter() - redeploy_started)
+                    redeploys.append(redeploy)
+
+            rebuild_report: dict[str, Any] = {}
+            if args.fleet_rebuild:
+                from vertical_builder.fleet_rebuild import FleetRebuild
+
+                # A theme release: every live site again with one changed layout.
+                release_themes = scratch / "themes"
+                shutil.copytree(MODULE_ROOT / "themes", release_themes)
+                with (release_themes / "gymnastics" / "layouts" / "404.html").open(
+                    "a", encoding="utf-8"
+                ) as handle:
+                    handle.write("\n<!-- theme release -->\n")
+                release = dataclasses.replace(runtime, themes_root=release_themes)
+                # The exporter's vertical documents, naming each org's last export.
+                for payload in payloads[args.builds_per_org - 1 :: args.builds_per_org]:
+                    db.write(
+                        f"orgs/{payload['orgId']}/verticals/{payload['verticalKey']}",
+                        {"desiredExportId": payload["exportId"]},
+                        False,
+                    )
+                rebuild_started = time.perf_counter()
+                rebuild_report = FleetRebuild(release, db, concurrency=args.workers).run()
+                rebuild_report["wallSeconds"] = round(time.perf_counter() - rebuild_started, 3)
+                # A second run of the same release resumes from the checkpoint.
+                rebuild_report["pendingAfterResume"] = len(FleetRebuild(release, db).plan())
+        client_service.reset_clients()
+
+        def _statuses(jobs: list[dict[str, Any]]) -> dict[str, int]:
+            counts: dict[str, int] = {}
+            for payload in jobs:
+                receipt = db.peek(
+                    f"orgs/{payload['orgId']}/verticalBuildReceipts/{payload['jobId']}"
+                ) or {}
+                status = receipt.get("status", "missing")
+                counts[status] = counts.get(status, 0) + 1
+            return counts
+
+        results = _statuses(payloads)
+
+        # Mean time jobs queued for a slot of each phase.
+        phase_waits: dict[str, list[float]] = {}
+        for payload in payloads:
+            receipt = db.peek(
+                f"orgs/{payload['orgId']}/verticalBuildReceipts/{payload['jobId']}"
+            ) or {}
+            for stage, entry in (receipt.get("stages") or {}).items():
+                if stage.endswith("Wait"):
+                    phase_waits.setdefault(stage.removesuffix("Wait"), []).append(
+                        entry["ms"] / 1000
+                    )
+
+        firebase_commands: dict[str, int] = {}
+        firebase_log = scratch / "firebase.log"
+        if firebase_log.exists():
+            for command in firebase_log.read_text(encoding="utf-8").split():
+                firebase_commands[command] = firebase_commands.get(command, 0) + 1
+
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return {
+            "config": {
+                key: value for key, value in vars(args).items() if key != "output"
+            },
+            "jobs": len(payloads),
+            "results": results,
+            "wallSeconds": round(wall, 3),
+            "throughputJobsPerMinute": round(len(payloads) / wall * 60, 2) if wall else 0,
+            # Latency runs from submission to receipt, so it includes queueing.
+            "latencySeconds": _summary(latencies),
+            "buildSeconds": _summary(build_seconds),
+            "phaseSlots": {phase: slots["slots"] for phase, slots in phase_stats().items()},
+            "phaseWaitSeconds": {
+                phase: round(statistics.fmean(waits), 3) for phase, waits in phase_waits.items()
+            },
+            "peakDiskBytes": sampler.peak,
+            # ru_maxrss is KiB on Linux.
+            "peakRssBytes": self_usage.ru_maxrss * 1024,
+            "peakChildRssBytes": child_usage.ru_maxrss * 1024,
+            "gcsRequests": storage_client.requests,
+            "firestoreRoundTrips": db.round_trips,
+            "firestoreRoundTripsPerJob": round(db.round_trips / len(payloads), 2)
+            if payloads
+            else 0,
+            "clientsCreated": clients_created["count"],
+            "firebaseCommands": firebase_commands,
+            **(
+                {
+                    "redeployResults": _statuses(redeploys),
+                    "redeploySeconds": _summary(redeploy_seconds),
+                }
+                if args.redeploy
+                else {}
+            ),
+            **({"fleetRebuild": rebuild_report} if args.fleet_rebuild else {}),
+            **(
+                {
+                    "peakOutstandingMessages": subscriber.peak_outstanding,
+                    "nackedMessages": len(subscriber.nacked),
+                }
+                if args.mode == "pull"
+                else {}
+            ),
+        }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="End-to-end builder benchmark against local stand-ins."
+    )
+    parser.add_argument(
+        "--mode",
+        choices=("push", "pull"),
+        default="push",
+        help="push submits to BuildScheduler directly; pull runs PullWorker on a fake subscription.",
+    )
+    parser.add_argument("--orgs", type=int, default=4)
+    parser.add_argument("--builds-per-org", type=int, default=1)
+    parser.add_argument("--gymnasts", type=int, default=50)
+    parser.add_argument("--score-files", type=int, default=20)
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--image-bytes", type=int, default=64 * 1024)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Scheduler threads (default: the sum of the phase slots).",
+    )
+    parser.add_argument("--fetch-slots", type=int, help="Overrides VERTICAL_FETCH_SLOTS.")
+    parser.add_argument("--render-slots", type=int, help="Overrides VERTICAL_RENDER_SLOTS.")
+    parser.add_argument("--deploy-slots", type=int, help="Overrides VERTICAL_DEPLOY_SLOTS.")
+    parser.add_argument("--download-workers", type=int, default=16)
+    parser.add_argument("--gcs-latency", type=float, default=0.005)
+    parser.add_argument("--firestore-latency", type=float, default=0.01)
+    parser.add_argument("--hugo-seconds", type=float, default=0.5)
+    parser.add_argument(
+        "--hugo-cpu",
+        action="store_true",
+        help="The stub hugo burns --hugo-seconds of CPU instead of sleeping.",
+    )
+    parser.add_argument("--firebase-seconds", type=float, default=1.0)
+    parser.add_argument("--client-setup-seconds", type=float, default=0.05)
+    parser.add_argument(
+        "--per-job-clients",
+        action="store_true",
+        help="Create fresh clients for every job instead of the shared ones.",
+    )
+    parser.add_argument(
+        "--redeploy",
+        action="store_true",
+        help="Afterwards redeploy each org's first export from its stored artifact.",
+    )
+    parser.add_argument(
+        "--fleet-rebuild",
+        action="store_true",
+        help="Afterwards rebuild every deployed site with a changed theme.",
+    )
+    parser.add_argument("--output", type=Path, help="Also write the report to this file.")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
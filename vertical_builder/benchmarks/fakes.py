@@ -0,0 +1,586 @@
+from __future__ import annotations
+
+import base64
+import copy
+import hashlib
+import io
+import os
+import stat
+import sys
+import textwrap
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Iterator
+
+from google.api_core import exceptions as gcs_exceptions
+
+
+# ---------------------------------------------------------------------------
+# Cloud Storage
+
+
+class _FakeUploads:
+    # Uploads replace the object in the owning FakeStorageClient, so a later
+    # FakeBucket.blob() call sees the new data and generation.
+    _client: "FakeStorageClient"
+    _bucket_name: str
+    name: str
+
+    def upload_from_string(self, data: bytes | str, content_type: str | None = None) -> None:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        time.sleep(self._client.latency)
+        self._client.put(self._bucket_name, self.name, data, count=True)
+
+    def upload_from_filename(self, filename: str, content_type: str | None = None) -> None:
+        self.upload_from_string(Path(filename).read_bytes(), content_type)
+
+
+class FakeBlob(_FakeUploads):
+    def __init__(
+        self,
+        client: "FakeStorageClient",
+        bucket_name: str,
+        name: str,
+        data: bytes,
+        generation: int,
+    ) -> None:
+        self._client = client
+        self._bucket_name = bucket_name
+        self.name = name
+        self._data = data
+        self._latency = client.latency
+        self.size = len(data)
+        self.generation = generation
+        self.crc32c = base64.b64encode(
+            zlib.crc32(data).to_bytes(4, "big")
+        ).decode("ascii")
+        self.md5_hash = base64.b64encode(hashlib.md5(data).digest()).decode("ascii")
+
+    def download_to_filename(self, filename: str) -> None:
+        time.sleep(self._latency)
+        Path(filename).write_bytes(self._data)
+
+    def download_to_file(self, file_obj: Any) -> None:
+        time.sleep(self._latency)
+        self._client.count_download(self._bucket_name, self.name)
+        view = memoryview(self._data)
+        for offset in range(0, len(view), 256 * 1024):
+            file_obj.write(view[offset : offset + 256 * 1024])
+
+    def download_as_bytes(self) -> bytes:
+        time.sleep(self._latency)
+        return self._data
+
+    def open(self, mode: str = "rb", **_kwargs: Any) -> io.BytesIO:
+        time.sleep(self._latency)
+        return io.BytesIO(self._data)
+
+    def delete(self) -> None:
+        time.sleep(self._latency)
+        self._client.remove(self._bucket_name, self.name)
+
+
+class _MissingBlob(_FakeUploads):
+    def __init__(self, client: "FakeStorageClient", bucket_name: str, name: str) -> None:
+        self._client = client
+        self._bucket_name = bucket_name
+        self.name = name
+        self._latency = client.latency
+
+    def download_as_bytes(self) -> bytes:
+        time.sleep(self._latency)
+        raise gcs_exceptions.NotFound(f"No such object: {self.name}")
+
+    def download_to_filename(self, filename: str) -> None:
+        self.download_as_bytes()
+
+
+class FakeBucket:
+    def __init__(self, client: "FakeStorageClient", name: str) -> None:
+        self._client = client
+        self.name = name
+
+    def blob(self, name: str) -> FakeBlob | _MissingBlob:
+        return self._client.get_blob(self.name, name) or _MissingBlob(
+            self._client, self.name, name
+        )
+
+    def get_blob(self, name: str) -> FakeBlob | None:
+        time.sleep(self._client.latency)
+        return self._client.get_blob(self.name, name)
+
+
+class FakeStorageClient:
+    # Serves objects from memory with a fixed per-request latency. Reads and
+    # the builder's artifact uploads and deletes are thread-safe. With
+    # `failures`, the first that many streamed downloads of each object fail
+    # with a 503.
+
+    def __init__(
+        self, latency: float = 0.0, list_latency: float = 0.0, failures: int = 0
+    ) -> None:
+        self.latency = latency
+        self.list_latency = list_latency
+        self.failures = failures
+        self._objects: dict[str, dict[str, FakeBlob]] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.download_attempts: dict[str, int] = {}
+
+    def count_download(self, bucket: str, name: str) -> None:
+        key = f"{bucket}/{name}"
+        with self._lock:
+            attempts = self.download_attempts[key] = self.download_attempts.get(key, 0) + 1
+        if attempts <= self.failures:
+            raise gcs_exceptions.ServiceUnavailable(f"Injected failure for {name}")
+
+    def put(self, bucket: str, name: str, data: bytes, count: bool = False) -> None:
+        with self._lock:
+            self._generation += 1
+            if count:
+                self.requests += 1
+            self._objects.setdefault(bucket, {})[name] = FakeBlob(
+                self, bucket, name, data, self._generation
+            )
+
+    def remove(self, bucket: str, name: str) -> None:
+        with self._lock:
+            self.requests += 1
+            self._objects.get(bucket, {}).pop(name, None)
+
+    def get_blob(self, bucket: str, name: str) -> FakeBlob | None:
+        with self._lock:
+            self.requests += 1
+            return self._objects.get(bucket, {}).get(name)
+
+    def bucket(self, name: str) -> FakeBucket:
+        return FakeBucket(self, name)
+
+    def list_blobs(self, bucket: FakeBucket | str, prefix: str = "") -> Iterator[FakeBlob]:
+        bucket_name = bucket.name if isinstance(bucket, FakeBucket) else bucket
+        time.sleep(self.list_latency)
+        with self._lock:
+            self.requests += 1
+            blobs = [
+                blob
+                for name, blob in sorted(self._objects.get(bucket_name, {}).items())
+                if name.startswith(prefix)
+            ]
+        return iter(blobs)
+
+
+# ---------------------------------------------------------------------------
+# Firestore
+
+
+class FakeSnapshot:
+    def __init__(
+        self,
+        doc_id: str,
+        data: dict[str, Any] | None,
+        reference: "FakeDocumentReference | None" = None,
+    ) -> None:
+        self.id = doc_id
+        self._data = data
+        self.reference = reference
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> dict[str, Any] | None:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class FakeDocumentReference:
+    def __init__(self, db: "FakeFirestoreClient", path: str) -> None:
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> "FakeCollectionReference":
+        return FakeCollectionReference(self._db, self.path.rsplit("/", 1)[0])
+
+    def collection(self, name: str) -> "FakeCollectionReference":
+        return FakeCollectionReference(self._db, f"{self.path}/{name}")
+
+    def get(self, transaction: Any = None, field_paths: Any = None) -> FakeSnapshot:
+        return FakeSnapshot(self.id, self._db.read(self.path), self)
+
+    def set(self, data: dict[str, Any], merge: bool = False) -> None:
+        self._db.write(self.path, data, merge)
+
+    def delete(self) -> None:
+        self._db.write(self.path, None, False)
+
+
+class FakeQuery:
+    def __init__(
+        self,
+        db: "FakeFirestoreClient",
+        path: str,
+        filters: tuple[tuple[str, str, Any], ...] = (),
+        limit: int | None = None,
+    ) -> None:
+        self._db = db
+        self._path = path
+        self._filters = filters
+        self._limit = limit
+
+    def where(self, filter: Any) -> "FakeQuery":  # pylint: disable=redefined-builtin
+        if filter.op_string != "==":
+            raise NotImplementedError(f"Unsupported operator {filter.op_string}")
+        return FakeQuery(
+            self._db,
+            self._path,
+            self._filters + ((filter.field_path, filter.op_string, filter.value),),
+            self._limit,
+        )
+
+    def limit(self, count: int) -> "FakeQuery":
+        return FakeQuery(self._db, self._path, self._filters, count)
+
+    def _documents(self) -> list[tuple[str, dict[str, Any]]]:
+        return self._db.list_collection(self._path)
+
+    def stream(self) -> Iterator[FakeSnapshot]:
+        results = []
+        for doc_path, data in self._documents():
+            if all(data.get(field) == value for field, _op, value in self._filters):
+                results.append(
+                    FakeSnapshot(
+                        doc_path.rsplit("/", 1)[-1],
+                        data,
+                        FakeDocumentReference(self._db, doc_path),
+                    )
+                )
+                if self._limit is not None and len(results) >= self._limit:
+                    break
+        return iter(results)
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, db: "FakeFirestoreClient", path: str) -> None:
+        super().__init__(db, path)
+
+    @property
+    def id(self) -> str:
+        return self._path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self) -> FakeDocumentReference | None:
+        if "/" not in self._path:
+            return None
+        return FakeDocumentReference(self._db, self._path.rsplit("/", 1)[0])
+
+    def document(self, doc_id: str) -> FakeDocumentReference:
+        return FakeDocumentReference(self._db, f"{self._path}/{doc_id}")
+
+
+class FakeCollectionGroup(FakeQuery):
+    # Every collection named `path`, at any depth.
+
+    def _documents(self) -> list[tuple[str, dict[str, Any]]]:
+        return self._db.list_collection_group(self._path)
+
+
+class FakeWriteBatch:
+    # Stages writes and applies them in a single round-trip on commit.
+
+    def __init__(self, db: "FakeFirestoreClient") -> None:
+        self._db = db
+        self._writes: list[tuple[str, dict[str, Any] | None, bool]] = []
+
+    def set(self, reference: FakeDocumentReference, data: dict[str, Any], merge: bool = False) -> None:
+        self._writes.append((reference.path, data, merge))
+
+    def delete(self, reference: FakeDocumentReference) -> None:
+        self._writes.append((reference.path, None, False))
+
+    def commit(self) -> list[Any]:
+        self._db.commit(self._writes)
+        self._writes = []
+        return []
+
+
+class FakeTransaction:
+    # Implements the private hooks google.cloud.firestore.transactional drives
+    # (_begin/_commit/_rollback), serializing transactions on one lock. Begin
+    # and commit each cost a round-trip, as they do against Firestore.
+
+    _read_only = False
+    _max_attempts = 5
+
+    def __init__(self, db: "FakeFirestoreClient") -> None:
+        self._db = db
+        self._id: bytes | None = None
+        self._writes: list[tuple[str, dict[str, Any] | None, bool]] = []
+
+    def _clean_up(self) -> None:
+        self._writes = []
+        self._id = None
+
+    def _begin(self, retry_id: bytes | None = None) -> None:
+        self._db.transaction_lock.acquire()
+        self._db.round_trip()
+        self._id = os.urandom(8)
+
+    def _commit(self) -> list[Any]:
+        try:
+            self._db.commit(self._writes)
+        finally:
+            self._clean_up()
+            self._db.transaction_lock.release()
+        return []
+
+    def _rollback(self) -> None:
+        if self._id is not None:
+            self._clean_up()
+            self._db.transaction_lock.release()
+
+    def set(self, reference: FakeDocumentReference, data: dict[str, Any], merge: bool = False) -> None:
+        self._writes.append((reference.path, data, merge))
+
+    def delete(self, reference: FakeDocumentReference) -> None:
+        self._writes.append((reference.path, None, False))
+
+
+class FakeFirestoreClient:
+    # In-memory document store with a fixed latency per round-trip.
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.transaction_lock = threading.RLock()
+        self._lock = threading.Lock()
+        self._docs: dict[str, dict[str, Any]] = {}
+        self.round_trips = 0
+
+    def round_trip(self) -> None:
+        with self._lock:
+            self.round_trips += 1
+        time.sleep(self.latency)
+
+    def read(self, path: str) -> dict[str, Any] | None:
+        self.round_trip()
+        with self._lock:
+            data = self._docs.get(path)
+            return copy.deepcopy(data) if data is not None else None
+
+    def peek(self, path: str) -> dict[str, Any] | None:
+        # Reads without a round-trip, for reporting.
+        with self._lock:
+            data = self._docs.get(path)
+            return copy.deepcopy(data) if data is not None else None
+
+    def _apply(self, path: str, data: dict[str, Any] | None, merge: bool) -> None:
+        if data is None:
+            self._docs.pop(path, None)
+        elif merge and path in self._docs:
+            self._docs[path].update(copy.deepcopy(data))
+        else:
+            self._docs[path] = copy.deepcopy(data)
+
+    def write(self, path: str, data: dict[str, Any] | None, merge: bool) -> None:
+        self.round_trip()
+        with self._lock:
+            self._apply(path, data, merge)
+
+    def commit(self, writes: list[tuple[str, dict[str, Any] | None, bool]]) -> None:
+        if not writes:
+            return
+        self.round_trip()
+        with self._lock:
+            for path, data, merge in writes:
+                self._apply(path, data, merge)
+
+    def list_collection(self, path: str) -> list[tuple[str, dict[str, Any]]]:
+        self.round_trip()
+        prefix = path + "/"
+        with self._lock:
+            return [
+                (doc_path, copy.deepcopy(data))
+                for doc_path, data in sorted(self._docs.items())
+                if doc_path.startswith(prefix) and "/" not in doc_path[len(prefix) :]
+            ]
+
+    def list_collection_group(self, name: str) -> list[tuple[str, dict[str, Any]]]:
+        self.round_trip()
+        with self._lock:
+            return [
+                (doc_path, copy.deepcopy(data))
+                for doc_path, data in sorted(self._docs.items())
+                if doc_path.rsplit("/", 2)[-2:-1] == [name]
+            ]
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, name)
+
+    def collection_group(self, name: str) -> FakeCollectionGroup:
+        return FakeCollectionGroup(self, name)
+
+    def transaction(self, **_kwargs: Any) -> FakeTransaction:
+        return FakeTransaction(self)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+
+# ---------------------------------------------------------------------------
+# Pub/Sub
+
+
+class FakeMessage:
+    def __init__(self, client: "FakeSubscriberClient", message_id: str, data: bytes) -> None:
+        self._client = client
+        self.message_id = message_id
+        self.data = data
+        self.size = len(data)
+
+    def ack(self) -> None:
+        self._client.settle(self, acked=True)
+
+    def nack(self) -> None:
+        self._client.settle(self, acked=False)
+
+    def modify_ack_deadline(self, seconds: int) -> None:
+        pass
+
+
+class FakeStreamingPullFuture:
+    def __init__(self) -> None:
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def done(self) -> bool:
+        return self._cancelled.is_set()
+
+    def result(self, timeout: float | None = None) -> None:
+        self._cancelled.wait(timeout)
+
+    def exception(self, timeout: float | None = None) -> None:
+        return None
+
+
+class FakeSubscriberClient:
+    # Streaming-pull stand-in: a dispatcher thread hands published messages to
+    # the callback while fewer than flow_control.max_messages are outstanding.
+    # Nacked messages go back on the queue, like a redelivery.
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._queue: list[FakeMessage] = []
+        self._next_id = 0
+        self.outstanding = 0
+        self.peak_outstanding = 0
+        self.acked: list[str] = []
+        self.nacked: list[str] = []
+
+    def publish(self, data: bytes) -> str:
+        with self._condition:
+            self._next_id += 1
+            message_id = str(self._next_id)
+            self._queue.append(FakeMessage(self, message_id, data))
+            self._condition.notify_all()
+        return message_id
+
+    def settle(self, message: FakeMessage, acked: bool) -> None:
+        with self._condition:
+            self.outstanding -= 1
+            if acked:
+                self.acked.append(message.message_id)
+            else:
+                self.nacked.append(message.message_id)
+                self._queue.append(message)
+            self._condition.notify_all()
+
+    def wait_for_acks(self, count: int, timeout: float | None = None) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: len(self.acked) >= count, timeout)
+
+    def subscribe(
+        self,
+        subscription: str,
+        callback: Any,
+        flow_control: Any = None,
+    ) -> FakeStreamingPullFuture:
+        future = FakeStreamingPullFuture()
+        max_messages = getattr(flow_control, "max_messages", 0) or sys.maxsize
+
+        def _dispatch() -> None:
+            while not future.cancelled():
+                with self._condition:
+                    ready = self._condition.wait_for(
+                        lambda: future.cancelled()
+                        or (self._queue and self.outstanding < max_messages),
+                        timeout=0.1,
+                    )
+                    if not ready or future.cancelled():
+                        continue
+                    message = self._queue.pop(0)
+                    self.outstanding += 1
+                    self.peak_outstanding = max(self.peak_outstanding, self.outstanding)
+                callback(message)
+
+        threading.Thread(target=_dispatch, daemon=True).start()
+        return future
+
+
+# ---------------------------------------------------------------------------
+# hugo / firebase executables
+
+_HUGO_STUB = """
+import os, shutil, sys, time
+from pathlib import Path
+
+seconds = float(os.environ.get("FAKE_HUGO_SECONDS", "0"))
+if os.environ.get("FAKE_HUGO_CPU") == "1":
+    # Burn CPU like a real render instead of sleeping, so concurrent renders
+    # compete for cores.
+    while time.process_time() < seconds:
+        pass
+else:
+    time.sleep(seconds)
+root = Path.cwd()
+public = root / "public"
+for top in ("content",):
+    for path in (root / top).rglob("*.md"):
+        rel = path.relative_to(root / top).with_suffix("")
+        target = public / rel / "index.html"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text("<html>" + path.read_text(encoding="utf-8") + "</html>")
+for static_root in (root / "static", root / "themes" / "gymnastics" / "static"):
+    if static_root.exists():
+        shutil.copytree(static_root, public, dirs_exist_ok=True)
+"""
+
+_FIREBASE_STUB = """
+import os, sys, time
+
+time.sleep(float(os.environ.get("FAKE_FIREBASE_SECONDS", "0")))
+if os.environ.get("FAKE_FIREBASE_LOG"):
+    with open(os.environ["FAKE_FIREBASE_LOG"], "a", encoding="utf-8") as log:
+        log.write(sys.argv[1] + "\\n")
+if "hosting:sites:create" in sys.argv:
+    print("Site already exists", file=sys.stderr)
+    sys.exit(1)
+"""
+
+
+def install_stub_executables(bin_dir: Path) -> None:
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for name, body in (("hugo", _HUGO_STUB), ("firebase", _FIREBASE_STUB)):
+        script = bin_dir / name
+        script.write_text(
+            f"#!{sys.executable}\n" + textwrap.dedent(body).lstrip(), encoding="utf-8"
+        )
+        script.chmod(script.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import random
+import tarfile
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from vertical_builder.benchmarks.fakes import FakeStorageClient
+
+
+EVENTS = ("vault", "pommel", "highbar", "rings", "pbars", "floor")
+
+
+def _score(rng: random.Random) -> dict[str, Any]:
+    execution = round(rng.uniform(5.0, 9.5), 1)
+    difficulty = round(rng.uniform(3.0, 6.5), 1)
+    return {
+        "execution": execution,
+        "difficulty": difficulty,
+        "total": round(execution + difficulty, 2),
+        "placement": rng.randint(1, 12),
+    }
+
+
+def score_records(
+    org_id: str,
+    meet_id: str,
+    gymnast_ids: list[str],
+    rng: random.Random,
+) -> list[dict[str, Any]]:
+    records = []
+    for gymnast_id in gymnast_ids:
+        events = {event: _score(rng) for event in EVENTS}
+        records.append(
+            {
+                "id": f"{org_id}_{meet_id}_{gymnast_id}_Session 1",
+                "orgId": org_id,
+                "meetId": meet_id,
+                "gymnastId": gymnast_id,
+                "session": "Session 1",
+                "division": "Development",
+                "level": rng.randint(4, 10),
+                "events": events,
+                "allAround": {
+                    "total": round(sum(e["total"] for e in events.values()), 2),
+                    "placement": rng.randint(1, 12),
+                },
+                "createdAt": "2026-02-22 00:38:09.837000+00:00",
+                "updatedAt": "2026-02-22 00:38:09.837000+00:00",
+            }
+        )
+    return records
+
+
+def export_files(
+    org_id: str,
+    gymnasts: int,
+    score_files: int,
+    images: int,
+    image_bytes: int = 64 * 1024,
+    seed: int = 0,
+    roster: int = 12,
+) -> dict[str, bytes]:
+    # Page data sits in the JSON block content_model.html reads; score records
+    # are exported as data/scores only.
+    rng = random.Random(f"{org_id}:{seed}")
+    gymnast_ids = [f"g{index:05d}" for index in range(gymnasts)]
+    files: dict[str, bytes] = {
+        "content/_index.md": b"---\ntitle: Home\n---\n",
+        "content/gymnasts/_index.md": b"---\ntitle: Gymnasts\n---\n",
+        "content/meets/_index.md": b"---\ntitle: Meets\n---\n",
+        "data/org.json": json.dumps({"orgId": org_id, "name": org_id}).encode(),
+    }
+    for index in range(score_files):
+        meet_id = f"m{index:05d}"
+        competing = rng.sample(gymnast_ids, k=min(len(gymnast_ids), roster))
+        records = score_records(org_id, meet_id, competing, rng)
+        meet = {
+            "meetId": meet_id,
+            "startDate": str((datetime(2026, 1, 1) + timedelta(days=index % 365)).date()),
+        }
+        files[f"content/meets/{meet_id}.md"] = (
+            f"---\ntitle: Meet {meet_id}\n---\n{json.dumps(meet)}\n"
+        ).encode()
+        files[f"data/scores/{meet_id}.json"] = json.dumps(records, indent=2).encode()
+    for gymnast_id in gymnast_ids:
+        gymnast = {"gymnastId": gymnast_id}
+        files[f"content/gymnasts/{gymnast_id}.md"] = (
+            f"---\ntitle: Gymnast {gymnast_id}\n---\n{json.dumps(gymnast)}\n"
+        ).encode()
+    for index in range(images):
+        files[f"static/images/photo{index:05d}.jpg"] = rng.randbytes(image_bytes)
+    return files
+
+
+def pack_export_archive(files: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz", compresslevel=6) as archive:
+        for name in sorted(files):
+            info = tarfile.TarInfo(name)
+            info.size = len(files[name])
+            archive.addfile(info, io.BytesIO(files[name]))
+    return buffer.getvalue()
+
+
+def publish_export(
+    storage_client: FakeStorageClient,
+    bucket: str,
+    payload: dict[str, Any],
+    files: dict[str, bytes],
+    generated_at: datetime | None = None,
+    archive: bool = False,
+    per_blob: bool = True,
+    file_digests: bool = False,
+) -> dict[str, Any]:
+    content = hashlib.sha256()
+    assets = hashlib.sha256()
+    for name in sorted(files):
+        target = assets if name.startswith("static/") else content
+        target.update(name.encode() + b"\0" + files[name])
+    generated = generated_at or datetime.now(timezone.utc)
+    manifest = {
+        "exportId": payload["exportId"],
+        "orgId": payload["orgId"],
+        "verticalKey": payload["verticalKey"],
+        "templateKey": payload["templateKey"],
+        "env": payload["env"],
+        "generatedAt": generated.isoformat(),
+        "sourceUpdatedAt": (generated - timedelta(minutes=1)).isoformat(),
+        "contentHash": content.hexdigest(),
+        "assetHash": assets.hexdigest(),
+        "files": {
+            "markdownCount": sum(1 for name in files if name.endswith(".md")),
+            "assetCount": sum(1 for name in files if name.startswith("static/")),
+        },
+    }
+    if file_digests:
+        manifest["fileDigests"] = {
+            name: hashlib.sha256(data).hexdigest() for name, data in files.items()
+        }
+    prefix = (
+        f"orgs/{payload['orgId']}/verticals/{payload['verticalKey']}/"
+        f"exports/{payload['exportId']}"
+    )
+    if per_blob:
+        for name, data in files.items():
+            storage_client.put(bucket, f"{prefix}/{name}", data)
+    if archive:
+        storage_client.put(bucket, f"{prefix}/snapshot.tar.gz", pack_export_archive(files))
+    storage_client.put(bucket, f"{prefix}/manifest.json", json.dumps(manifest).encode())
+    return manifest
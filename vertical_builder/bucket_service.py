@@ -1,14 +1,39 @@
 from __future__ import annotations
 
+import fcntl
+import hashlib
 import json
 import logging
+import os
 import shutil
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-from google.cloud import storage
+if TYPE_CHECKING:
+    from google.cloud import storage
+
+try:
+    import zstandard
+except ImportError:  # tar.zst archives are skipped without the optional dependency
+    zstandard = None
 
 LOGGER = logging.getLogger("vertical_builder")
+DOWNLOAD_WORKERS = int(os.environ.get("VERTICAL_DOWNLOAD_WORKERS", "16"))
+DOWNLOAD_MAX_ATTEMPTS = int(os.environ.get("VERTICAL_DOWNLOAD_MAX_ATTEMPTS", "3"))
+DOWNLOAD_RETRY_BASE_SECONDS = float(
+    os.environ.get("VERTICAL_DOWNLOAD_RETRY_BASE_SECONDS", "0.5")
+)
+DOWNLOAD_PROGRESS_EVERY = 500
+ARCHIVE_CHUNK_BYTES = 8 * 1024 * 1024
+HASH_CHUNK_BYTES = 1024 * 1024
+SNAPSHOT_DIRS = ("content", "data", "static")
+SNAPSHOT_INTEGRITY = os.environ.get("VERTICAL_SNAPSHOT_INTEGRITY", "warn")
+ASSEMBLY_STRATEGY = os.environ.get("VERTICAL_ASSEMBLY_STRATEGY", "auto")
+ASSEMBLY_STRATEGIES = ("reflink", "hardlink", "copy")
+_FICLONE = 0x40049409
 
 
 def validate_manifest(manifest: dict[str, Any], payload: dict[str, Any]) -> None:
@@ -60,14 +85,136 @@ def _parse_gs_uri(uri: str) -> tuple[str, str]:
     return parts[0], parts[1].rstrip("/")
 
 
-def download_snapshot(
+def fetch_manifest(
     storage_client: storage.Client,
     snapshot_uri: str,
     destination: Path,
-) -> None:
+) -> dict[str, Any] | None:
+    from google.api_core import exceptions as gcs_exceptions
+
+    bucket_name, prefix = _parse_gs_uri(snapshot_uri)
+    blob = storage_client.bucket(bucket_name).blob(f"{prefix}/manifest.json")
+    try:
+        raw = blob.download_as_bytes()
+    except gcs_exceptions.NotFound:
+        return None
+    destination.mkdir(parents=True, exist_ok=True)
+    (destination / "manifest.json").write_bytes(raw)
+    return load_manifest(destination)
+
+
+def _blob_fingerprint(blob: storage.Blob) -> dict[str, Any]:
+    return {
+        "size": blob.size,
+        "generation": blob.generation,
+        "crc32c": blob.crc32c,
+        "md5Hash": blob.md5_hash,
+    }
+
+
+def _blob_unchanged(current: dict[str, Any], previous: dict[str, Any] | None) -> bool:
+    # Every export is written under a new prefix, so generations never match
+    # across exports; content checksums are what identify an unchanged file.
+    if not previous or current["size"] != previous.get("size"):
+        return False
+    for field in ("crc32c", "md5Hash"):
+        if current[field] and current[field] == previous.get(field):
+            return True
+    return False
+
+
+def _link_or_copy(src: Path, dst: Path) -> bool:
+    try:
+        os.link(src, dst)
+    except FileNotFoundError:
+        return False
+    except OSError:
+        shutil.copy2(src, dst)
+    return True
+
+
+class _HashingWriter:
+    # Write-only file wrapper that hashes bytes on their way to disk, so the
+    # snapshot is verified without reading it back. The client library only
+    # seeks to 0 when it restarts a download from scratch.
+
+    def __init__(self, handle) -> None:
+        self._handle = handle
+        self._digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self._digest.update(data)
+        self.size += len(data)
+        return self._handle.write(data)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        if offset != 0 or whence != 0:
+            raise OSError("Only rewinding to the start is supported")
+        self._digest = hashlib.sha256()
+        self.size = 0
+        self._handle.seek(0)
+        self._handle.truncate()
+        return 0
+
+    def tell(self) -> int:
+        return self.size
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
+
+
+def _hash_file(path: Path) -> tuple[int, str]:
+    digest = hashlib.sha256()
+    size = 0
+    with path.open("rb") as handle:
+        while chunk := handle.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
+
+
+def _download_blob(blob: storage.Blob, target: Path) -> tuple[int, str]:
+    attempt = 1
+    while True:
+        try:
+            with target.open("wb") as handle:
+                writer = _HashingWriter(handle)
+                blob.download_to_file(writer)
+            return writer.size, writer.hexdigest()
+        except Exception:  # pylint: disable=broad-except
+            if attempt >= DOWNLOAD_MAX_ATTEMPTS:
+                raise
+            delay = DOWNLOAD_RETRY_BASE_SECONDS * (2 ** (attempt - 1))
+            LOGGER.warning(
+                "Retrying blob download name=%s attempt=%d delaySeconds=%.2f",
+                blob.name,
+                attempt,
+                delay,
+            )
+            time.sleep(delay)
+            attempt += 1
+
+
+def list_snapshot_blobs(storage_client: storage.Client, snapshot_uri: str) -> list[storage.Blob]:
     bucket_name, prefix = _parse_gs_uri(snapshot_uri)
     bucket = storage_client.bucket(bucket_name)
-    blobs = list(storage_client.list_blobs(bucket, prefix=prefix + "/"))
+    return list(storage_client.list_blobs(bucket, prefix=prefix + "/"))
+
+
+def download_snapshot(
+    storage_client: storage.Client,
+    snapshot_uri: str,
+    destination: Path,
+    max_workers: int | None = None,
+    baseline: tuple[dict[str, Any], Path] | None = None,
+    stats: dict[str, Any] | None = None,
+    blobs: list[storage.Blob] | None = None,
+) -> dict[str, Any]:
+    # Callers that time the listing separately pass the listed blobs in.
+    bucket_name, prefix = _parse_gs_uri(snapshot_uri)
+    if blobs is None:
+        blobs = list_snapshot_blobs(storage_client, snapshot_uri)
     LOGGER.info(
         "Downloading snapshot from bucket=%s prefix=%s blobCount=%d",
         bucket_name,
@@ -81,6 +228,12 @@ def download_snapshot(
         )
     sample = [blob.name for blob in blobs[:10]]
     LOGGER.info("Snapshot blob sample: %s", sample)
+
+    previous_index, previous_root = baseline if baseline else ({}, destination)
+    index: dict[str, Any] = {}
+    reused = 0
+    # Create every directory up front so workers only ever write files.
+    downloads: list[tuple[storage.Blob, Path, str]] = []
     for blob in blobs:
         rel = Path(blob.name).relative_to(prefix)
         target = destination / rel
@@ -88,11 +241,225 @@ def download_snapshot(
             target.mkdir(parents=True, exist_ok=True)
             continue
         target.parent.mkdir(parents=True, exist_ok=True)
-        blob.download_to_filename(str(target))
+        fingerprint = _blob_fingerprint(blob)
+        index[rel.as_posix()] = fingerprint
+        previous = previous_index.get(rel.as_posix())
+        if _blob_unchanged(fingerprint, previous) and _link_or_copy(
+            previous_root / rel, target
+        ):
+            # Baselines written before digests were recorded get hashed once.
+            fingerprint["sha256"] = previous.get("sha256") or _hash_file(target)[1]
+            reused += 1
+            continue
+        downloads.append((blob, target, rel.as_posix()))
+    if baseline:
+        LOGGER.info(
+            "Snapshot delta reused=%d changed=%d deleted=%d",
+            reused,
+            len(downloads),
+            len(set(previous_index) - set(index)),
+        )
+
+    workers = max(1, min(max_workers or DOWNLOAD_WORKERS, len(downloads) or 1))
+    started = time.monotonic()
+    total_bytes = 0
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_download_blob, blob, target): rel
+            for blob, target, rel in downloads
+        }
+        try:
+            for future in as_completed(futures):
+                size, digest = future.result()
+                index[futures[future]]["sha256"] = digest
+                total_bytes += size
+                done += 1
+                if done % DOWNLOAD_PROGRESS_EVERY == 0:
+                    LOGGER.info(
+                        "Snapshot download progress files=%d/%d bytes=%d",
+                        done,
+                        len(downloads),
+                        total_bytes,
+                    )
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    LOGGER.info(
+        "Snapshot downloaded files=%d bytes=%d workers=%d seconds=%.2f "
+        "filesPerSecond=%.1f bytesPerSecond=%.0f",
+        done,
+        total_bytes,
+        workers,
+        elapsed,
+        done / elapsed,
+        total_bytes / elapsed,
+    )
+    if stats is not None:
+        stats.update(
+            {
+                "files": done,
+                "bytes": total_bytes,
+                "reused": reused,
+            }
+        )
+    return index
+
 
+def snapshot_inventory(index: dict[str, Any]) -> dict[str, dict[str, Any]]:
+    return {
+        rel: {"size": entry["size"], "sha256": entry["sha256"]}
+        for rel, entry in index.items()
+        if rel.split("/", 1)[0] in SNAPSHOT_DIRS
+    }
 
-def validate_snapshot_layout(snapshot_root: Path) -> None:
-    required_dirs = ("content", "data", "static")
+
+def hash_snapshot_tree(snapshot_root: Path) -> dict[str, dict[str, Any]]:
+    inventory: dict[str, dict[str, Any]] = {}
+    for top in SNAPSHOT_DIRS:
+        for path in (snapshot_root / top).rglob("*"):
+            if path.is_file():
+                size, digest = _hash_file(path)
+                inventory[path.relative_to(snapshot_root).as_posix()] = {
+                    "size": size,
+                    "sha256": digest,
+                }
+    return inventory
+
+
+def inventory_counts(inventory: dict[str, Any]) -> dict[str, int]:
+    counts = {top: 0 for top in SNAPSHOT_DIRS}
+    for rel in inventory:
+        top = rel.split("/", 1)[0]
+        if top in counts:
+            counts[top] += 1
+    return counts
+
+
+def _strip_digest_prefix(value: Any) -> str:
+    return str(value).removeprefix("sha256:")
+
+
+def verify_snapshot_inventory(
+    manifest: dict[str, Any],
+    inventory: dict[str, Any],
+) -> dict[str, Any]:
+    # Only per-file digests are checked: the exporter does not define how
+    # contentHash/assetHash are computed, so those stay opaque cache keys.
+    if SNAPSHOT_INTEGRITY == "off":
+        return {"integrity": "off"}
+    digests = manifest.get("fileDigests")
+    if not isinstance(digests, dict):
+        return {"integrity": SNAPSHOT_INTEGRITY, "files": len(inventory), "fileDigests": 0}
+    problems: list[str] = []
+    for rel, expected in sorted(digests.items()):
+        entry = inventory.get(rel)
+        if entry is None:
+            problems.append(f"missing {rel}")
+        elif entry["sha256"] != _strip_digest_prefix(expected):
+            problems.append(f"digest mismatch {rel}")
+    problems.extend(f"unlisted {rel}" for rel in sorted(set(inventory) - set(digests)))
+
+    result: dict[str, Any] = {
+        "integrity": SNAPSHOT_INTEGRITY,
+        "files": len(inventory),
+        "fileDigests": len(digests),
+        "verified": not problems,
+    }
+    if problems:
+        message = "Snapshot integrity check failed: " + "; ".join(problems[:10])
+        if SNAPSHOT_INTEGRITY == "strict":
+            raise RuntimeError(message)
+        LOGGER.warning(message)
+        result["problems"] = problems[:10]
+    return result
+
+
+def _safe_member_target(destination: Path, member: tarfile.TarInfo) -> Path | None:
+    if not (member.isfile() or member.isdir()):
+        raise RuntimeError(f"Snapshot archive member type not allowed: {member.name}")
+    rel = Path(member.name)
+    if rel.is_absolute() or ".." in rel.parts:
+        raise RuntimeError(f"Snapshot archive member escapes snapshot: {member.name}")
+    if rel == Path("."):
+        return None
+    target = (destination / rel).resolve()
+    if not target.is_relative_to(destination.resolve()):
+        raise RuntimeError(f"Snapshot archive member escapes snapshot: {member.name}")
+    return target
+
+
+def _open_archive_stream(blob: storage.Blob, name: str):
+    raw = blob.open("rb", chunk_size=ARCHIVE_CHUNK_BYTES)
+    if name.endswith(".tar.zst"):
+        stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return tarfile.open(fileobj=stream, mode="r|"), stream
+    return tarfile.open(fileobj=raw, mode="r|gz"), raw
+
+
+def download_snapshot_archive(
+    storage_client: storage.Client,
+    snapshot_uri: str,
+    destination: Path,
+    inventory: dict[str, dict[str, Any]] | None = None,
+) -> dict[str, Any] | None:
+    bucket_name, prefix = _parse_gs_uri(snapshot_uri)
+    bucket = storage_client.bucket(bucket_name)
+    names = ["snapshot.tar.gz"]
+    if zstandard is not None:
+        names.insert(0, "snapshot.tar.zst")
+    for name in names:
+        blob = bucket.get_blob(f"{prefix}/{name}")
+        if blob is not None:
+            break
+    else:
+        return None
+
+    started = time.monotonic()
+    files = 0
+    total_bytes = 0
+    # Members are extracted one at a time straight off the network stream;
+    # nothing is spooled to a temp file.
+    archive, stream = _open_archive_stream(blob, name)
+    resolved_root = destination.resolve()
+    with stream, archive:
+        for member in archive:
+            target = _safe_member_target(destination, member)
+            if target is None:
+                continue
+            if member.isdir():
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            source = archive.extractfile(member)
+            with target.open("wb") as handle:
+                writer = _HashingWriter(handle)
+                shutil.copyfileobj(source, writer, ARCHIVE_CHUNK_BYTES)
+            rel = target.relative_to(resolved_root).as_posix()
+            if inventory is not None and rel.split("/", 1)[0] in SNAPSHOT_DIRS:
+                inventory[rel] = {"size": writer.size, "sha256": writer.hexdigest()}
+            files += 1
+            total_bytes += member.size
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    LOGGER.info(
+        "Snapshot archive extracted object=%s files=%d bytes=%d seconds=%.2f",
+        name,
+        files,
+        total_bytes,
+        elapsed,
+    )
+    return {"archive": name, "files": files, "bytes": total_bytes}
+
+
+def validate_snapshot_layout(
+    snapshot_root: Path,
+    inventory: dict[str, Any] | None = None,
+) -> None:
+    required_dirs = SNAPSHOT_DIRS
     missing = [name for name in required_dirs if not (snapshot_root / name).exists()]
     if missing:
         raise RuntimeError(
@@ -101,9 +468,13 @@ def validate_snapshot_layout(snapshot_root: Path) -> None:
             + ". Expected content/, data/, static/."
         )
 
+    counts = inventory_counts(inventory) if inventory is not None else None
     empty = []
     for name in required_dirs:
-        file_count = sum(1 for p in (snapshot_root / name).rglob("*") if p.is_file())
+        if counts is not None:
+            file_count = counts[name]
+        else:
+            file_count = sum(1 for p in (snapshot_root / name).rglob("*") if p.is_file())
         LOGGER.info("Snapshot %s fileCount=%d", name, file_count)
         if file_count == 0:
             empty.append(name)
@@ -126,6 +497,70 @@ def load_manifest(snapshot_root: Path) -> dict[str, Any]:
     return manifest
 
 
+def _reflink_file(src: Path, dst: Path) -> None:
+    with src.open("rb") as src_handle, dst.open("wb") as dst_handle:
+        try:
+            fcntl.ioctl(dst_handle.fileno(), _FICLONE, src_handle.fileno())
+        except OSError:
+            dst.unlink(missing_ok=True)
+            raise
+    shutil.copystat(src, dst)
+
+
+def _place_file(src: Path, dst: Path, strategies: list[str]) -> str:
+    while True:
+        strategy = strategies[0]
+        try:
+            if strategy == "reflink":
+                _reflink_file(src, dst)
+            elif strategy == "hardlink":
+                os.link(src, dst)
+            else:
+                shutil.copy2(src, dst)
+            return strategy
+        except OSError:
+            if strategy == "copy":
+                raise
+            # The filesystem refused this strategy once; don't retry it per file.
+            strategies.pop(0)
+
+
+def materialize_tree(
+    src: Path,
+    dst: Path,
+    strategy: str | None = None,
+) -> dict[str, int]:
+    chosen = strategy or ASSEMBLY_STRATEGY
+    if chosen == "auto":
+        strategies = list(ASSEMBLY_STRATEGIES)
+    elif chosen in ASSEMBLY_STRATEGIES:
+        strategies = list(ASSEMBLY_STRATEGIES[ASSEMBLY_STRATEGIES.index(chosen) :])
+    else:
+        raise ValueError(f"Unknown assembly strategy: {chosen}")
+
+    stats = {name: 0 for name in ASSEMBLY_STRATEGIES}
+    stats["bytesCopied"] = 0
+    for dirpath, _dirnames, filenames in os.walk(src):
+        src_dir = Path(dirpath)
+        dst_dir = dst / src_dir.relative_to(src)
+        dst_dir.mkdir(parents=True, exist_ok=True)
+        for filename in filenames:
+            src_file = src_dir / filename
+            dst_file = dst_dir / filename
+            if dst_file.exists() or dst_file.is_symlink():
+                dst_file.unlink()
+            used = _place_file(src_file, dst_file, strategies)
+            stats[used] += 1
+            if used == "copy":
+                stats["bytesCopied"] += dst_file.stat().st_size
+    return stats
+
+
+def _merge_stats(total: dict[str, int], stats: dict[str, int]) -> None:
+    for key, value in stats.items():
+        total[key] = total.get(key, 0) + value
+
+
 def assemble_workspace(
     *,
     payload: dict[str, Any],
@@ -133,14 +568,15 @@ def assemble_workspace(
     workspace: Path,
     themes_root: Path,
     base_config_path: Path,
-) -> None:
+) -> dict[str, int]:
     workspace.mkdir(parents=True, exist_ok=True)
+    stats: dict[str, int] = {}
 
     for top in ("content", "data", "static"):
         src = snapshot_root / top
         dst = workspace / top
         if src.exists():
-            shutil.copytree(src, dst, dirs_exist_ok=True)
+            _merge_stats(stats, materialize_tree(src, dst))
         else:
             dst.mkdir(parents=True, exist_ok=True)
 
@@ -149,7 +585,17 @@ def assemble_workspace(
             f"Unsupported templateKey={payload['templateKey']}. Expected gymnastics."
         )
 
+    # The theme is shared read-only between workspaces as a link farm; Hugo
+    # never writes into themes/, so no job can affect another through it.
     theme_src = themes_root / "gymnastics"
     theme_dst = workspace / "themes" / "gymnastics"
-    shutil.copytree(theme_src, theme_dst, dirs_exist_ok=True)
+    _merge_stats(stats, materialize_tree(theme_src, theme_dst))
     shutil.copy2(base_config_path, workspace / "config.yaml")
+    LOGGER.info(
+        "Workspace assembly reflinked=%d hardlinked=%d copied=%d bytesCopied=%d",
+        stats["reflink"],
+        stats["hardlink"],
+        stats["copy"],
+        stats["bytesCopied"],
+    )
+    return stats
@@ -1,35 +1,88 @@
 from __future__ import annotations
 
 import logging
-import os
 import shutil
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-from google.cloud import firestore
-from google.cloud import storage
+if TYPE_CHECKING:
+    from google.cloud import firestore
+    from google.cloud import storage
 
+from vertical_builder.artifact_service import (
+    artifacts_enabled,
+    fetch_public_artifact,
+    find_public_artifact,
+    store_public_artifact,
+    theme_version,
+)
+from vertical_builder.asset_service import optimize_assets
 from vertical_builder.bucket_service import (
     assemble_workspace,
     download_snapshot,
+    download_snapshot_archive,
+    fetch_manifest,
+    inventory_counts,
+    list_snapshot_blobs,
     load_manifest,
+    materialize_tree,
+    snapshot_inventory,
     validate_snapshot_layout,
     validate_manifest,
+    verify_snapshot_inventory,
 )
+from vertical_builder.client_service import get_firestore_client, get_storage_client
 from vertical_builder.config import RuntimeConfig
+from vertical_builder.deploy_manifest_service import (
+    diff_public_manifests,
+    get_deployed_site,
+    hash_public_tree,
+    load_deployed_manifest,
+    record_unchanged_deploy,
+    save_deployed_manifest,
+)
 from vertical_builder.deploy_service import deploy_hosting, run_hugo_minify
-from vertical_builder.lock_service import acquire_lock, release_lock
-from vertical_builder.receipt_service import write_receipt, write_receipt_status
+from vertical_builder.export_state_service import (
+    StaleBuildError,
+    ensure_not_stale,
+    recently_deployed_job_id,
+    remember_deployed,
+)
+from vertical_builder.hugo_cache_service import (
+    evict_hugo_cache,
+    hugo_cache_dir,
+    restore_hugo_resources,
+    save_hugo_resources,
+)
+from vertical_builder.lock_service import (
+    LockLease,
+    acquire_lock,
+    ensure_lock_held,
+    release_lock,
+)
+from vertical_builder.metrics_service import StageTimer, increment, observe
+from vertical_builder.pipeline_service import phase_slot
+from vertical_builder.receipt_service import (
+    get_receipt,
+    write_receipt,
+    write_receipt_status,
+)
+from vertical_builder.workspace_service import (
+    local_output_dir,
+    prepare_run_dirs,
+    release_run_dirs,
+)
+from vertical_builder.snapshot_cache_service import (
+    load_snapshot_baseline,
+    restore_snapshot,
+    save_snapshot_baseline,
+    snapshot_cache_key,
+    store_snapshot,
+)
 
 
 LOGGER = logging.getLogger("vertical_builder")
-WORKSPACE_ROOT = Path(
-    os.environ.get(
-        "VERTICAL_WORKSPACE_ROOT",
-        str(Path(__file__).resolve().parent / "workspaces"),
-    )
-)
 
 
 def _utc_now() -> datetime:
@@ -63,84 +116,425 @@ def _snapshot_uri(payload: dict[str, Any], runtime: RuntimeConfig) -> str:
     )
 
 
-def _prepare_run_dirs(payload: dict[str, Any]) -> tuple[Path, Path, Path]:
-    run_root = WORKSPACE_ROOT / payload["jobId"]
-    snapshot_root = run_root / "snapshot"
-    workspace = run_root / "workspace"
-    shutil.rmtree(run_root, ignore_errors=True)
-    snapshot_root.mkdir(parents=True, exist_ok=True)
-    workspace.mkdir(parents=True, exist_ok=True)
-    return run_root, snapshot_root, workspace
+def _fetch_snapshot(
+    storage_client: storage.Client,
+    payload: dict[str, Any],
+    snapshot_uri: str,
+    snapshot_root: Path,
+    timer: StageTimer,
+) -> tuple[dict[str, Any], dict[str, Any] | None]:
+    with timer.stage("manifest"):
+        manifest = fetch_manifest(storage_client, snapshot_uri, snapshot_root)
+    cache_key: str | None = None
+    snapshot_index: dict[str, Any] | None = None
+    if manifest is not None:
+        validate_manifest(manifest, payload)
+        cache_key = snapshot_cache_key(manifest)
+
+    with timer.stage("cacheRestore") as stage:
+        inventory = restore_snapshot(cache_key, snapshot_root) if cache_key else None
+        cache_hit = inventory is not None
+        stage["hit"] = cache_hit
+    if inventory is None:
+        # Filled while bytes stream in, so later stages never rescan the tree.
+        inventory = {}
+        with timer.stage("archive") as stage:
+            archive_stats = download_snapshot_archive(
+                storage_client, snapshot_uri, snapshot_root, inventory=inventory
+            )
+            stage.update(archive_stats or {"found": False})
+        if archive_stats is None:
+            baseline = load_snapshot_baseline(payload["orgId"], payload["verticalKey"])
+            with timer.stage("list") as stage:
+                blobs = list_snapshot_blobs(storage_client, snapshot_uri)
+                stage["files"] = len(blobs)
+            download_stats: dict[str, Any] = {}
+            with timer.stage("download") as stage:
+                snapshot_index = download_snapshot(
+                    storage_client,
+                    snapshot_uri,
+                    snapshot_root,
+                    baseline=baseline,
+                    stats=download_stats,
+                    blobs=blobs,
+                )
+                stage.update(
+                    files=download_stats["files"],
+                    bytes=download_stats["bytes"],
+                    reused=download_stats["reused"],
+                )
+            inventory = snapshot_inventory(snapshot_index)
+    with timer.stage("validate") as stage:
+        validate_snapshot_layout(snapshot_root, inventory)
+        if not cache_hit:
+            manifest = load_manifest(snapshot_root)
+            validate_manifest(manifest, payload)
+        stage.update(verify_snapshot_inventory(manifest, inventory))
+    if not cache_hit:
+        with timer.stage("cacheStore"):
+            store_snapshot(snapshot_cache_key(manifest), snapshot_root, inventory)
+    return inventory, snapshot_index
 
 
-def _run_build(payload: dict[str, Any], runtime: RuntimeConfig) -> bool:
+def _render_workspace(
+    db: firestore.Client,
+    payload: dict[str, Any],
+    runtime: RuntimeConfig,
+    timer: StageTimer,
+    snapshot_root: Path,
+    workspace: Path,
+    inventory: dict[str, Any],
+) -> None:
+    with timer.stage("assemble") as stage:
+        assembly = assemble_workspace(
+            payload=payload,
+            snapshot_root=snapshot_root,
+            workspace=workspace,
+            themes_root=runtime.themes_root,
+            base_config_path=runtime.base_config_path,
+        )
+        stage.update(
+            files=assembly["reflink"] + assembly["hardlink"] + assembly["copy"],
+            bytes=assembly["bytesCopied"],
+        )
+    counts = inventory_counts(inventory)
+    LOGGER.info(
+        "Assembled workspace contentFiles=%d dataFiles=%d path=%s",
+        counts["content"],
+        counts["data"],
+        workspace,
+    )
+    ensure_not_stale(db, payload, "after assembly")
+
+    with timer.stage("assets") as stage:
+        stage.update(optimize_assets(workspace, inventory) or {"optimized": False})
+
+    with timer.stage("hugo") as stage:
+        stage["resourcesRestored"] = restore_hugo_resources(payload, workspace)
+        with hugo_cache_dir(payload) as cache_dir:
+            stage["cacheDir"] = cache_dir is not None
+            run_hugo_minify(workspace, cache_dir)
+        save_hugo_resources(payload, workspace)
+    evict_hugo_cache()
+
+
+def _run_build(
+    db: firestore.Client,
+    payload: dict[str, Any],
+    runtime: RuntimeConfig,
+    timer: StageTimer,
+    result: dict[str, Any],
+) -> None:
     _hosting_project, site = _validate_build_target(payload["buildTarget"], runtime)
     snapshot_uri = _snapshot_uri(payload, runtime)
-    run_root, snapshot_root, workspace = _prepare_run_dirs(payload)
+    run_root, snapshot_root, workspace = prepare_run_dirs(payload)
     LOGGER.info("Workspace root: %s", run_root)
 
-    storage_client = storage.Client()
-    download_snapshot(storage_client, snapshot_uri, snapshot_root)
-    validate_snapshot_layout(snapshot_root)
+    # Each phase takes a slot of its own bounded pool, so this job's download
+    # overlaps other jobs' Hugo runs and deploys instead of queueing behind
+    # them. Staleness is checked again after every wait for a slot.
+    with phase_slot("fetch", timer):
+        ensure_not_stale(db, payload, "before download")
+        storage_client = get_storage_client()
+        inventory, snapshot_index = _fetch_snapshot(
+            storage_client, payload, snapshot_uri, snapshot_root, timer
+        )
+
+    with phase_slot("render", timer):
+        ensure_not_stale(db, payload, "after download")
+        _render_workspace(
+            db, payload, runtime, timer, snapshot_root, workspace, inventory
+        )
+        if site == "local":
+            ensure_not_stale(db, payload, "before deploy")
+            ensure_lock_held(payload, "before deploy")
+            local_output = local_output_dir(payload)
+            local_output.parent.mkdir(parents=True, exist_ok=True)
+            shutil.rmtree(local_output, ignore_errors=True)
+            with timer.stage("localOutput"):
+                materialize_tree(workspace / "public", local_output)
+            LOGGER.info("Local build output written to %s", local_output)
+        else:
+            with timer.stage("hashPublic") as stage:
+                tree_hash, files = hash_public_tree(workspace / "public")
+                stage["files"] = len(files)
 
-    manifest = load_manifest(snapshot_root)
-    validate_manifest(manifest, payload)
+    if site != "local":
+        try:
+            with phase_slot("deploy", timer):
+                ensure_not_stale(db, payload, "before deploy")
+                ensure_lock_held(payload, "before deploy")
+                result.update(
+                    _deploy_public(db, payload, runtime, timer, site, workspace, tree_hash, files)
+                )
+        except StaleBuildError:
+            raise
+        except Exception:
+            # A failed deploy is stored, so it can be retried without a rebuild.
+            if artifacts_enabled():
+                result["artifact"] = _store_artifact(
+                    storage_client, payload, runtime, run_root, workspace, tree_hash, files, timer
+                )
+            raise
+        # Packed and uploaded after the deploy slot is released, so it never
+        # holds up another job's deploy.
+        if artifacts_enabled():
+            result["artifact"] = _store_artifact(
+                storage_client, payload, runtime, run_root, workspace, tree_hash, files, timer
+            )
 
-    assemble_workspace(
-        payload=payload,
-        snapshot_root=snapshot_root,
-        workspace=workspace,
-        themes_root=runtime.themes_root,
-        base_config_path=runtime.base_config_path,
+    if snapshot_index is not None:
+        save_snapshot_baseline(
+            payload["orgId"], payload["verticalKey"], snapshot_root, snapshot_index
+        )
+
+
+def _store_artifact(
+    storage_client: storage.Client,
+    payload: dict[str, Any],
+    runtime: RuntimeConfig,
+    run_root: Path,
+    workspace: Path,
+    tree_hash: str,
+    files: dict[str, str],
+    timer: StageTimer,
+) -> dict[str, Any] | None:
+    with timer.stage("artifactStore") as stage:
+        try:
+            artifact = store_public_artifact(
+                storage_client,
+                runtime.export_bucket,
+                payload,
+                workspace / "public",
+                tree_hash,
+                len(files),
+                theme_version(
+                    runtime.themes_root, payload["templateKey"], runtime.base_config_path
+                ),
+                run_root,
+            )
+        except Exception:  # pylint: disable=broad-except
+            # The site can still be deployed; only the fast redeploy is lost.
+            LOGGER.exception("Artifact not stored for jobId=%s", payload["jobId"])
+            stage["stored"] = False
+            return None
+        stage.update(stored=True, uploaded=artifact["uploaded"], bytes=artifact["bytes"])
+    return artifact
+
+
+def _deploy_public(
+    db: firestore.Client,
+    payload: dict[str, Any],
+    runtime: RuntimeConfig,
+    timer: StageTimer,
+    site: str,
+    workspace: Path,
+    tree_hash: str,
+    files: dict[str, str],
+) -> dict[str, Any]:
+    live_hash, live_files = load_deployed_manifest(
+        db, payload, runtime.firebase_project, site
     )
-    content_count = sum(1 for p in (workspace / "content").rglob("*") if p.is_file())
-    data_count = sum(1 for p in (workspace / "data").rglob("*") if p.is_file())
-    LOGGER.info(
-        "Assembled workspace contentFiles=%d dataFiles=%d path=%s",
-        content_count,
-        data_count,
-        workspace,
+    result: dict[str, Any] = {
+        "treeHash": tree_hash,
+        "deployDiff": diff_public_manifests(live_files, files),
+    }
+    if tree_hash == live_hash:
+        LOGGER.info(
+            "Deploy skipped, public/ unchanged site=%s treeHash=%s", site, tree_hash
+        )
+        result["deploySkipped"] = True
+        record_unchanged_deploy(db, payload, site)
+        return result
+    with timer.stage("deploy") as stage:
+        stage["siteCreated"] = deploy_hosting(
+            workspace, site, runtime.firebase_project, db
+        )
+    save_deployed_manifest(
+        db,
+        payload,
+        runtime.firebase_project,
+        site,
+        tree_hash,
+        files,
+        _utc_now(),
     )
+    return result
+
+
+def _run_artifact_deploy(
+    db: firestore.Client,
+    payload: dict[str, Any],
+    runtime: RuntimeConfig,
+    timer: StageTimer,
+    result: dict[str, Any],
+) -> None:
+    # Redeploys the stored public/ of payload["exportId"] without downloading
+    # the snapshot or running Hugo: rollbacks and retries of failed deploys.
+    _hosting_project, site = _validate_build_target(payload["buildTarget"], runtime)
+    if not artifacts_enabled():
+        raise RuntimeError("deployArtifact needs VERTICAL_ARTIFACT_STORE to be enabled")
+    run_root, _snapshot_root, workspace = prepare_run_dirs(payload)
+    LOGGER.info("Workspace root: %s", run_root)
+    # Only the fetch and deploy phases apply; there is nothing to render.
+    with phase_slot("fetch", timer):
+        ensure_not_stale(db, payload, "before download")
+
+        storage_client = get_storage_client()
+        with timer.stage("artifactFetch") as stage:
+            artifact = find_public_artifact(
+                storage_client,
+                runtime.export_bucket,
+                payload,
+                theme_version(
+                    runtime.themes_root, payload["templateKey"], runtime.base_config_path
+                ),
+            )
+            if artifact is None:
+                raise RuntimeError(
+                    f"No stored artifact for exportId={payload['exportId']}; a full build is needed"
+                )
+            stage.update(
+                fetch_public_artifact(
+                    storage_client, runtime.export_bucket, artifact, workspace / "public"
+                )
+            )
+        with timer.stage("hashPublic") as stage:
+            tree_hash, files = hash_public_tree(workspace / "public")
+            stage["files"] = len(files)
+        if tree_hash != artifact["treeHash"]:
+            raise RuntimeError(
+                f"Artifact treeHash mismatch: stored={artifact['treeHash']} restored={tree_hash}"
+            )
+    result["fromArtifact"] = True
+    result["artifact"] = {
+        "treeHash": tree_hash,
+        "themeVersion": artifact.get("themeVersion"),
+        "builtByJobId": artifact.get("jobId"),
+    }
+    with phase_slot("deploy", timer):
+        ensure_not_stale(db, payload, "before deploy")
+        ensure_lock_held(payload, "before deploy")
+        result.update(
+            _deploy_public(db, payload, runtime, timer, site, workspace, tree_hash, files)
+        )
 
-    run_hugo_minify(workspace)
-    if site == "local":
-        local_root = Path(__file__).resolve().parent / "local_output"
-        local_output = local_root / payload["jobId"]
-        local_output.parent.mkdir(parents=True, exist_ok=True)
-        shutil.rmtree(local_output, ignore_errors=True)
-        shutil.copytree(workspace / "public", local_output)
-        LOGGER.info("Local build output written to %s", local_output)
+
+def _skip_if_already_deployed(
+    db: firestore.Client,
+    payload: dict[str, Any],
+    started_at: datetime,
+) -> bool:
+    if payload["buildTarget"].get("site") == "local":
+        return False
+    if recently_deployed_job_id(payload) == payload["jobId"]:
+        LOGGER.info("Duplicate delivery skipped jobId=%s", payload["jobId"])
+        return True
+    receipt = get_receipt(db, payload)
+    if receipt and receipt.get("status") == "deployed":
+        remember_deployed(payload)
+        LOGGER.info("Duplicate delivery skipped jobId=%s", payload["jobId"])
+        return True
+    if payload.get("deployArtifact") or payload.get("rebuild"):
+        # A rollback redeploys an export that was live before, and a rebuild
+        # renders the live export again with a new theme, so only a
+        # redelivery of this same job counts as already done.
         return False
+    # Only the export live on the site right now makes the build redundant;
+    # one that was deployed earlier and since replaced is built again.
+    live = get_deployed_site(db, payload["orgId"], payload["buildTarget"]["site"])
+    if (
+        live is None
+        or live.get("verticalKey") != payload["verticalKey"]
+        or live.get("exportId") != payload["exportId"]
+    ):
+        return False
+    deployed_by = live.get("jobId")
 
-    deploy_hosting(workspace, site, runtime.firebase_project)
+    write_receipt(
+        db=db,
+        payload=payload,
+        status="deployed",
+        started_at=started_at,
+        finished_at=_utc_now(),
+        deployed_at=None,
+        error=None,
+        details={"noop": True, "deployedByJobId": deployed_by},
+    )
+    increment("vertical_builder_builds_total", result="noop")
+    LOGGER.info(
+        "Build result jobId=%s exportId=%s templateKey=%s durationMs=0 result=noop",
+        payload.get("jobId"),
+        payload.get("exportId"),
+        payload.get("templateKey"),
+    )
     return True
 
 
 def handle_build_job(payload: dict[str, Any], runtime: RuntimeConfig) -> None:
-    db = firestore.Client()
+    db = get_firestore_client()
     started_at = _utc_now()
+    try:
+        if _skip_if_already_deployed(db, payload, started_at):
+            return
+    except Exception:  # pylint: disable=broad-except
+        # The fast path only saves work: when its lookups fail the job is
+        # built as usual, so it still ends with a receipt.
+        LOGGER.exception(
+            "Already-deployed check failed for jobId=%s; building", payload.get("jobId")
+        )
     deployed_at: datetime | None = None
     status = "failed"
     error: str | None = None
-    lock_acquired = False
+    lease: LockLease | None = None
+    build_details: dict[str, Any] = {}
+    timer = StageTimer()
 
     try:
-        write_receipt_status(db, payload, "queued", started_at)
-        acquire_lock(db, payload, runtime.lock_ttl_seconds)
-        lock_acquired = True
-        write_receipt_status(db, payload, "building", started_at)
-        deployed = _run_build(payload, runtime)
-        if deployed:
-            deployed_at = _utc_now()
+        # The receipt is written in the lock transaction: building when the
+        # lock is taken, queued when the first attempt finds it held.
+        with timer.stage("lock") as stage:
+            stage.update(
+                acquire_lock(
+                    db,
+                    payload,
+                    runtime.lock_ttl_seconds,
+                    extra_writes=lambda transaction: write_receipt_status(
+                        db, payload, "building", started_at, writer=transaction
+                    ),
+                    waiting_writes=lambda transaction: write_receipt_status(
+                        db, payload, "queued", started_at, writer=transaction
+                    ),
+                    # A waiter whose export is no longer desired hands the
+                    # vertical over to the newer one instead of building.
+                    on_wait=lambda: ensure_not_stale(db, payload, "while waiting for lock"),
+                )
+            )
+        lease = LockLease(db, payload, runtime.lock_ttl_seconds).start()
+        # Filled as the build goes, so a failed receipt still names the
+        # artifact a retry can deploy from.
+        if payload.get("deployArtifact"):
+            _run_artifact_deploy(db, payload, runtime, timer, build_details)
         else:
-            deployed_at = _utc_now()
+            _run_build(db, payload, runtime, timer, build_details)
+        deployed_at = _utc_now()
+        if payload["buildTarget"].get("site") != "local":
+            remember_deployed(payload)
         status = "deployed"
+    except StaleBuildError as exc:
+        status = "stale"
+        error = str(exc)
+        LOGGER.info("Build cancelled for jobId=%s: %s", payload.get("jobId"), exc)
     except Exception as exc:  # pylint: disable=broad-except
         error = str(exc)
         LOGGER.exception("Build failed for jobId=%s", payload.get("jobId"))
     finally:
+        if lease is not None:
+            lease.stop()
+            build_details["lockRenewals"] = lease.renewals
         finished_at = _utc_now()
         duration_ms = int((finished_at - started_at).total_seconds() * 1000)
+        batch = db.batch()
         write_receipt(
             db=db,
             payload=payload,
@@ -149,9 +543,18 @@ def handle_build_job(payload: dict[str, Any], runtime: RuntimeConfig) -> None:
             finished_at=finished_at,
             deployed_at=deployed_at,
             error=error,
+            details={**build_details, "stages": timer.stages},
+            writer=batch,
         )
-        if lock_acquired:
-            release_lock(db, payload)
+        # A lost lock belongs to another job now and must not be deleted.
+        if lease is not None and lease.held:
+            release_lock(db, payload, writer=batch)
+        try:
+            batch.commit()
+        finally:
+            release_run_dirs(payload)
+        observe("vertical_builder_build_seconds", duration_ms / 1000, result=status)
+        increment("vertical_builder_builds_total", result=status)
         LOGGER.info(
             "Build result jobId=%s exportId=%s templateKey=%s durationMs=%d result=%s",
             payload.get("jobId"),
@@ -160,3 +563,31 @@ def handle_build_job(payload: dict[str, Any], runtime: RuntimeConfig) -> None:
             duration_ms,
             status,
         )
+
+
+def handle_superseded_job(
+    payload: dict[str, Any],
+    superseded_by: dict[str, Any],
+) -> None:
+    db = get_firestore_client()
+    now = _utc_now()
+    write_receipt(
+        db=db,
+        payload=payload,
+        status="superseded",
+        started_at=now,
+        finished_at=now,
+        deployed_at=None,
+        error=None,
+        details={
+            "supersededByJobId": superseded_by["jobId"],
+            "supersededByExportId": superseded_by["exportId"],
+        },
+    )
+    increment("vertical_builder_builds_total", result="superseded")
+    LOGGER.info(
+        "Build result jobId=%s exportId=%s templateKey=%s durationMs=0 result=superseded",
+        payload.get("jobId"),
+        payload.get("exportId"),
+        payload.get("templateKey"),
+    )
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from google.cloud import firestore
+    from google.cloud import storage
+
+
+LOGGER = logging.getLogger("vertical_builder")
+HTTP_POOL_SIZE = int(os.environ.get("VERTICAL_HTTP_POOL_SIZE", "64"))
+WARMUP_ENABLED = os.environ.get("VERTICAL_WARMUP", "1") == "1"
+
+_CLIENT_LOCK = threading.Lock()
+_WARMUP_LOCK = threading.Lock()
+_WARMUP_STARTED = False
+_STORAGE_CLIENT: storage.Client | None = None
+_FIRESTORE_CLIENT: firestore.Client | None = None
+
+# The Google client libraries dominate import time, so they are imported on
+# first use rather than when the HTTP entry point loads.
+
+
+def _widen_http_pool(client: storage.Client) -> None:
+    # requests keeps 10 connections per host by default, fewer than the blob
+    # download workers of a few concurrent builds; the overflow would be opened
+    # and discarded on every burst instead of being reused.
+    import requests
+
+    session = getattr(client, "_http", None)
+    if isinstance(session, requests.Session):
+        session.mount(
+            "https://",
+            requests.adapters.HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE),
+        )
+
+
+def get_storage_client() -> storage.Client:
+    global _STORAGE_CLIENT  # pylint: disable=global-statement
+    from google.cloud import storage
+
+    with _CLIENT_LOCK:
+        if _STORAGE_CLIENT is None:
+            _STORAGE_CLIENT = storage.Client()
+            _widen_http_pool(_STORAGE_CLIENT)
+        return _STORAGE_CLIENT
+
+
+def get_firestore_client() -> firestore.Client:
+    global _FIRESTORE_CLIENT  # pylint: disable=global-statement
+    from google.cloud import firestore
+
+    with _CLIENT_LOCK:
+        if _FIRESTORE_CLIENT is None:
+            _FIRESTORE_CLIENT = firestore.Client()
+        return _FIRESTORE_CLIENT
+
+
+def reset_clients() -> None:
+    global _STORAGE_CLIENT, _FIRESTORE_CLIENT  # pylint: disable=global-statement
+    with _CLIENT_LOCK:
+        _STORAGE_CLIENT = None
+        _FIRESTORE_CLIENT = None
+
+
+def _warm_up() -> None:
+    started = time.monotonic()
+    try:
+        get_firestore_client()
+        get_storage_client()
+    except Exception:  # pylint: disable=broad-except
+        # The first build creates the clients again and reports the error.
+        LOGGER.exception("Client warm-up failed")
+        return
+    LOGGER.info("Clients warmed up seconds=%.2f", time.monotonic() - started)
+
+
+def start_client_warmup() -> None:
+    # Safe to call on every request: only the first call starts the thread.
+    global _WARMUP_STARTED  # pylint: disable=global-statement
+    if _WARMUP_STARTED or not WARMUP_ENABLED:
+        return
+    with _WARMUP_LOCK:
+        if _WARMUP_STARTED:
+            return
+        _WARMUP_STARTED = True
+    threading.Thread(target=_warm_up, name="client-warmup", daemon=True).start()
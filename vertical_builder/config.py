@@ -4,6 +4,8 @@ import os
 from dataclasses import dataclass
 from pathlib import Path
 
+from vertical_builder.pipeline_service import pipeline_capacity
+
 REQUIRED_PAYLOAD_FIELDS = (
     "jobId",
     "env",
@@ -23,6 +25,7 @@ class RuntimeConfig:
     themes_root: Path
     base_config_path: Path
     lock_ttl_seconds: int
+    max_concurrent_builds: int
 
 
 def load_runtime_config() -> RuntimeConfig:
@@ -46,5 +49,10 @@ def load_runtime_config() -> RuntimeConfig:
                 str(module_root / "config" / "base-config.yaml"),
             )
         ),
-        lock_ttl_seconds=int(os.environ.get("VERTICAL_LOCK_TTL_SECONDS", "900")),
+        lock_ttl_seconds=int(os.environ.get("VERTICAL_LOCK_TTL_SECONDS", "120")),
+        # Enough build threads to keep every phase slot busy; the phase pools,
+        # not this, bound how many downloads, Hugo runs and deploys overlap.
+        max_concurrent_builds=int(
+            os.environ.get("VERTICAL_MAX_CONCURRENT_BUILDS", str(pipeline_capacity()))
+        ),
     )
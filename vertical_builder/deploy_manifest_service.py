@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from google.cloud import firestore
+
+
+LOGGER = logging.getLogger("vertical_builder")
+DEPLOY_INDEX_ROOT = Path(
+    os.environ.get(
+        "VERTICAL_DEPLOY_INDEX_ROOT",
+        str(Path(__file__).resolve().parent / "deploy_index"),
+    )
+)
+HASH_CHUNK_BYTES = 1024 * 1024
+DIFF_SAMPLE_SIZE = 20
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_public_tree(public_root: Path) -> tuple[str, dict[str, str]]:
+    files: dict[str, str] = {}
+    for path in public_root.rglob("*"):
+        if path.is_file():
+            files[path.relative_to(public_root).as_posix()] = _file_digest(path)
+    tree = hashlib.sha256()
+    for rel in sorted(files):
+        tree.update(f"{rel}\0{files[rel]}\n".encode("utf-8"))
+    return tree.hexdigest(), files
+
+
+def diff_public_manifests(
+    previous: dict[str, str] | None,
+    current: dict[str, str],
+) -> dict[str, Any]:
+    if previous is None:
+        return {"baseline": False, "fileCount": len(current)}
+    added = sorted(set(current) - set(previous))
+    removed = sorted(set(previous) - set(current))
+    changed = sorted(
+        rel for rel in set(current) & set(previous) if current[rel] != previous[rel]
+    )
+    return {
+        "baseline": True,
+        "fileCount": len(current),
+        "added": len(added),
+        "removed": len(removed),
+        "changed": len(changed),
+        "sample": (added + changed + removed)[:DIFF_SAMPLE_SIZE],
+    }
+
+
+def _deploy_doc_ref(db: firestore.Client, org_id: str, site: str):
+    return (
+        db.collection("orgs")
+        .document(org_id)
+        .collection("verticalHostingDeploys")
+        .document(site)
+    )
+
+
+def _local_index_path(firebase_project: str, site: str) -> Path:
+    return DEPLOY_INDEX_ROOT / firebase_project / f"{site}.json"
+
+
+def get_deployed_site(
+    db: firestore.Client,
+    org_id: str,
+    site: str,
+) -> dict[str, Any] | None:
+    snapshot = _deploy_doc_ref(db, org_id, site).get()
+    return (snapshot.to_dict() or {}) if snapshot.exists else None
+
+
+def load_deployed_manifest(
+    db: firestore.Client,
+    payload: dict[str, Any],
+    firebase_project: str,
+    site: str,
+) -> tuple[str | None, dict[str, str] | None]:
+    snapshot = _deploy_doc_ref(db, payload["orgId"], site).get()
+    tree_hash = (snapshot.to_dict() or {}).get("treeHash") if snapshot.exists else None
+    try:
+        local = json.loads(
+            _local_index_path(firebase_project, site).read_text(encoding="utf-8")
+        )
+    except (OSError, ValueError):
+        local = {}
+    files = local.get("files") if local.get("treeHash") == tree_hash else None
+    # Firestore is authoritative for what is live; a local index that
+    # disagrees with it only describes some older deploy.
+    return tree_hash, files
+
+
+def list_deployed_sites(db: firestore.Client) -> list[dict[str, Any]]:
+    # Every live site of every org, from the deploy documents written below.
+    sites = []
+    for snapshot in db.collection_group("verticalHostingDeploys").stream():
+        data = snapshot.to_dict() or {}
+        if not data.get("exportId") or not data.get("verticalKey"):
+            continue
+        sites.append(
+            {
+                # Documents written before orgId was stored only have it in their path.
+                "orgId": data.get("orgId") or snapshot.reference.parent.parent.id,
+                "site": data.get("site") or snapshot.id,
+                "verticalKey": data["verticalKey"],
+                "templateKey": data.get("templateKey"),
+                "exportId": data["exportId"],
+                "jobId": data.get("jobId"),
+                "deployedAt": data.get("deployedAt"),
+            }
+        )
+    return sites
+
+
+def save_deployed_manifest(
+    db: firestore.Client,
+    payload: dict[str, Any],
+    firebase_project: str,
+    site: str,
+    tree_hash: str,
+    files: dict[str, str],
+    deployed_at: datetime,
+) -> None:
+    _deploy_doc_ref(db, payload["orgId"], site).set(
+        {
+            "orgId": payload["orgId"],
+            "site": site,
+            "verticalKey": payload["verticalKey"],
+            "templateKey": payload["templateKey"],
+            "treeHash": tree_hash,
+            "fileCount": len(files),
+            "jobId": payload["jobId"],
+            "exportId": payload["exportId"],
+            "deployedAt": deployed_at,
+        }
+    )
+    index_path = _local_index_path(firebase_project, site)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    staging = index_path.with_name(f".{index_path.name}.{uuid.uuid4().hex}")
+    staging.write_text(
+        json.dumps({"treeHash": tree_hash, "files": files}), encoding="utf-8"
+    )
+    staging.replace(index_path)
+    LOGGER.info("Deploy manifest saved site=%s treeHash=%s", site, tree_hash)
+
+
+def record_unchanged_deploy(db: firestore.Client, payload: dict[str, Any], site: str) -> None:
+    # A skipped deploy still makes this export the one the site serves, since
+    # its public/ is identical to what is live; treeHash and deployedAt stay.
+    _deploy_doc_ref(db, payload["orgId"], site).set(
+        {
+            "verticalKey": payload["verticalKey"],
+            "templateKey": payload["templateKey"],
+            "jobId": payload["jobId"],
+            "exportId": payload["exportId"],
+        },
+        merge=True,
+    )
@@ -4,11 +4,23 @@ import json
 import logging
 import os
 import subprocess
+import threading
+import time
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+from vertical_builder.hosting_site_service import ensure_hosting_site, forget_hosting_site
+
+if TYPE_CHECKING:
+    from google.cloud import firestore
 
 
 LOGGER = logging.getLogger("vertical_builder")
 FIREBASE_CMD_TIMEOUT_SECONDS = int(os.environ.get("FIREBASE_CMD_TIMEOUT_SECONDS", "120"))
+DEPLOY_RATE_PER_MINUTE = float(os.environ.get("VERTICAL_DEPLOY_RATE_PER_MINUTE", "0"))
+
+_RATE_LOCK = threading.Lock()
+_NEXT_DEPLOY_AT = 0.0
 
 
 def _run_cmd(cmd: list[str], cwd: Path | None = None) -> None:
@@ -21,7 +33,7 @@ def _run_cmd(cmd: list[str], cwd: Path | None = None) -> None:
     )
 
 
-def _ensure_hosting_site(site: str, firebase_project: str) -> None:
+def _create_hosting_site(site: str, firebase_project: str) -> None:
     cmd = [
         "firebase",
         "hosting:sites:create",
@@ -54,8 +66,17 @@ def _ensure_hosting_site(site: str, firebase_project: str) -> None:
     )
 
 
-def run_hugo_minify(workspace: Path) -> None:
-    _run_cmd(["hugo", "--minify"], cwd=workspace)
+def run_hugo_minify(workspace: Path, cache_dir: Path | None = None) -> float:
+    cmd = ["hugo", "--minify"]
+    if cache_dir is not None:
+        cmd.extend(["--cacheDir", str(cache_dir)])
+    started = time.monotonic()
+    _run_cmd(cmd, cwd=workspace)
+    elapsed = time.monotonic() - started
+    LOGGER.info(
+        "Hugo finished seconds=%.2f cacheDir=%s", elapsed, cache_dir or "none"
+    )
+    return elapsed
 
 
 def _write_firebase_config(workspace: Path, site: str) -> Path:
@@ -71,20 +92,54 @@ def _write_firebase_config(workspace: Path, site: str) -> Path:
     return config_path
 
 
-def deploy_hosting(workspace: Path, site: str, firebase_project: str) -> None:
-    _ensure_hosting_site(site, firebase_project)
+def set_deploy_rate(per_minute: float) -> None:
+    global DEPLOY_RATE_PER_MINUTE  # pylint: disable=global-statement
+    with _RATE_LOCK:
+        DEPLOY_RATE_PER_MINUTE = per_minute
+
+
+def _wait_for_deploy_turn() -> float:
+    # Spaces `firebase deploy` starts evenly across the process, so a burst of
+    # builds stays under the Hosting API quota. 0 disables the limit.
+    global _NEXT_DEPLOY_AT  # pylint: disable=global-statement
+    with _RATE_LOCK:
+        if DEPLOY_RATE_PER_MINUTE <= 0:
+            return 0.0
+        now = time.monotonic()
+        turn = max(now, _NEXT_DEPLOY_AT)
+        _NEXT_DEPLOY_AT = turn + 60 / DEPLOY_RATE_PER_MINUTE
+    delay = turn - now
+    if delay > 0:
+        LOGGER.info("Deploy rate limited seconds=%.2f", delay)
+        time.sleep(delay)
+    return delay
+
+
+def deploy_hosting(
+    workspace: Path,
+    site: str,
+    firebase_project: str,
+    db: firestore.Client | None = None,
+) -> bool:
+    created = ensure_hosting_site(site, firebase_project, _create_hosting_site, db)
     config_path = _write_firebase_config(workspace, site)
-    _run_cmd(
-        [
-            "firebase",
-            "deploy",
-            "--only",
-            "hosting",
-            "--project",
-            firebase_project,
-            "--config",
-            str(config_path),
-            "--non-interactive",
-        ],
-        cwd=workspace,
-    )
+    _wait_for_deploy_turn()
+    try:
+        _run_cmd(
+            [
+                "firebase",
+                "deploy",
+                "--only",
+                "hosting",
+                "--project",
+                firebase_project,
+                "--config",
+                str(config_path),
+                "--non-interactive",
+            ],
+            cwd=workspace,
+        )
+    except subprocess.CalledProcessError:
+        forget_hosting_site(site, firebase_project, db)
+        raise
+    return created
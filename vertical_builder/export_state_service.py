@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from google.cloud import firestore
+
+
+DESIRED_EXPORT_CACHE_SECONDS = float(
+    os.environ.get("VERTICAL_DESIRED_EXPORT_CACHE_SECONDS", "5")
+)
+DEPLOYED_EXPORT_CACHE_SECONDS = float(
+    os.environ.get("VERTICAL_DEPLOYED_EXPORT_CACHE_SECONDS", "600")
+)
+DEPLOYED_EXPORT_CACHE_SIZE = 4096
+
+_CACHE_LOCK = threading.Lock()
+_DESIRED_EXPORTS: dict[tuple[str, str], tuple[float, str | None]] = {}
+_DEPLOYED_EXPORTS: dict[tuple[str, str, str, str], tuple[float, str]] = {}
+
+
+class StaleBuildError(RuntimeError):
+    pass
+
+
+def _vertical_doc_ref(db: firestore.Client, org_id: str, vertical_key: str):
+    return (
+        db.collection("orgs")
+        .document(org_id)
+        .collection("verticals")
+        .document(vertical_key)
+    )
+
+
+def get_desired_export_id(
+    db: firestore.Client,
+    org_id: str,
+    vertical_key: str,
+) -> str | None:
+    key = (org_id, vertical_key)
+    now = time.monotonic()
+    with _CACHE_LOCK:
+        cached = _DESIRED_EXPORTS.get(key)
+    if cached and now - cached[0] < DESIRED_EXPORT_CACHE_SECONDS:
+        return cached[1]
+
+    snapshot = _vertical_doc_ref(db, org_id, vertical_key).get(
+        field_paths=["desiredExportId"]
+    )
+    data = snapshot.to_dict() if snapshot.exists else None
+    desired = (data or {}).get("desiredExportId")
+    with _CACHE_LOCK:
+        _DESIRED_EXPORTS[key] = (now, desired)
+    return desired
+
+
+def list_verticals(db: firestore.Client) -> dict[tuple[str, str], dict[str, Any]]:
+    # Every org's vertical documents, keyed by (orgId, verticalKey).
+    verticals = {}
+    for snapshot in db.collection_group("verticals").stream():
+        org_ref = snapshot.reference.parent.parent
+        if org_ref is None or org_ref.parent.id != "orgs":
+            continue
+        verticals[(org_ref.id, snapshot.id)] = snapshot.to_dict() or {}
+    return verticals
+
+
+def ensure_not_stale(db: firestore.Client, payload: dict[str, Any], stage: str) -> None:
+    desired = get_desired_export_id(db, payload["orgId"], payload["verticalKey"])
+    if desired and desired != payload["exportId"]:
+        raise StaleBuildError(
+            f"Stale build cancelled {stage}: exportId={payload['exportId']} "
+            f"desiredExportId={desired}"
+        )
+
+
+def _deployed_key(payload: dict[str, Any]) -> tuple[str, str, str, str]:
+    return (
+        payload["orgId"],
+        payload["verticalKey"],
+        str(payload["buildTarget"].get("site")),
+        payload["exportId"],
+    )
+
+
+def recently_deployed_job_id(payload: dict[str, Any]) -> str | None:
+    key = _deployed_key(payload)
+    with _CACHE_LOCK:
+        cached = _DEPLOYED_EXPORTS.get(key)
+        if cached is None:
+            return None
+        if time.monotonic() - cached[0] >= DEPLOYED_EXPORT_CACHE_SECONDS:
+            del _DEPLOYED_EXPORTS[key]
+            return None
+        return cached[1]
+
+
+def remember_deployed(payload: dict[str, Any], job_id: str | None = None) -> None:
+    with _CACHE_LOCK:
+        if len(_DEPLOYED_EXPORTS) >= DEPLOYED_EXPORT_CACHE_SIZE:
+            oldest = min(_DEPLOYED_EXPORTS, key=lambda k: _DEPLOYED_EXPORTS[k][0])
+            del _DEPLOYED_EXPORTS[oldest]
+        _DEPLOYED_EXPORTS[_deployed_key(payload)] = (
+            time.monotonic(),
+            job_id or payload["jobId"],
+        )
@@ -0,0 +1,413 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+# Allow direct script execution: `python vertical_builder/fleet_rebuild.py`.
+if __package__ is None or __package__ == "":
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from vertical_builder.artifact_service import theme_version
+from vertical_builder.builder_service import handle_build_job
+from vertical_builder.client_service import get_firestore_client
+from vertical_builder.config import RuntimeConfig, load_runtime_config
+from vertical_builder.deploy_manifest_service import list_deployed_sites
+from vertical_builder.deploy_service import set_deploy_rate
+from vertical_builder.export_state_service import list_verticals
+from vertical_builder.message_service import validate_payload
+from vertical_builder.receipt_service import get_receipt, latest_deployed_receipt
+from vertical_builder.scheduler_service import BuildScheduler
+from vertical_builder.workspace_service import start_workspace_sweeper
+
+if TYPE_CHECKING:
+    from google.cloud import firestore
+
+
+LOGGER = logging.getLogger("vertical_builder")
+REBUILD_ROOT = Path(
+    os.environ.get(
+        "VERTICAL_REBUILD_ROOT",
+        str(Path(__file__).resolve().parent / "rebuilds"),
+    )
+)
+PRIORITY_ORDERS = ("recent", "traffic")
+
+
+def _target_key(target: dict[str, Any]) -> str:
+    return f"{target['orgId']}/{target['verticalKey']}/{target['site']}"
+
+
+def _deployed_sort_key(target: dict[str, Any]) -> float:
+    deployed_at = target.get("deployedAt")
+    return deployed_at.timestamp() if isinstance(deployed_at, datetime) else 0.0
+
+
+def prioritize(
+    targets: list[dict[str, Any]],
+    order: str,
+    traffic: dict[str, float] | None = None,
+) -> list[dict[str, Any]]:
+    # `recent`: most recently published sites first. `traffic`: highest
+    # weight first, looked up by "orgId/site" and then "orgId", with recency
+    # breaking ties.
+    if order not in PRIORITY_ORDERS:
+        raise RuntimeError(f"Priority order must be one of {', '.join(PRIORITY_ORDERS)}")
+    weights = traffic or {}
+
+    def _weight(target: dict[str, Any]) -> float:
+        if order != "traffic":
+            return 0.0
+        return float(
+            weights.get(f"{target['orgId']}/{target['site']}", weights.get(target["orgId"], 0))
+        )
+
+    return sorted(
+        targets,
+        key=lambda target: (-_weight(target), -_deployed_sort_key(target), _target_key(target)),
+    )
+
+
+class RebuildCheckpoint:
+    # Last rebuild result per target. A target is done once it is deployed
+    # with its template's current theme version, so running the same release
+    # again picks up where an interrupted run stopped, and the next release
+    # starts over. Anything else, `stale` included, is tried again.
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            data = {}
+        self._data = {"targets": data.get("targets") or {}}
+
+    def finished(self, key: str, theme: str) -> bool:
+        with self._lock:
+            entry = self._data["targets"].get(key) or {}
+        return entry.get("status") == "deployed" and entry.get("themeVersion") == theme
+
+    def record(self, key: str, entry: dict[str, Any]) -> None:
+        with self._lock:
+            self._data["targets"][key] = {
+                **entry,
+                "recordedAt": datetime.now(timezone.utc).isoformat(),
+            }
+            raw = json.dumps(self._data, indent=2, sort_keys=True)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            staging = self.path.with_name(f".{self.path.name}.{uuid.uuid4().hex}")
+            staging.write_text(raw, encoding="utf-8")
+            staging.replace(self.path)
+
+    def counts(self, targets: list[tuple[str, str]]) -> dict[str, int]:
+        # Results of (key, themeVersion) targets in this release; targets it
+        # has not reached yet count as pending.
+        with self._lock:
+            entries = [self._data["targets"].get(key) or {} for key, _theme in targets]
+        counts: dict[str, int] = {}
+        for entry, (_key, theme) in zip(entries, targets):
+            status = entry.get("status") if entry.get("themeVersion") == theme else "pending"
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+
+def rebuild_payload(target: dict[str, Any], runtime: RuntimeConfig) -> dict[str, Any]:
+    # The jobId is derived from the theme version, the site and the export,
+    # so a resumed run re-submits the same job and a redelivery is recognized
+    # as such.
+    key = f"{_target_key(target)}/{target['exportId']}"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+    return {
+        "jobId": f"rb_{target['themeVersion']}_{digest}",
+        "env": runtime.env,
+        "orgId": target["orgId"],
+        "verticalKey": target["verticalKey"],
+        "templateKey": target["templateKey"],
+        "exportId": target["exportId"],
+        "buildTarget": {"hostingProject": runtime.firebase_project, "site": target["site"]},
+        "rebuild": True,
+    }
+
+
+class FleetRebuild:
+    # Rebuilds the sites of every orgs/*/verticals document with the current
+    # theme, from the latest export of the vertical (desiredExportId, else the
+    # export the site serves). Jobs go through the same BuildScheduler and
+    # build phases as Pub/Sub deliveries, so snapshot, Hugo and asset caches
+    # are shared, Hugo runs are bounded by the render slots and at most
+    # `concurrency` builds are in flight.
+
+    def __init__(
+        self,
+        runtime: RuntimeConfig,
+        db: firestore.Client,
+        concurrency: int | None = None,
+        order: str = "recent",
+        traffic: dict[str, float] | None = None,
+        checkpoint_path: Path | None = None,
+    ) -> None:
+        self.runtime = runtime
+        self.db = db
+        self.concurrency = concurrency or runtime.max_concurrent_builds
+        self.order = order
+        self.traffic = traffic
+        self.checkpoint = RebuildCheckpoint(checkpoint_path or REBUILD_ROOT / "checkpoint.json")
+        self.theme_versions: dict[str, str] = {}
+        # Verticals (or their sites) that cannot be rebuilt, with the reason.
+        self.unresolved: list[dict[str, Any]] = []
+        self._stopping = threading.Event()
+        self._scheduler: BuildScheduler | None = None
+
+    def _template_key(self, site: dict[str, Any], vertical: dict[str, Any]) -> str | None:
+        template_key = vertical.get("templateKey") or site.get("templateKey")
+        if template_key or not site.get("jobId"):
+            return template_key
+        # Deploy documents written before templateKey was stored: the job
+        # that deployed the site still has it on its receipt.
+        receipt = get_receipt(self.db, {"orgId": site["orgId"], "jobId": site["jobId"]})
+        return (receipt or {}).get("templateKey")
+
+    def _skip(self, org_id: str, vertical_key: str, site: str | None, reason: str) -> None:
+        LOGGER.warning(
+            "Fleet rebuild skips org=%s vertical=%s site=%s: %s",
+            org_id,
+            vertical_key,
+            site,
+            reason,
+        )
+        self.unresolved.append(
+            {"orgId": org_id, "verticalKey": vertical_key, "site": site, "reason": reason}
+        )
+
+    def _vertical_sites(
+        self,
+        org_id: str,
+        vertical_key: str,
+        vertical: dict[str, Any],
+        deployed: list[dict[str, Any]],
+    ) -> list[dict[str, Any]]:
+        # The vertical's own buildTarget.site wins; otherwise every site its
+        # deploy documents name, and for sites deployed before those documents
+        # existed, the site of the vertical's last deployed receipt.
+        build_target = vertical.get("buildTarget")
+        site = build_target.get("site") if isinstance(build_target, dict) else None
+        if site:
+            live = next((entry for entry in deployed if entry["site"] == site), {})
+            return [{**live, "orgId": org_id, "verticalKey": vertical_key, "site": site}]
+        if deployed:
+            return deployed
+        receipt = latest_deployed_receipt(self.db, org_id, vertical_key)
+        if receipt is None:
+            return []
+        return [
+            {
+                "orgId": org_id,
+                "verticalKey": vertical_key,
+                "site": receipt["deployTarget"],
+                "templateKey": receipt.get("templateKey"),
+                "exportId": receipt.get("exportId"),
+                "jobId": receipt.get("jobId"),
+                "deployedAt": receipt.get("deployedAt"),
+            }
+        ]
+
+    def targets(self) -> list[dict[str, Any]]:
+        verticals = list_verticals(self.db)
+        deployed: dict[tuple[str, str], list[dict[str, Any]]] = {}
+        for site in list_deployed_sites(self.db):
+            deployed.setdefault((site["orgId"], site["verticalKey"]), []).append(site)
+        self.unresolved = []
+        targets = []
+        for (org_id, vertical_key), vertical in sorted(verticals.items()):
+            sites = self._vertical_sites(
+                org_id, vertical_key, vertical, deployed.get((org_id, vertical_key), [])
+            )
+            if not sites:
+                self._skip(org_id, vertical_key, None, "no Hosting site known")
+                continue
+            for site in sites:
+                if site["site"] == "local":
+                    self._skip(org_id, vertical_key, "local", "local build target")
+                    continue
+                template_key = self._template_key(site, vertical)
+                export_id = vertical.get("desiredExportId") or site.get("exportId")
+                if not template_key or not export_id:
+                    self._skip(
+                        org_id,
+                        vertical_key,
+                        site["site"],
+                        "no templateKey known" if not template_key else "no exportId known",
+                    )
+                    continue
+                if template_key not in self.theme_versions:
+                    self.theme_versions[template_key] = theme_version(
+                        self.runtime.themes_root, template_key, self.runtime.base_config_path
+                    )
+                targets.append(
+                    {
+                        **site,
+                        "exportId": export_id,
+                        "templateKey": template_key,
+                        "themeVersion": self.theme_versions[template_key],
+                    }
+                )
+        for org_id, vertical_key in sorted(deployed.keys() - verticals.keys()):
+            for site in deployed[(org_id, vertical_key)]:
+                self._skip(org_id, vertical_key, site["site"], "no vertical document")
+        return prioritize(targets, self.order, self.traffic)
+
+    def plan(self, limit: int | None = None) -> list[dict[str, Any]]:
+        pending = [
+            target
+            for target in self.targets()
+            if not self.checkpoint.finished(_target_key(target), target["themeVersion"])
+        ]
+        return pending[:limit] if limit else pending
+
+    def _rebuild_one(self, payload: dict[str, Any], target: dict[str, Any]) -> None:
+        if self._stopping.is_set():
+            return
+        handle_build_job(payload, self.runtime)
+        receipt = get_receipt(self.db, payload) or {}
+        self.checkpoint.record(
+            _target_key(target),
+            {
+                "jobId": payload["jobId"],
+                "exportId": payload["exportId"],
+                "themeVersion": target["themeVersion"],
+                "status": receipt.get("status", "missing"),
+                "deploySkipped": bool(receipt.get("deploySkipped")),
+                "error": receipt.get("error"),
+            },
+        )
+
+    def run(self, limit: int | None = None) -> dict[str, Any]:
+        started = time.monotonic()
+        pending = self.plan(limit)
+        LOGGER.info(
+            "Fleet rebuild themeVersions=%s targets=%d concurrency=%d checkpoint=%s",
+            self.theme_versions,
+            len(pending),
+            self.concurrency,
+            self.checkpoint.path,
+        )
+        self._scheduler = BuildScheduler(max_workers=self.concurrency)
+        for target in pending:
+            if self._stopping.is_set():
+                break
+            payload = rebuild_payload(target, self.runtime)
+            validate_payload(payload, self.runtime)
+            self._scheduler.submit(payload, self._rebuild_one, target)
+        while not self._scheduler.wait_idle(timeout=1.0):
+            if self._stopping.is_set():
+                break
+        # On stop, queued jobs are dropped and running ones finish; their
+        # targets are picked up by the next run.
+        self._scheduler.shutdown(wait=not self._stopping.is_set(), cancel_pending=True)
+        return {
+            "themeVersions": self.theme_versions,
+            "checkpoint": str(self.checkpoint.path),
+            "planned": len(pending),
+            "stopped": self._stopping.is_set(),
+            "unresolved": self._unresolved_counts(),
+            "results": self.checkpoint.counts(
+                [(_target_key(target), target["themeVersion"]) for target in pending]
+            ),
+            "seconds": round(time.monotonic() - started, 3),
+        }
+
+    def _unresolved_counts(self) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        for entry in self.unresolved:
+            counts[entry["reason"]] = counts.get(entry["reason"], 0) + 1
+        return counts
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+
+def _load_traffic(path: Path | None) -> dict[str, float] | None:
+    if path is None:
+        return None
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(data, dict):
+        raise RuntimeError("Traffic file must map orgId or orgId/site to a number")
+    return {str(key): float(value) for key, value in data.items()}
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Rebuild every live site with the current theme."
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="Builds in flight (default: VERTICAL_MAX_CONCURRENT_BUILDS).",
+    )
+    parser.add_argument(
+        "--deploys-per-minute",
+        type=float,
+        help="Firebase deploy rate limit (default: VERTICAL_DEPLOY_RATE_PER_MINUTE).",
+    )
+    parser.add_argument("--order", choices=PRIORITY_ORDERS, default="recent")
+    parser.add_argument(
+        "--traffic",
+        type=Path,
+        help='JSON file of weights for --order traffic, e.g. {"org1": 900, "org2/site": 15}.',
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        help="Progress file (default: VERTICAL_REBUILD_ROOT/checkpoint.json).",
+    )
+    parser.add_argument("--limit", type=int, help="Rebuild at most this many sites.")
+    parser.add_argument("--dry-run", action="store_true", help="Print the plan only.")
+    args = parser.parse_args()
+
+    runtime = load_runtime_config()
+    if args.deploys_per_minute is not None:
+        set_deploy_rate(args.deploys_per_minute)
+    rebuild = FleetRebuild(
+        runtime,
+        get_firestore_client(),
+        concurrency=args.concurrency,
+        order=args.order,
+        traffic=_load_traffic(args.traffic),
+        checkpoint_path=args.checkpoint,
+    )
+    if args.dry_run:
+        plan = [
+            {**target, "deployedAt": str(target.get("deployedAt"))}
+            for target in rebuild.plan(args.limit)
+        ]
+        print(
+            json.dumps(
+                {
+                    "themeVersions": rebuild.theme_versions,
+                    "targets": plan,
+                    "unresolved": rebuild.unresolved,
+                },
+                indent=2,
+            )
+        )
+        return
+    start_workspace_sweeper()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_args: rebuild.stop())
+    print(json.dumps(rebuild.run(args.limit), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    from google.cloud import firestore
+
+
+LOGGER = logging.getLogger("vertical_builder")
+HOSTING_SITE_ROOT = Path(
+    os.environ.get(
+        "VERTICAL_HOSTING_SITE_ROOT",
+        str(Path(__file__).resolve().parent / "hosting_sites"),
+    )
+)
+HOSTING_SITE_CACHE_SECONDS = float(
+    os.environ.get("VERTICAL_HOSTING_SITE_CACHE_SECONDS", str(7 * 24 * 3600))
+)
+HOSTING_SITE_FAILURE_SECONDS = float(
+    os.environ.get("VERTICAL_HOSTING_SITE_FAILURE_SECONDS", "60")
+)
+
+_REGISTRY_LOCK = threading.Lock()
+# (firebaseProject, site) -> wall-clock time the site was last confirmed
+_CONFIRMED: dict[tuple[str, str], float] = {}
+# (firebaseProject, site) -> (monotonic time, error) of the last failed create
+_FAILURES: dict[tuple[str, str], tuple[float, str]] = {}
+_SITE_LOCKS: dict[tuple[str, str], threading.Lock] = {}
+
+
+def _site_doc_ref(db: firestore.Client, firebase_project: str, site: str):
+    return db.collection("verticalHostingSites").document(f"{firebase_project}:{site}")
+
+
+def _local_entry_path(firebase_project: str, site: str) -> Path:
+    return HOSTING_SITE_ROOT / firebase_project / f"{site}.json"
+
+
+def _fresh(confirmed_at: float | None) -> bool:
+    return confirmed_at is not None and time.time() - confirmed_at < HOSTING_SITE_CACHE_SECONDS
+
+
+def _read_local(firebase_project: str, site: str) -> float | None:
+    try:
+        entry = json.loads(
+            _local_entry_path(firebase_project, site).read_text(encoding="utf-8")
+        )
+    except (OSError, ValueError):
+        return None
+    confirmed_at = entry.get("confirmedAt") if isinstance(entry, dict) else None
+    return float(confirmed_at) if isinstance(confirmed_at, (int, float)) else None
+
+
+def _write_local(firebase_project: str, site: str, confirmed_at: float) -> None:
+    entry_path = _local_entry_path(firebase_project, site)
+    entry_path.parent.mkdir(parents=True, exist_ok=True)
+    staging = entry_path.with_name(f".{entry_path.name}.{uuid.uuid4().hex}")
+    staging.write_text(json.dumps({"confirmedAt": confirmed_at}), encoding="utf-8")
+    staging.replace(entry_path)
+
+
+def _read_remote(db: firestore.Client, firebase_project: str, site: str) -> float | None:
+    snapshot = _site_doc_ref(db, firebase_project, site).get()
+    confirmed_at = (snapshot.to_dict() or {}).get("confirmedAt") if snapshot.exists else None
+    return confirmed_at.timestamp() if isinstance(confirmed_at, datetime) else None
+
+
+def _remember(
+    db: firestore.Client | None,
+    firebase_project: str,
+    site: str,
+    confirmed_at: float,
+    remote: bool,
+) -> None:
+    with _REGISTRY_LOCK:
+        _CONFIRMED[(firebase_project, site)] = confirmed_at
+        _FAILURES.pop((firebase_project, site), None)
+    _write_local(firebase_project, site, confirmed_at)
+    if remote and db is not None:
+        _site_doc_ref(db, firebase_project, site).set(
+            {
+                "site": site,
+                "firebaseProject": firebase_project,
+                "confirmedAt": datetime.fromtimestamp(confirmed_at, tz=timezone.utc),
+            }
+        )
+
+
+def _known_site(db: firestore.Client | None, firebase_project: str, site: str) -> bool:
+    key = (firebase_project, site)
+    with _REGISTRY_LOCK:
+        if _fresh(_CONFIRMED.get(key)):
+            return True
+    confirmed_at = _read_local(firebase_project, site)
+    if _fresh(confirmed_at):
+        with _REGISTRY_LOCK:
+            _CONFIRMED[key] = confirmed_at
+        return True
+    if db is None:
+        return False
+    confirmed_at = _read_remote(db, firebase_project, site)
+    if _fresh(confirmed_at):
+        _remember(db, firebase_project, site, confirmed_at, remote=False)
+        return True
+    return False
+
+
+def _raise_recent_failure(firebase_project: str, site: str) -> None:
+    with _REGISTRY_LOCK:
+        failure = _FAILURES.get((firebase_project, site))
+    if failure and time.monotonic() - failure[0] < HOSTING_SITE_FAILURE_SECONDS:
+        raise RuntimeError(f"Hosting site {site} could not be created recently: {failure[1]}")
+
+
+def ensure_hosting_site(
+    site: str,
+    firebase_project: str,
+    create: Callable[[str, str], None],
+    db: firestore.Client | None = None,
+) -> bool:
+    # Returns True when `create` actually ran. Confirmed sites are remembered
+    # in memory, in a local file and in Firestore, so only the first build of a
+    # site on the whole fleet pays for the CLI; concurrent builds of the same
+    # new site in this process wait for a single create.
+    if _known_site(db, firebase_project, site):
+        return False
+    key = (firebase_project, site)
+    with _REGISTRY_LOCK:
+        site_lock = _SITE_LOCKS.setdefault(key, threading.Lock())
+    with site_lock:
+        # Whoever held the lock has already written the registry back.
+        if _known_site(None, firebase_project, site):
+            return False
+        _raise_recent_failure(firebase_project, site)
+        try:
+            create(site, firebase_project)
+        except Exception as exc:  # pylint: disable=broad-except
+            detail = getattr(exc, "stderr", None) or str(exc)
+            with _REGISTRY_LOCK:
+                _FAILURES[key] = (time.monotonic(), str(detail).strip()[-500:])
+            raise
+        _remember(db, firebase_project, site, time.time(), remote=True)
+    return True
+
+
+def forget_hosting_site(
+    site: str,
+    firebase_project: str,
+    db: firestore.Client | None = None,
+) -> None:
+    # A deploy that fails may mean the site was deleted behind our back; the
+    # next build re-runs the create instead of trusting the registry.
+    with _REGISTRY_LOCK:
+        _CONFIRMED.pop((firebase_project, site), None)
+    _local_entry_path(firebase_project, site).unlink(missing_ok=True)
+    if db is not None:
+        _site_doc_ref(db, firebase_project, site).delete()
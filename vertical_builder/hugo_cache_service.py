@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import fcntl
+import logging
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+
+LOGGER = logging.getLogger("vertical_builder")
+HUGO_CACHE_ROOT = Path(
+    os.environ.get(
+        "VERTICAL_HUGO_CACHE_ROOT",
+        str(Path(__file__).resolve().parent / "hugo_cache"),
+    )
+)
+HUGO_CACHE_MAX_BYTES = int(
+    os.environ.get("VERTICAL_HUGO_CACHE_MAX_BYTES", str(1024**3))
+)
+HUGO_CACHE_SCOPE = os.environ.get("VERTICAL_HUGO_CACHE_SCOPE", "theme")
+HUGO_CACHE_SLOTS = int(os.environ.get("VERTICAL_HUGO_CACHE_SLOTS", "4"))
+
+
+def hugo_cache_enabled() -> bool:
+    return HUGO_CACHE_MAX_BYTES > 0
+
+
+def _scope_root(payload: dict[str, Any]) -> Path:
+    if HUGO_CACHE_SCOPE == "org":
+        return HUGO_CACHE_ROOT / "cache" / payload["templateKey"] / payload["orgId"]
+    return HUGO_CACHE_ROOT / "cache" / payload["templateKey"]
+
+
+def _resources_root(payload: dict[str, Any]) -> Path:
+    return HUGO_CACHE_ROOT / "resources" / payload["orgId"] / payload["verticalKey"]
+
+
+def _try_lock(lock_path: Path):
+    handle = lock_path.open("a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        handle.close()
+        return None
+    return handle
+
+
+@contextmanager
+def hugo_cache_dir(payload: dict[str, Any]) -> Iterator[Path | None]:
+    # Concurrent Hugo runs must not share a --cacheDir, so each scope holds a
+    # few slots guarded by flock. When every slot is busy the build runs cold
+    # rather than waiting.
+    if not hugo_cache_enabled():
+        yield None
+        return
+    root = _scope_root(payload)
+    root.mkdir(parents=True, exist_ok=True)
+    for slot in range(max(1, HUGO_CACHE_SLOTS)):
+        handle = _try_lock(root / f"slot-{slot}.lock")
+        if handle is None:
+            continue
+        slot_dir = root / f"slot-{slot}"
+        try:
+            slot_dir.mkdir(exist_ok=True)
+            os.utime(slot_dir)
+            yield slot_dir
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            handle.close()
+        return
+    LOGGER.info("All Hugo cache slots busy for %s; building without cache", root)
+    yield None
+
+
+def restore_hugo_resources(payload: dict[str, Any], workspace: Path) -> bool:
+    if not hugo_cache_enabled():
+        return False
+    src = _resources_root(payload) / "_gen"
+    if not src.exists():
+        return False
+    try:
+        # Hugo may rewrite files under resources/_gen, so this must be a real
+        # copy and never a hardlink into the shared store.
+        shutil.copytree(src, workspace / "resources" / "_gen", dirs_exist_ok=True)
+        os.utime(_resources_root(payload))
+    except OSError as exc:
+        LOGGER.warning("Hugo resources restore failed, building cold: %s", exc)
+        return False
+    return True
+
+
+def save_hugo_resources(payload: dict[str, Any], workspace: Path) -> None:
+    src = workspace / "resources" / "_gen"
+    if not hugo_cache_enabled() or not src.exists():
+        return
+    store = _resources_root(payload)
+    store.parent.mkdir(parents=True, exist_ok=True)
+    staging = store.parent / f".tmp-{store.name}-{uuid.uuid4().hex}"
+    trash = store.parent / f".old-{store.name}-{uuid.uuid4().hex}"
+    try:
+        shutil.copytree(src, staging / "_gen")
+        if store.exists():
+            store.rename(trash)
+        staging.rename(store)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        shutil.rmtree(trash, ignore_errors=True)
+
+
+def _tree_size(root: Path) -> int:
+    return sum(p.stat().st_size for p in root.rglob("*") if p.is_file())
+
+
+def evict_hugo_cache(max_bytes: int | None = None) -> None:
+    budget = HUGO_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries: list[tuple[Path, Path | None]] = []
+    cache_root = HUGO_CACHE_ROOT / "cache"
+    if cache_root.exists():
+        for lock_path in cache_root.rglob("slot-*.lock"):
+            entries.append((lock_path.with_suffix(""), lock_path))
+    resources_root = HUGO_CACHE_ROOT / "resources"
+    if resources_root.exists():
+        for org_dir in resources_root.iterdir():
+            if org_dir.is_dir():
+                entries.extend(
+                    (p, None)
+                    for p in org_dir.iterdir()
+                    if p.is_dir() and not p.name.startswith(".")
+                )
+    entries = [(path, lock) for path, lock in entries if path.exists()]
+    sizes = {path: _tree_size(path) for path, _lock in entries}
+    total = sum(sizes.values())
+    for path, lock_path in sorted(entries, key=lambda item: item[0].stat().st_mtime):
+        if total <= budget:
+            break
+        handle = _try_lock(lock_path) if lock_path else None
+        if lock_path and handle is None:
+            continue
+        try:
+            shutil.rmtree(path, ignore_errors=True)
+        finally:
+            if handle is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+                handle.close()
+        total -= sizes[path]
+        LOGGER.info("Hugo cache evicted path=%s bytes=%d", path, sizes[path])
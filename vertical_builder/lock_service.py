@@ -1,9 +1,24 @@
 from __future__ import annotations
 
+import logging
+import os
+import random
+import threading
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import TYPE_CHECKING, Any, Callable
 
-from google.cloud import firestore
+if TYPE_CHECKING:
+    from google.cloud import firestore
+
+
+LOGGER = logging.getLogger("vertical_builder")
+LOCK_WAIT_SECONDS = float(os.environ.get("VERTICAL_LOCK_WAIT_SECONDS", "300"))
+LOCK_RETRY_BASE_SECONDS = float(os.environ.get("VERTICAL_LOCK_RETRY_BASE_SECONDS", "1"))
+LOCK_RETRY_MAX_SECONDS = float(os.environ.get("VERTICAL_LOCK_RETRY_MAX_SECONDS", "15"))
+
+_LEASES_LOCK = threading.Lock()
+_LEASES: dict[str, LockLease] = {}
 
 
 def _utc_now() -> datetime:
@@ -19,26 +34,30 @@ def _lock_doc_ref(db: firestore.Client, org_id: str, vertical_key: str):
     )
 
 
-def acquire_lock(
+def _try_acquire(
     db: firestore.Client,
     payload: dict[str, Any],
     ttl_seconds: int,
-) -> None:
+    extra_writes: Callable[[firestore.Transaction], None] | None,
+    held_writes: Callable[[firestore.Transaction], None] | None = None,
+) -> dict[str, Any] | None:
+    # Returns the holder's lock document when the lock is taken.
+    from google.cloud import firestore
+
     doc_ref = _lock_doc_ref(db, payload["orgId"], payload["verticalKey"])
     now = _utc_now()
     expires_at = now + timedelta(seconds=ttl_seconds)
 
     @firestore.transactional
-    def _create_lock(transaction: firestore.Transaction) -> None:
+    def _create_lock(transaction: firestore.Transaction) -> dict[str, Any] | None:
         snapshot = doc_ref.get(transaction=transaction)
         if snapshot.exists:
             data = snapshot.to_dict() or {}
             lock_expiry = data.get("expiresAt")
             if lock_expiry is None or lock_expiry > now:
-                raise RuntimeError(
-                    "Concurrent publish blocked by active lock "
-                    f"for org={payload['orgId']} vertical={payload['verticalKey']}"
-                )
+                if held_writes is not None:
+                    held_writes(transaction)
+                return data
         transaction.set(
             doc_ref,
             {
@@ -50,10 +69,167 @@ def acquire_lock(
                 "expiresAt": expires_at,
             },
         )
+        # Writes that belong with taking the lock commit in the same round-trip.
+        if extra_writes is not None:
+            extra_writes(transaction)
+        return None
+
+    return _create_lock(db.transaction())
+
+
+def _retry_delay(attempt: int) -> float:
+    # Capped exponential backoff with jitter, so waiters on one lock do not
+    # all poll Firestore in the same instant.
+    ceiling = min(LOCK_RETRY_MAX_SECONDS, LOCK_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+def acquire_lock(
+    db: firestore.Client,
+    payload: dict[str, Any],
+    ttl_seconds: int,
+    extra_writes: Callable[[firestore.Transaction], None] | None = None,
+    wait_seconds: float | None = None,
+    on_wait: Callable[[], None] | None = None,
+    waiting_writes: Callable[[firestore.Transaction], None] | None = None,
+) -> dict[str, Any]:
+    # A lock held by another build is waited for, up to wait_seconds, rather
+    # than failing the job into a Pub/Sub redelivery. on_wait runs between
+    # attempts and may raise to give up, e.g. once a newer export is desired.
+    # waiting_writes commit with the first attempt that finds the lock held.
+    budget = LOCK_WAIT_SECONDS if wait_seconds is None else wait_seconds
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        attempt += 1
+        holder = _try_acquire(
+            db,
+            payload,
+            ttl_seconds,
+            extra_writes,
+            held_writes=waiting_writes if attempt == 1 else None,
+        )
+        if holder is None:
+            return {"attempts": attempt, "waitedMs": int((time.monotonic() - started) * 1000)}
+        remaining = budget - (time.monotonic() - started)
+        if remaining <= 0:
+            raise RuntimeError(
+                "Concurrent publish blocked by active lock "
+                f"for org={payload['orgId']} vertical={payload['verticalKey']} "
+                f"heldByJobId={holder.get('jobId')}"
+            )
+        if attempt == 1:
+            LOGGER.info(
+                "Waiting for lock jobId=%s heldByJobId=%s heldExportId=%s",
+                payload["jobId"],
+                holder.get("jobId"),
+                holder.get("exportId"),
+            )
+        if on_wait is not None:
+            on_wait()
+        time.sleep(min(_retry_delay(attempt), remaining))
 
-    _create_lock(db.transaction())
 
+class LockLease:
+    # Keeps a held lock alive while its build runs: expiresAt is pushed out
+    # every third of the TTL, so the TTL only has to cover a crashed instance,
+    # not the longest build. The lease counts as lost when the lock document
+    # names another job or no renewal has succeeded for a whole TTL.
+
+    def __init__(self, db: firestore.Client, payload: dict[str, Any], ttl_seconds: int) -> None:
+        self._db = db
+        self._payload = payload
+        self._ttl_seconds = ttl_seconds
+        self._stop_event = threading.Event()
+        self._lost = threading.Event()
+        self._renewed_at = time.monotonic()
+        self.renewals = 0
+        self._thread = threading.Thread(
+            target=self._run, name=f"lock-lease-{payload['jobId']}", daemon=True
+        )
 
-def release_lock(db: firestore.Client, payload: dict[str, Any]) -> None:
+    def start(self) -> LockLease:
+        with _LEASES_LOCK:
+            _LEASES[self._payload["jobId"]] = self
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self._thread.join()
+        with _LEASES_LOCK:
+            if _LEASES.get(self._payload["jobId"]) is self:
+                del _LEASES[self._payload["jobId"]]
+
+    @property
+    def held(self) -> bool:
+        return (
+            not self._lost.is_set()
+            and time.monotonic() - self._renewed_at < self._ttl_seconds
+        )
+
+    def _run(self) -> None:
+        interval = max(1.0, self._ttl_seconds / 3)
+        while not self._stop_event.wait(interval):
+            try:
+                self._renew()
+            except Exception:  # pylint: disable=broad-except
+                # Retried on the next tick; `held` turns false once a whole
+                # TTL passes without a renewal.
+                LOGGER.exception("Lock renewal failed jobId=%s", self._payload["jobId"])
+            if self._lost.is_set():
+                return
+
+    def _renew(self) -> None:
+        from google.cloud import firestore
+
+        payload = self._payload
+        doc_ref = _lock_doc_ref(self._db, payload["orgId"], payload["verticalKey"])
+        now = _utc_now()
+
+        @firestore.transactional
+        def _extend(transaction: firestore.Transaction) -> bool:
+            snapshot = doc_ref.get(transaction=transaction)
+            data = (snapshot.to_dict() or {}) if snapshot.exists else {}
+            if data.get("jobId") != payload["jobId"]:
+                return False
+            transaction.set(
+                doc_ref,
+                {"expiresAt": now + timedelta(seconds=self._ttl_seconds), "renewedAt": now},
+                merge=True,
+            )
+            return True
+
+        if _extend(self._db.transaction()):
+            self._renewed_at = time.monotonic()
+            self.renewals += 1
+            return
+        self._lost.set()
+        LOGGER.error(
+            "Lock lost jobId=%s org=%s vertical=%s",
+            payload["jobId"],
+            payload["orgId"],
+            payload["verticalKey"],
+        )
+
+
+def ensure_lock_held(payload: dict[str, Any], stage: str) -> None:
+    with _LEASES_LOCK:
+        lease = _LEASES.get(payload["jobId"])
+    if lease is not None and not lease.held:
+        raise RuntimeError(
+            f"Lock lease lost {stage} for org={payload['orgId']} "
+            f"vertical={payload['verticalKey']}"
+        )
+
+
+def release_lock(
+    db: firestore.Client,
+    payload: dict[str, Any],
+    writer: firestore.WriteBatch | None = None,
+) -> None:
     doc_ref = _lock_doc_ref(db, payload["orgId"], payload["verticalKey"])
-    doc_ref.delete()
+    if writer is not None:
+        writer.delete(doc_ref)
+    else:
+        doc_ref.delete()
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import base64
+import json
+from typing import Any
+
+from vertical_builder.config import REQUIRED_PAYLOAD_FIELDS, RuntimeConfig
+
+
+def decode_pubsub_data(data: bytes) -> dict[str, Any]:
+    payload = json.loads(data.decode("utf-8"))
+    if not isinstance(payload, dict):
+        raise ValueError("Payload must decode to an object")
+    return payload
+
+
+def decode_pubsub_envelope(envelope: dict[str, Any]) -> dict[str, Any]:
+    if "message" not in envelope or "data" not in envelope["message"]:
+        raise ValueError("Missing Pub/Sub message.data")
+    encoded_data = envelope["message"]["data"]
+    return decode_pubsub_data(base64.b64decode(encoded_data))
+
+
+def validate_payload(payload: dict[str, Any], runtime: RuntimeConfig) -> None:
+    missing = [field for field in REQUIRED_PAYLOAD_FIELDS if field not in payload]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+    build_target = payload.get("buildTarget")
+    if not isinstance(build_target, dict):
+        raise ValueError("buildTarget must be an object")
+    hosting_project = build_target.get("hostingProject")
+    site = build_target.get("site")
+    allow_env_override = bool(build_target.get("allowEnvOverride", False))
+    if payload["env"] != runtime.env and not (site == "local" and allow_env_override):
+        raise ValueError(
+            f"Environment mismatch: payload env={payload['env']} runtime env={runtime.env}"
+        )
+    if not hosting_project:
+        raise ValueError("buildTarget must include hostingProject")
+    if not site:
+        raise ValueError("buildTarget must include site")
+    if site != "local" and hosting_project != runtime.firebase_project:
+        raise ValueError(
+            "buildTarget.hostingProject must match runtime FIREBASE_PROJECT "
+            "for non-local deploys"
+        )
+    deploy_artifact = payload.get("deployArtifact", False)
+    if not isinstance(deploy_artifact, bool):
+        raise ValueError("deployArtifact must be a boolean")
+    if deploy_artifact and site == "local":
+        raise ValueError("deployArtifact is not supported for site=local")
+    rebuild = payload.get("rebuild", False)
+    if not isinstance(rebuild, bool):
+        raise ValueError("rebuild must be a boolean")
+    if rebuild and deploy_artifact:
+        raise ValueError("rebuild and deployArtifact are mutually exclusive")
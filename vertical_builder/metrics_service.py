@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_METRICS_LOCK = threading.Lock()
+# (metric, sorted label items) -> [bucket counts..., sum, count]
+_HISTOGRAMS: dict[tuple[str, tuple[tuple[str, str], ...]], list[float]] = {}
+_COUNTERS: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+
+_HELP = {
+    "vertical_builder_stage_seconds": "Wall time per build stage.",
+    "vertical_builder_build_seconds": "Wall time per build job.",
+    "vertical_builder_stage_bytes_total": "Bytes moved per build stage.",
+    "vertical_builder_stage_files_total": "Files handled per build stage.",
+    "vertical_builder_builds_total": "Finished build jobs by result.",
+}
+
+
+def _labels_key(labels: dict[str, str]) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted(labels.items()))
+
+
+def observe(metric: str, seconds: float, **labels: str) -> None:
+    key = (metric, _labels_key(labels))
+    with _METRICS_LOCK:
+        values = _HISTOGRAMS.setdefault(key, [0.0] * (len(STAGE_BUCKETS) + 2))
+        for index, bound in enumerate(STAGE_BUCKETS):
+            if seconds <= bound:
+                values[index] += 1
+        values[-2] += seconds
+        values[-1] += 1
+
+
+def increment(metric: str, amount: float = 1, **labels: str) -> None:
+    key = (metric, _labels_key(labels))
+    with _METRICS_LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0.0) + amount
+
+
+class StageTimer:
+    # Collects per-stage durations for one build. Each stage is also fed into
+    # the process-wide histograms served by /metrics, and the collected dict is
+    # written into the receipt as-is.
+
+    def __init__(self) -> None:
+        self.stages: dict[str, dict[str, Any]] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[dict[str, Any]]:
+        entry: dict[str, Any] = {}
+        started = time.monotonic()
+        try:
+            yield entry
+        finally:
+            self.record(name, time.monotonic() - started, **entry)
+
+    def record(self, name: str, seconds: float, **fields: Any) -> None:
+        self.stages[name] = {**fields, "ms": int(seconds * 1000)}
+        observe("vertical_builder_stage_seconds", seconds, stage=name)
+        if fields.get("bytes"):
+            increment("vertical_builder_stage_bytes_total", fields["bytes"], stage=name)
+        if fields.get("files"):
+            increment("vertical_builder_stage_files_total", fields["files"], stage=name)
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...], **extra: str) -> str:
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render_prometheus(gauges: dict[str, float] | None = None) -> str:
+    lines: list[str] = []
+    with _METRICS_LOCK:
+        histograms = {key: list(values) for key, values in _HISTOGRAMS.items()}
+        counters = dict(_COUNTERS)
+
+    seen: set[str] = set()
+    for (metric, labels), values in sorted(histograms.items()):
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f"# HELP {metric} {_HELP.get(metric, metric)}")
+            lines.append(f"# TYPE {metric} histogram")
+        for index, bound in enumerate(STAGE_BUCKETS):
+            lines.append(
+                f"{metric}_bucket{_format_labels(labels, le=str(bound))} "
+                f"{_format_number(values[index])}"
+            )
+        lines.append(
+            f"{metric}_bucket{_format_labels(labels, le='+Inf')} "
+            f"{_format_number(values[-1])}"
+        )
+        lines.append(f"{metric}_sum{_format_labels(labels)} {values[-2]:.6f}")
+        lines.append(f"{metric}_count{_format_labels(labels)} {_format_number(values[-1])}")
+
+    for (metric, labels), value in sorted(counters.items()):
+        if metric not in seen:
+            seen.add(metric)
+            lines.append(f"# HELP {metric} {_HELP.get(metric, metric)}")
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{_format_labels(labels)} {_format_number(value)}")
+
+    for metric, value in sorted((gauges or {}).items()):
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {_format_number(value)}")
+    return "\n".join(lines) + "\n"
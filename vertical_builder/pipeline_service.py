@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from vertical_builder.metrics_service import StageTimer
+
+
+LOGGER = logging.getLogger("vertical_builder")
+PIPELINE_SLOTS = {
+    "fetch": int(os.environ.get("VERTICAL_FETCH_SLOTS", "4")),
+    "render": int(os.environ.get("VERTICAL_RENDER_SLOTS", str(os.cpu_count() or 1))),
+    "deploy": int(os.environ.get("VERTICAL_DEPLOY_SLOTS", "4")),
+}
+
+
+class _Phase:
+    # A bounded pool of slots for one build phase. Build threads move through
+    # the phases in order, so a job downloading, another in Hugo and a third
+    # deploying each hold a slot of a different phase and never compete.
+
+    def __init__(self, slots: int) -> None:
+        self.slots = max(1, slots)
+        self.semaphore = threading.BoundedSemaphore(self.slots)
+        self.busy = 0
+        self.waiting = 0
+
+
+_STATS_LOCK = threading.Lock()
+_PHASES = {name: _Phase(slots) for name, slots in PIPELINE_SLOTS.items()}
+
+
+def pipeline_capacity() -> int:
+    # Builds that can make progress at once when every phase is full.
+    return sum(phase.slots for phase in _PHASES.values())
+
+
+@contextmanager
+def phase_slot(name: str, timer: StageTimer) -> Iterator[None]:
+    phase = _PHASES[name]
+    started = time.monotonic()
+    with _STATS_LOCK:
+        phase.waiting += 1
+    try:
+        phase.semaphore.acquire()
+    finally:
+        with _STATS_LOCK:
+            phase.waiting -= 1
+    with _STATS_LOCK:
+        phase.busy += 1
+    # Queueing time shows up next to the stages, e.g. `renderWait`.
+    timer.record(f"{name}Wait", time.monotonic() - started)
+    try:
+        yield
+    finally:
+        with _STATS_LOCK:
+            phase.busy -= 1
+        phase.semaphore.release()
+
+
+def phase_stats() -> dict[str, dict[str, int]]:
+    with _STATS_LOCK:
+        return {
+            name: {"slots": phase.slots, "busy": phase.busy, "waiting": phase.waiting}
+            for name, phase in _PHASES.items()
+        }
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import logging
+import os
+import signal
+import sys
+import threading
+from pathlib import Path
+from typing import Any
+
+from google.cloud import pubsub_v1
+
+# Allow direct script execution: `python vertical_builder/pull_worker.py`.
+if __package__ is None or __package__ == "":
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from vertical_builder.builder_service import handle_build_job, handle_superseded_job
+from vertical_builder.config import RuntimeConfig, load_runtime_config
+from vertical_builder.message_service import decode_pubsub_data, validate_payload
+from vertical_builder.pipeline_service import pipeline_capacity
+from vertical_builder.scheduler_service import BuildScheduler
+from vertical_builder.workspace_service import start_workspace_sweeper
+
+
+LOGGER = logging.getLogger("vertical_builder")
+PULL_MAX_MESSAGES = int(os.environ.get("VERTICAL_PULL_MAX_MESSAGES", "0"))
+PULL_MAX_BYTES = int(os.environ.get("VERTICAL_PULL_MAX_BYTES", str(10 * 1024 * 1024)))
+PULL_MAX_LEASE_SECONDS = int(os.environ.get("VERTICAL_PULL_MAX_LEASE_SECONDS", "3600"))
+PULL_SHUTDOWN_SECONDS = float(os.environ.get("VERTICAL_PULL_SHUTDOWN_SECONDS", "8"))
+
+
+class PullWorker:
+    # Runs builds from a streaming-pull subscription instead of push requests.
+    # Flow control caps the messages this process holds at the builds its
+    # phase pools can run at once, so the backlog stays in Pub/Sub rather than
+    # in the scheduler queue, and the client library keeps extending ack
+    # deadlines of held messages for up to PULL_MAX_LEASE_SECONDS. A message
+    # that still finds no build free is nacked instead of held. A message is
+    # acked only once its receipt has been written; anything unacked when the
+    # instance goes away is redelivered.
+
+    def __init__(
+        self,
+        runtime: RuntimeConfig,
+        subscription: str,
+        subscriber: Any = None,
+        max_messages: int | None = None,
+    ) -> None:
+        self.runtime = runtime
+        self.subscription = subscription
+        self.max_messages = (
+            max_messages
+            or PULL_MAX_MESSAGES
+            or min(runtime.max_concurrent_builds, pipeline_capacity())
+        )
+        self.scheduler = BuildScheduler(
+            max_workers=runtime.max_concurrent_builds,
+            on_superseded=self._supersede,
+        )
+        self._subscriber = subscriber or pubsub_v1.SubscriberClient()
+        self._lock = threading.Lock()
+        # jobId -> every delivery of it still waiting for an ack
+        self._messages: dict[str, list[Any]] = {}
+        self._future: Any = None
+
+    def flow_control(self) -> pubsub_v1.types.FlowControl:
+        return pubsub_v1.types.FlowControl(
+            max_messages=self.max_messages,
+            max_bytes=PULL_MAX_BYTES,
+            max_lease_duration=PULL_MAX_LEASE_SECONDS,
+        )
+
+    def _settle(self, job_id: str, ack: bool) -> None:
+        with self._lock:
+            messages = self._messages.pop(job_id, [])
+        for message in messages:
+            if ack:
+                message.ack()
+            else:
+                message.nack()
+
+    def handle_message(self, message: Any) -> None:
+        try:
+            payload = decode_pubsub_data(message.data)
+            validate_payload(payload, self.runtime)
+        except Exception as exc:  # pylint: disable=broad-except
+            # Redelivery can never make a malformed message valid.
+            LOGGER.error("Invalid Pub/Sub message id=%s: %s", message.message_id, exc)
+            message.ack()
+            return
+
+        with self._lock:
+            in_flight = payload["jobId"] in self._messages
+            full = not in_flight and not self.scheduler.has_room(payload)
+            if not full:
+                self._messages.setdefault(payload["jobId"], []).append(message)
+        if in_flight:
+            LOGGER.info("Redelivery of in-flight jobId=%s held", payload["jobId"])
+            return
+        if full:
+            # Held, it would only wait in the scheduler queue with its lease
+            # extended; back in Pub/Sub another instance can build it.
+            LOGGER.info("No build free, nacked jobId=%s", payload["jobId"])
+            message.nack()
+            return
+        self.scheduler.submit(payload, self._build)
+        LOGGER.info(
+            "Pulled jobId=%s queueDepth=%d activeBuilds=%d",
+            payload["jobId"],
+            self.scheduler.queue_depth(),
+            len(self.scheduler.active_builds()),
+        )
+
+    def _build(self, payload: dict[str, Any]) -> None:
+        try:
+            handle_build_job(payload, self.runtime)
+        except Exception:  # pylint: disable=broad-except
+            # Only reachable when the receipt itself could not be written.
+            LOGGER.exception("Receipt not written for jobId=%s", payload["jobId"])
+            self._settle(payload["jobId"], ack=False)
+            return
+        self._settle(payload["jobId"], ack=True)
+
+    def _supersede(self, stale: dict[str, Any], latest: dict[str, Any]) -> None:
+        try:
+            handle_superseded_job(stale, latest)
+        except Exception:
+            self._settle(stale["jobId"], ack=False)
+            raise
+        self._settle(stale["jobId"], ack=True)
+
+    def start(self) -> Any:
+        self._future = self._subscriber.subscribe(
+            self.subscription,
+            callback=self.handle_message,
+            flow_control=self.flow_control(),
+        )
+        LOGGER.info(
+            "Pull worker listening subscription=%s maxMessages=%d",
+            self.subscription,
+            self.max_messages,
+        )
+        return self._future
+
+    def stop(self, timeout: float | None = None) -> None:
+        # Keep the stream open while builds drain so their acks still reach
+        # Pub/Sub; whatever has not finished by the deadline is redelivered.
+        drained = self.scheduler.wait_idle(timeout)
+        if self._future is not None:
+            self._future.cancel()
+            try:
+                self._future.result(timeout=timeout)
+            except Exception:  # pylint: disable=broad-except
+                pass
+        self.scheduler.shutdown(wait=False, cancel_pending=not drained)
+        LOGGER.info("Pull worker stopped drained=%s", drained)
+
+
+def _subscription_path(name: str, runtime: RuntimeConfig) -> str:
+    if name.startswith("projects/"):
+        return name
+    project = os.environ.get("GOOGLE_CLOUD_PROJECT", runtime.firebase_project)
+    return pubsub_v1.SubscriberClient.subscription_path(project, name)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    subscription = os.environ.get("VERTICAL_PULL_SUBSCRIPTION")
+    if not subscription:
+        raise RuntimeError("Missing required environment variable VERTICAL_PULL_SUBSCRIPTION")
+    runtime = load_runtime_config()
+    worker = PullWorker(runtime, _subscription_path(subscription, runtime))
+    start_workspace_sweeper()
+    future = worker.start()
+
+    stopping = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_args: stopping.set())
+    while not stopping.wait(1.0):
+        if future.done():
+            LOGGER.error("Streaming pull ended unexpectedly: %s", future.exception())
+            break
+    worker.stop(timeout=PULL_SHUTDOWN_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
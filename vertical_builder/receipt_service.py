@@ -1,9 +1,10 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-from google.cloud import firestore
+if TYPE_CHECKING:
+    from google.cloud import firestore
 
 
 def _receipt_doc_ref(db: firestore.Client, org_id: str, job_id: str):
@@ -15,6 +16,59 @@ def _receipt_doc_ref(db: firestore.Client, org_id: str, job_id: str):
     )
 
 
+def _deploy_target(payload: dict[str, Any]) -> str | None:
+    build_target = payload.get("buildTarget")
+    return build_target.get("site") if isinstance(build_target, dict) else None
+
+
+def _set(
+    writer: firestore.WriteBatch | firestore.Transaction | None,
+    doc_ref: Any,
+    data: dict[str, Any],
+    merge: bool = False,
+) -> None:
+    # With a writer the set is staged into the caller's batch or transaction
+    # and committed together with its other writes.
+    if writer is not None:
+        writer.set(doc_ref, data, merge=merge)
+    else:
+        doc_ref.set(data, merge=merge)
+
+
+def get_receipt(db: firestore.Client, payload: dict[str, Any]) -> dict[str, Any] | None:
+    snapshot = _receipt_doc_ref(db, payload["orgId"], payload["jobId"]).get()
+    return snapshot.to_dict() if snapshot.exists else None
+
+
+def latest_deployed_receipt(
+    db: firestore.Client,
+    org_id: str,
+    vertical_key: str,
+) -> dict[str, Any] | None:
+    # The vertical's most recent real deploy to a Hosting site. No-op
+    # receipts deployed nothing and local builds never reached a site.
+    from google.cloud import firestore
+
+    query = (
+        db.collection("orgs")
+        .document(org_id)
+        .collection("verticalBuildReceipts")
+        .where(filter=firestore.FieldFilter("verticalKey", "==", vertical_key))
+        .where(filter=firestore.FieldFilter("status", "==", "deployed"))
+    )
+    latest: dict[str, Any] | None = None
+    for snapshot in query.stream():
+        data = snapshot.to_dict() or {}
+        if data.get("noop") or data.get("deployTarget") in (None, "local"):
+            continue
+        deployed_at = data.get("deployedAt")
+        if not isinstance(deployed_at, datetime):
+            continue
+        if latest is None or deployed_at > latest["deployedAt"]:
+            latest = data
+    return latest
+
+
 def write_receipt(
     db: firestore.Client,
     payload: dict[str, Any],
@@ -23,15 +77,21 @@ def write_receipt(
     finished_at: datetime,
     deployed_at: datetime | None,
     error: str | None,
+    details: dict[str, Any] | None = None,
+    writer: firestore.WriteBatch | firestore.Transaction | None = None,
 ) -> None:
     duration_ms = int((finished_at - started_at).total_seconds() * 1000)
     doc_ref = _receipt_doc_ref(db, payload["orgId"], payload["jobId"])
-    doc_ref.set(
+    _set(
+        writer,
+        doc_ref,
         {
+            **(details or {}),
             "jobId": payload["jobId"],
             "exportId": payload["exportId"],
             "verticalKey": payload["verticalKey"],
             "templateKey": payload["templateKey"],
+            "deployTarget": _deploy_target(payload),
             "status": status,
             "startedAt": started_at,
             "finishedAt": finished_at,
@@ -39,7 +99,7 @@ def write_receipt(
             "error": error,
             "durationMs": duration_ms,
             "result": status,
-        }
+        },
     )
 
 
@@ -49,14 +109,18 @@ def write_receipt_status(
     status: str,
     started_at: datetime,
     error: str | None = None,
+    writer: firestore.WriteBatch | firestore.Transaction | None = None,
 ) -> None:
     doc_ref = _receipt_doc_ref(db, payload["orgId"], payload["jobId"])
-    doc_ref.set(
+    _set(
+        writer,
+        doc_ref,
         {
             "jobId": payload["jobId"],
             "exportId": payload["exportId"],
             "verticalKey": payload["verticalKey"],
             "templateKey": payload["templateKey"],
+            "deployTarget": _deploy_target(payload),
             "status": status,
             "startedAt": started_at,
             "error": error,
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable
+
+
+LOGGER = logging.getLogger("vertical_builder")
+
+JobKey = tuple[str, str]
+QueuedJob = tuple[Callable[..., Any], tuple[Any, ...]]
+
+
+def job_key(payload: dict[str, Any]) -> JobKey:
+    return payload["orgId"], payload["verticalKey"]
+
+
+def _parse_generated_at(value: Any) -> datetime | None:
+    # Payloads carry ISO 8601 strings ("Z" or "+00:00", any fraction of a
+    # second); a Firestore timestamp arrives as a datetime subclass. Only
+    # timezone-aware values are comparable.
+    if isinstance(value, str):
+        text = value.strip()
+        if text.endswith(("Z", "z")):
+            text = f"{text[:-1]}+00:00"
+        try:
+            value = datetime.fromisoformat(text)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime) or value.utcoffset() is None:
+        return None
+    return value
+
+
+def _is_newer(candidate: dict[str, Any], queued: dict[str, Any]) -> bool:
+    # exportIds may be UUIDs, so only generatedAt is comparable; when either
+    # side lacks a parseable one the later delivery wins.
+    candidate_at = _parse_generated_at(candidate.get("generatedAt"))
+    queued_at = _parse_generated_at(queued.get("generatedAt"))
+    if candidate_at is None or queued_at is None:
+        return True
+    return candidate_at >= queued_at
+
+
+class BuildScheduler:
+    # Runs up to max_workers builds at once while keeping at most one build per
+    # (orgId, verticalKey) in flight. The Firestore lock stays in place as the
+    # cross-instance guard; this only prevents same-instance races and
+    # head-of-line blocking between unrelated orgs.
+    #
+    # Pending jobs are coalesced per key: only the newest export waits behind
+    # the running build, and every job it replaces is handed to on_superseded.
+
+    def __init__(
+        self,
+        max_workers: int,
+        on_superseded: Callable[[dict[str, Any], dict[str, Any]], None] | None = None,
+    ) -> None:
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="vertical-build"
+        )
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._on_superseded = on_superseded
+        self._pending: dict[JobKey, deque[QueuedJob]] = {}
+        self._scheduled: set[JobKey] = set()
+        self._running: dict[JobKey, str] = {}
+
+    def submit(self, payload: dict[str, Any], fn: Callable[..., Any], *args: Any) -> None:
+        key = job_key(payload)
+        superseded: list[dict[str, Any]] = []
+        with self._lock:
+            queue = self._pending.setdefault(key, deque())
+            queued_payloads = [queued_args[0] for _fn, queued_args in queue]
+            if any(queued["jobId"] == payload["jobId"] for queued in queued_payloads):
+                LOGGER.info("Duplicate delivery ignored jobId=%s", payload["jobId"])
+                return
+            if self._on_superseded is not None:
+                if queued_payloads and not _is_newer(payload, queued_payloads[-1]):
+                    superseded.append(payload)
+                    latest = queued_payloads[-1]
+                else:
+                    superseded.extend(queued_payloads)
+                    queue.clear()
+                    queue.append((fn, (payload, *args)))
+                    latest = payload
+            else:
+                queue.append((fn, (payload, *args)))
+            if key not in self._scheduled:
+                self._scheduled.add(key)
+                self._executor.submit(self._run_next, key)
+        # Written on the submitting thread, outside the scheduler lock, so a
+        # burst of superseded receipts never takes build slots.
+        for stale in superseded:
+            LOGGER.info(
+                "Coalesced jobId=%s exportId=%s into jobId=%s exportId=%s",
+                stale["jobId"],
+                stale["exportId"],
+                latest["jobId"],
+                latest["exportId"],
+            )
+            self._notify_superseded(stale, latest)
+
+    def _notify_superseded(self, stale: dict[str, Any], latest: dict[str, Any]) -> None:
+        try:
+            self._on_superseded(stale, latest)
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception("Superseded receipt failed for jobId=%s", stale.get("jobId"))
+
+    def _run_next(self, key: JobKey) -> None:
+        with self._lock:
+            fn, args = self._pending[key].popleft()
+            self._running[key] = args[0].get("jobId", "")
+        try:
+            fn(*args)
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception("Scheduled build crashed for org=%s vertical=%s", *key)
+        finally:
+            with self._lock:
+                self._running.pop(key, None)
+                if self._pending[key]:
+                    # Requeue behind other keys instead of draining this one.
+                    self._executor.submit(self._run_next, key)
+                else:
+                    del self._pending[key]
+                    self._scheduled.discard(key)
+                    if not self._scheduled:
+                        self._idle.notify_all()
+
+    def has_room(self, payload: dict[str, Any]) -> bool:
+        # A job whose key is already scheduled only waits behind that key and
+        # is coalesced there; any other job needs one of max_workers free.
+        with self._lock:
+            return job_key(payload) in self._scheduled or len(self._scheduled) < self.max_workers
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return sum(len(queue) for queue in self._pending.values())
+
+    def active_builds(self) -> dict[JobKey, str]:
+        with self._lock:
+            return dict(self._running)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "maxWorkers": self.max_workers,
+                "queueDepth": sum(len(queue) for queue in self._pending.values()),
+                "activeBuilds": [
+                    {"orgId": org_id, "verticalKey": vertical_key, "jobId": job_id}
+                    for (org_id, vertical_key), job_id in self._running.items()
+                ],
+            }
+
+    def wait_idle(self, timeout: float | None = None) -> bool:
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._scheduled, timeout=timeout)
+
+    def shutdown(self, wait: bool = True, cancel_pending: bool = False) -> None:
+        if wait:
+            self.wait_idle()
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_pending)
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+from typing import Any
+
+from vertical_builder.bucket_service import (
+    SNAPSHOT_DIRS,
+    hash_snapshot_tree,
+    materialize_tree,
+)
+
+LOGGER = logging.getLogger("vertical_builder")
+SNAPSHOT_CACHE_ROOT = Path(
+    os.environ.get(
+        "VERTICAL_SNAPSHOT_CACHE_ROOT",
+        str(Path(__file__).resolve().parent / "snapshot_cache"),
+    )
+)
+SNAPSHOT_CACHE_MAX_BYTES = int(
+    os.environ.get("VERTICAL_SNAPSHOT_CACHE_MAX_BYTES", str(2 * 1024**3))
+)
+SNAPSHOT_BASELINE_ROOT = Path(
+    os.environ.get(
+        "VERTICAL_SNAPSHOT_BASELINE_ROOT",
+        str(Path(__file__).resolve().parent / "snapshot_baselines"),
+    )
+)
+DELTA_SYNC_ENABLED = os.environ.get("VERTICAL_DELTA_SYNC", "1") == "1"
+_ENTRY_META = ".entry.json"
+_ENTRY_INVENTORY = ".inventory.json"
+
+_CACHE_LOCK = threading.Lock()
+_IN_USE: dict[str, int] = {}
+
+
+def snapshot_cache_enabled() -> bool:
+    return SNAPSHOT_CACHE_MAX_BYTES > 0
+
+
+def snapshot_cache_key(manifest: dict[str, Any]) -> str:
+    identity = "/".join(
+        str(manifest[field])
+        for field in ("orgId", "verticalKey", "contentHash", "assetHash")
+    )
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key: str) -> Path:
+    return SNAPSHOT_CACHE_ROOT / key
+
+
+def _tree_size(root: Path) -> int:
+    return sum(p.stat().st_size for p in root.rglob("*") if p.is_file())
+
+
+def _entry_size(entry: Path) -> int:
+    try:
+        meta = json.loads((entry / _ENTRY_META).read_text(encoding="utf-8"))
+        return int(meta["bytes"])
+    except (OSError, ValueError, KeyError):
+        return _tree_size(entry)
+
+
+def _acquire_entry(key: str) -> None:
+    with _CACHE_LOCK:
+        _IN_USE[key] = _IN_USE.get(key, 0) + 1
+
+
+def _release_entry(key: str) -> None:
+    with _CACHE_LOCK:
+        remaining = _IN_USE.get(key, 0) - 1
+        if remaining > 0:
+            _IN_USE[key] = remaining
+        else:
+            _IN_USE.pop(key, None)
+
+
+def restore_snapshot(key: str, snapshot_root: Path) -> dict[str, Any] | None:
+    if not snapshot_cache_enabled():
+        return None
+    entry = _entry_path(key)
+    _acquire_entry(key)
+    try:
+        if not (entry / _ENTRY_META).exists():
+            return None
+        for top in SNAPSHOT_DIRS:
+            src = entry / top
+            if src.exists():
+                materialize_tree(src, snapshot_root / top)
+        try:
+            inventory = json.loads(
+                (entry / _ENTRY_INVENTORY).read_text(encoding="utf-8")
+            )
+        except (OSError, ValueError):
+            # Entries stored before inventories were kept are hashed once here.
+            inventory = hash_snapshot_tree(snapshot_root)
+        os.utime(entry)
+    finally:
+        _release_entry(key)
+    LOGGER.info("Snapshot cache hit key=%s", key)
+    return inventory
+
+
+def store_snapshot(key: str, snapshot_root: Path, inventory: dict[str, Any]) -> None:
+    if not snapshot_cache_enabled():
+        return
+    entry = _entry_path(key)
+    if entry.exists():
+        return
+    SNAPSHOT_CACHE_ROOT.mkdir(parents=True, exist_ok=True)
+    # Stage under a unique name and rename into place so readers never see a
+    # half-written entry and concurrent writers leave exactly one copy.
+    staging = SNAPSHOT_CACHE_ROOT / f".tmp-{key}-{uuid.uuid4().hex}"
+    try:
+        for top in SNAPSHOT_DIRS:
+            src = snapshot_root / top
+            if src.exists():
+                materialize_tree(src, staging / top)
+        size = sum(entry_info["size"] for entry_info in inventory.values())
+        (staging / _ENTRY_INVENTORY).write_text(json.dumps(inventory), encoding="utf-8")
+        (staging / _ENTRY_META).write_text(
+            json.dumps({"key": key, "bytes": size}), encoding="utf-8"
+        )
+        try:
+            staging.rename(entry)
+        except OSError:
+            # Another job populated the same key first; keep its copy.
+            return
+        LOGGER.info("Snapshot cache stored key=%s bytes=%d", key, size)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    evict_snapshot_cache()
+
+
+def evict_snapshot_cache(max_bytes: int | None = None) -> None:
+    budget = SNAPSHOT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not SNAPSHOT_CACHE_ROOT.exists():
+        return
+    entries = [
+        p
+        for p in SNAPSHOT_CACHE_ROOT.iterdir()
+        if p.is_dir() and not p.name.startswith(".")
+    ]
+    sizes = {entry: _entry_size(entry) for entry in entries}
+    total = sum(sizes.values())
+    for entry in sorted(entries, key=lambda p: p.stat().st_mtime):
+        if total <= budget:
+            break
+        with _CACHE_LOCK:
+            if _IN_USE.get(entry.name):
+                continue
+            trash = SNAPSHOT_CACHE_ROOT / f".evict-{entry.name}-{uuid.uuid4().hex}"
+            try:
+                entry.rename(trash)
+            except OSError:
+                continue
+        shutil.rmtree(trash, ignore_errors=True)
+        total -= sizes[entry]
+        LOGGER.info("Snapshot cache evicted key=%s bytes=%d", entry.name, sizes[entry])
+
+
+def _baseline_path(org_id: str, vertical_key: str) -> Path:
+    return SNAPSHOT_BASELINE_ROOT / org_id / vertical_key
+
+
+def load_snapshot_baseline(
+    org_id: str,
+    vertical_key: str,
+) -> tuple[dict[str, Any], Path] | None:
+    if not DELTA_SYNC_ENABLED:
+        return None
+    baseline = _baseline_path(org_id, vertical_key)
+    try:
+        index = json.loads((baseline / "index.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(index, dict):
+        return None
+    return index, baseline / "snapshot"
+
+
+def save_snapshot_baseline(
+    org_id: str,
+    vertical_key: str,
+    snapshot_root: Path,
+    index: dict[str, Any],
+) -> None:
+    if not DELTA_SYNC_ENABLED:
+        return
+    baseline = _baseline_path(org_id, vertical_key)
+    baseline.parent.mkdir(parents=True, exist_ok=True)
+    staging = baseline.parent / f".tmp-{vertical_key}-{uuid.uuid4().hex}"
+    trash = baseline.parent / f".old-{vertical_key}-{uuid.uuid4().hex}"
+    try:
+        for rel in index:
+            src = snapshot_root / rel
+            dst = staging / "snapshot" / rel
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+        (staging / "index.json").write_text(json.dumps(index), encoding="utf-8")
+        if baseline.exists():
+            baseline.rename(trash)
+        staging.rename(baseline)
+        LOGGER.info(
+            "Snapshot baseline saved org=%s vertical=%s files=%d",
+            org_id,
+            vertical_key,
+            len(index),
+        )
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        shutil.rmtree(trash, ignore_errors=True)
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+
+LOGGER = logging.getLogger("vertical_builder")
+WORKSPACE_ROOT = Path(
+    os.environ.get(
+        "VERTICAL_WORKSPACE_ROOT",
+        str(Path(__file__).resolve().parent / "workspaces"),
+    )
+)
+LOCAL_OUTPUT_ROOT = Path(
+    os.environ.get(
+        "VERTICAL_LOCAL_OUTPUT_ROOT",
+        str(Path(__file__).resolve().parent / "local_output"),
+    )
+)
+WORKSPACE_KEEP_PER_VERTICAL = int(os.environ.get("VERTICAL_WORKSPACE_KEEP_PER_VERTICAL", "1"))
+WORKSPACE_MAX_BYTES = int(os.environ.get("VERTICAL_WORKSPACE_MAX_BYTES", str(5 * 1024**3)))
+WORKSPACE_SWEEP_SECONDS = float(os.environ.get("VERTICAL_WORKSPACE_SWEEP_SECONDS", "300"))
+_RUN_META = "run.json"
+
+_RUNS_LOCK = threading.Lock()
+# jobIds whose run directory or local output is being written right now
+_IN_USE: set[str] = set()
+_SWEEPER: threading.Thread | None = None
+
+
+def prepare_run_dirs(payload: dict[str, Any]) -> tuple[Path, Path, Path]:
+    with _RUNS_LOCK:
+        _IN_USE.add(payload["jobId"])
+    run_root = WORKSPACE_ROOT / payload["jobId"]
+    snapshot_root = run_root / "snapshot"
+    workspace = run_root / "workspace"
+    shutil.rmtree(run_root, ignore_errors=True)
+    snapshot_root.mkdir(parents=True, exist_ok=True)
+    workspace.mkdir(parents=True, exist_ok=True)
+    (run_root / _RUN_META).write_text(
+        json.dumps(
+            {
+                "jobId": payload["jobId"],
+                "orgId": payload["orgId"],
+                "verticalKey": payload["verticalKey"],
+            }
+        ),
+        encoding="utf-8",
+    )
+    return run_root, snapshot_root, workspace
+
+
+def local_output_dir(payload: dict[str, Any]) -> Path:
+    return LOCAL_OUTPUT_ROOT / payload["jobId"]
+
+
+def _read_run_meta(run_root: Path) -> dict[str, Any] | None:
+    try:
+        meta = json.loads((run_root / _RUN_META).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    return meta if isinstance(meta, dict) else None
+
+
+def _remove(path: Path) -> None:
+    # Rename first so a half-deleted tree never looks like a live run.
+    trash = path.with_name(f".trash-{path.name}-{time.monotonic_ns()}")
+    try:
+        path.rename(trash)
+    except OSError:
+        return
+    shutil.rmtree(trash, ignore_errors=True)
+
+
+def release_run_dirs(payload: dict[str, Any]) -> None:
+    # Called once the receipt is written. The finished run stays only if it is
+    # among the newest WORKSPACE_KEEP_PER_VERTICAL of its org/vertical.
+    job_id = payload["jobId"]
+    with _RUNS_LOCK:
+        _IN_USE.discard(job_id)
+    run_root = WORKSPACE_ROOT / job_id
+    if run_root.exists():
+        os.utime(run_root)
+    if not WORKSPACE_ROOT.exists():
+        return
+
+    finished: list[tuple[float, Path]] = []
+    for candidate in WORKSPACE_ROOT.iterdir():
+        if candidate.name.startswith("."):
+            continue
+        meta = _read_run_meta(candidate)
+        if (
+            meta is None
+            or meta.get("orgId") != payload["orgId"]
+            or meta.get("verticalKey") != payload["verticalKey"]
+        ):
+            continue
+        finished.append((candidate.stat().st_mtime, candidate))
+    finished.sort(reverse=True)
+    for _mtime, candidate in finished[max(0, WORKSPACE_KEEP_PER_VERTICAL) :]:
+        with _RUNS_LOCK:
+            if candidate.name in _IN_USE:
+                continue
+        _remove(candidate)
+        LOGGER.info("Workspace removed jobId=%s", candidate.name)
+
+
+def _tree_size(root: Path) -> int:
+    total = 0
+    for dirpath, _dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def sweep_workspaces(max_bytes: int | None = None) -> dict[str, int]:
+    budget = WORKSPACE_MAX_BYTES if max_bytes is None else max_bytes
+    entries: list[Path] = []
+    for root in (WORKSPACE_ROOT, LOCAL_OUTPUT_ROOT):
+        if not root.exists():
+            continue
+        for entry in root.iterdir():
+            if entry.name.startswith(".trash-"):
+                # Left behind by a crash between rename and delete.
+                shutil.rmtree(entry, ignore_errors=True)
+            elif entry.is_dir():
+                entries.append(entry)
+    sizes = {entry: _tree_size(entry) for entry in entries}
+    total = sum(sizes.values())
+    removed = 0
+    freed = 0
+    for entry in sorted(entries, key=lambda path: path.stat().st_mtime):
+        if total <= budget:
+            break
+        with _RUNS_LOCK:
+            if entry.name in _IN_USE:
+                continue
+        _remove(entry)
+        total -= sizes[entry]
+        removed += 1
+        freed += sizes[entry]
+        LOGGER.info("Workspace evicted path=%s bytes=%d", entry, sizes[entry])
+    return {"bytes": total, "removed": removed, "freed": freed}
+
+
+def _sweep_forever() -> None:
+    while True:
+        time.sleep(WORKSPACE_SWEEP_SECONDS)
+        try:
+            sweep_workspaces()
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception("Workspace sweep failed")
+
+
+def start_workspace_sweeper() -> None:
+    global _SWEEPER  # pylint: disable=global-statement
+    if WORKSPACE_SWEEP_SECONDS <= 0:
+        return
+    with _RUNS_LOCK:
+        if _SWEEPER is not None:
+            return
+        _SWEEPER = threading.Thread(
+            target=_sweep_forever, name="workspace-sweeper", daemon=True
+        )
+        _SWEEPER.start()